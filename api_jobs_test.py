@@ -0,0 +1,117 @@
+import unittest
+from flowy import api_jobs
+from standin_server import StandinServer
+
+API_PATH = "/api/open/v0/flowy"
+HEADERS = {"Authorization": "Bearer test"}
+
+
+class TestApiJobs(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.api_url = f"{self.server.url}{API_PATH}"
+        self.sleeps = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def run_job(self, **options):
+        return api_jobs.run_job(
+            self.api_url,
+            HEADERS,
+            {"model_type": "kling", "prompt": "a cat"},
+            initial_interval=0.01,
+            max_interval=0.04,
+            backoff=2,
+            timeout=30,
+            sleep=self.sleeps.append,
+            **options,
+        )
+
+    def test_poll_until_done(self):
+        # Arrange
+        self.server.state.poll_script = ["pending", "pending", "pending"]
+
+        # Act
+        result = self.run_job()
+
+        # Assert
+        self.assertTrue(result["data"]["output"][0].endswith("/files/video.mp4"))
+        self.assertEqual(self.server.state.polls, 4)
+        self.assertEqual(len(self.server.state.submits), 1)
+        self.assertTrue(self.server.state.submits[0]["payload"]["async"])
+        # The interval grows with each pending poll and is capped
+        self.assertEqual(self.sleeps, [0.01, 0.02, 0.04])
+
+    def test_on_submitted_is_called_before_polling(self):
+        # Arrange
+        self.server.state.poll_script = ["pending"]
+        polls_when_submitted = []
+
+        # Act
+        self.run_job(on_submitted=lambda: polls_when_submitted.append(self.server.state.polls))
+
+        # Assert
+        self.assertEqual(polls_when_submitted, [0])
+        self.assertEqual(self.server.state.polls, 2)
+
+    def test_retry_after_is_honoured(self):
+        # Arrange
+        self.server.state.poll_script = [("status", 429, 7), "pending"]
+
+        # Act
+        self.run_job()
+
+        # Assert
+        self.assertEqual(self.sleeps[0], 7)
+        self.assertEqual(len(self.server.state.submits), 1)
+
+    def test_network_errors_resume_polling_without_resubmitting(self):
+        # Arrange
+        self.server.state.poll_script = ["pending", "drop", ("status", 503, 0), "drop"]
+
+        # Act
+        result = self.run_job()
+
+        # Assert
+        self.assertIn("output", result["data"])
+        self.assertEqual(self.server.state.polls, 5)
+        self.assertEqual(len(self.server.state.submits), 1)
+
+    def test_failed_job_raises(self):
+        # Arrange
+        self.server.state.poll_script = ["pending", "fail"]
+
+        # Act / Assert
+        with self.assertRaises(api_jobs.JobFailedError):
+            self.run_job()
+        self.assertEqual(len(self.server.state.submits), 1)
+
+    def test_timeout(self):
+        # Arrange
+        self.server.state.poll_script = ["pending"] * 100
+
+        # Act / Assert
+        with self.assertRaises(TimeoutError):
+            api_jobs.run_job(
+                self.api_url,
+                HEADERS,
+                {"model_type": "luma"},
+                initial_interval=0.01,
+                timeout=0.05,
+            )
+
+    def test_synchronous_server_answer(self):
+        # Arrange
+        self.server.state.async_jobs = False
+
+        # Act
+        result = self.run_job()
+
+        # Assert
+        self.assertIn("output", result["data"])
+        self.assertEqual(self.server.state.polls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from flowy import api_key_manager, retry_policy
+from flowy.api_key_manager import ApiKeyPool
+from flowy.retry_policy import RetryPolicy
+from standin_server import StandinServer
+
+API_PATH = "/api/open/v0/flowy"
+
+
+class TestApiKeyPool(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "api_key.json")
+        self.patch = mock.patch.object(api_key_manager, "API_KEY_FILE", self.path)
+        self.patch.start()
+        self.write({"api_keys": ["key-a", "key-b", "key-c"]})
+        self.now = 0.0
+        self.pool = ApiKeyPool(clock=lambda: self.now)
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def write(self, data, mtime=None):
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_key_file_is_parsed_once_until_it_changes(self):
+        # Arrange
+        with mock.patch.object(api_key_manager.json, "load", wraps=json.load) as load:
+            # Act
+            keys = [api_key_manager.load_api_key() for _ in range(50)]
+            self.write({"api_key": "key-z", "api_keys": ["key-a"]}, mtime=os.stat(self.path).st_mtime + 10)
+            changed = api_key_manager.load_api_keys()
+
+        # Assert
+        self.assertEqual(keys, ["key-a"] * 50)
+        self.assertEqual(changed, ["key-z", "key-a"])
+        self.assertEqual(load.call_count, 2)
+
+    def test_saving_a_key_keeps_the_pool(self):
+        # Act
+        api_key_manager.save_api_key("key-z")
+
+        # Assert
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {"api_key": "key-z", "api_keys": ["key-a", "key-b", "key-c"]})
+        self.assertEqual(api_key_manager.load_api_keys(), ["key-z", "key-a", "key-b", "key-c"])
+
+    def test_leases_go_to_the_least_busy_key(self):
+        # Act
+        first = [self.pool.acquire() for _ in range(3)]
+        self.pool.release("key-b")
+        fourth = self.pool.acquire()
+        self.pool.release("key-a")
+        self.pool.release("key-c")
+        fifth = self.pool.acquire()
+
+        # Assert
+        self.assertEqual(first, ["key-a", "key-b", "key-c"])
+        self.assertEqual(fourth, "key-b")
+        self.assertEqual(fifth, "key-a")
+
+    def test_rate_limited_key_cools_down(self):
+        # Arrange
+        server = StandinServer().start()
+        self.addCleanup(server.stop)
+        server.state.post_script = [("status", 429, "20")]
+
+        # Act
+        with self.pool.lease() as lease:
+            response = retry_policy.send(
+                "POST",
+                f"{server.url}{API_PATH}",
+                policy=RetryPolicy(max_attempts=1),
+                json={"model_type": "flux"},
+                hooks=lease.hooks,
+            )
+        during = [self.pool.acquire() for _ in range(4)]
+        for key in during:
+            self.pool.release(key)
+        self.now = 21
+        after = self.pool.acquire()
+
+        # Assert
+        self.assertEqual(lease.key, "key-a")
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn("key-a", during)
+        self.assertEqual(after, "key-a")
+
+    def test_retry_after_429_uses_a_new_lease(self):
+        # Arrange
+        server = StandinServer().start()
+        self.addCleanup(server.stop)
+        server.state.post_script = [("status", 429, "0")]
+        seen = []
+
+        # Act
+        with self.pool.lease() as lease:
+            response = retry_policy.send(
+                "POST",
+                f"{server.url}{API_PATH}",
+                policy=RetryPolicy(max_attempts=2),
+                headers={"Authorization": f"Bearer {lease.key}"},
+                json={"model_type": "flux"},
+                hooks={"response": [lease.hooks["response"], lambda r, *a, **k: seen.append(r.request.headers["Authorization"])]},
+                before_retry=lease.retry_hook,
+                sleep=lambda seconds: None,
+            )
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen, ["Bearer key-a", "Bearer key-b"])
+        self.assertEqual(lease.key, "key-b")
+        self.assertEqual(self.pool.stats()["...ey-a"]["in_flight"], 0)
+        self.assertEqual(self.pool.stats()["...ey-b"]["in_flight"], 0)
+
+    def test_all_keys_cooling_down_uses_the_first_to_recover(self):
+        # Arrange
+        self.pool.cooldown("key-a", 30)
+        self.pool.cooldown("key-b", 10)
+        self.pool.cooldown("key-c", 20)
+
+        # Act / Assert
+        self.assertEqual(self.pool.acquire(), "key-b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import io
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import torch
+from PIL import Image
+from benchmarks.e2e_bench import install_comfy_stubs
+
+# flowy.api_nodes imports folder_paths, use the benchmark's stand-in when ComfyUI is not installed
+install_comfy_stubs(tempfile.mkdtemp(prefix="flowy_test_"))
+
+from flowy.api_nodes import base  # noqa: E402
+from flowy.api_nodes.base import FlowyApiNode  # noqa: E402
+
+
+def make_png(value):
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (value, value, value)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StandinBatchNode(FlowyApiNode):
+    """Batch node whose jobs run locally: job i sleeps delays[i] and outputs a gray level of 10 * i."""
+
+    BATCH_INPUT = "image"
+    RETURN_TYPES = ("IMAGE",)
+
+    def __init__(self, delays, fail_at=None):
+        self.delays = delays
+        self.fail_at = fail_at
+        self.lock = threading.Lock()
+        self.started = []
+        self.in_flight = 0
+        self.peak = 0
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"image": ("IMAGE",)}}
+
+    def get_model_type(self):
+        return "batch-test"
+
+    def prepare_payload(self, **kwargs):
+        return {}
+
+    def request_job(self, **kwargs):
+        index = round(kwargs["image"][0, 0, 0, 0].item() * 10)
+        with self.lock:
+            self.started.append(index)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delays[index])
+            if index == self.fail_at:
+                raise RuntimeError(f"job {index} failed")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        return {"sources": [f"job-{index}"], "cached": False, "cache_key": None}
+
+    def download_output_bytes(self, output_url):
+        return make_png(10 * int(output_url.rsplit("-", 1)[1]))
+
+
+class StandinVideoBatchNode(StandinBatchNode):
+    RETURN_TYPES = ("VIDEO",)
+
+    def parse_video_output(self, output_url):
+        return f"{output_url}.mp4"
+
+
+def frames(count):
+    """A batch whose frame i is filled with i / 10, the job index request_job reads back."""
+    return torch.arange(count, dtype=torch.float32).div(10).view(count, 1, 1, 1).expand(count, 8, 8, 3).clone()
+
+
+class TestBatchGeneration(unittest.TestCase):
+    def setUp(self):
+        self.settings = {"batch_concurrency": 4}
+        self.patch = mock.patch.object(
+            base, "get_setting", side_effect=lambda key, default=None: self.settings.get(key, default)
+        )
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_out_of_order_jobs_are_merged_in_input_order(self):
+        # Arrange
+        node = StandinBatchNode(delays=[0.15, 0.1, 0.05, 0])
+
+        # Act
+        (images,) = node.generate(image=frames(4))
+
+        # Assert
+        self.assertEqual(tuple(images.shape), (4, 8, 8, 3))
+        levels = [round(images[index, 0, 0, 0].item() * 255) for index in range(4)]
+        self.assertEqual(levels, [0, 10, 20, 30])
+
+    def test_videos_of_a_batch_are_one_list_in_input_order(self):
+        # Arrange
+        node = StandinVideoBatchNode(delays=[0.15, 0.1, 0.05, 0])
+
+        # Act
+        result = node.generate(image=frames(4))
+
+        # Assert
+        self.assertEqual(result, (["job-0.mp4", "job-1.mp4", "job-2.mp4", "job-3.mp4"],))
+
+    def test_batch_concurrency_caps_the_jobs_in_flight(self):
+        # Arrange
+        self.settings["batch_concurrency"] = 2
+        node = StandinBatchNode(delays=[0.05] * 6)
+
+        # Act
+        (images,) = node.generate(image=frames(6))
+
+        # Assert
+        self.assertEqual(images.shape[0], 6)
+        self.assertEqual(node.peak, 2)
+        self.assertEqual(sorted(node.started), list(range(6)))
+
+    def test_failed_job_cancels_the_jobs_not_started(self):
+        # Arrange
+        self.settings["batch_concurrency"] = 2
+        node = StandinBatchNode(delays=[0.02] + [0.2] * 7, fail_at=0)
+
+        # Act
+        with self.assertRaisesRegex(RuntimeError, "job 0 failed"):
+            node.run_batch_generation(8, image=frames(8))
+
+        # Assert
+        # Job 1 was running, the freed worker may pick up job 2 before the rest is cancelled
+        self.assertLessEqual(set(node.started), {0, 1, 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,432 @@
+"""
+Offline end-to-end benchmark of every node in NODE_CLASS_MAPPINGS.
+
+Starts the local stand-in Comflowy API (standin_server.py), points the nodes at it
+through the run context config and calls each node's FUNCTION with synthesized
+inputs. ComfyUI is not needed, folder_paths, nodes and comfy.sd are replaced by
+minimal stand-ins when they can't be imported. The stand-in CLIP encodes to zeros,
+which is enough to time the Omost conditioning nodes.
+
+Each node runs in its own process by default so that the peak RSS is per node.
+Nodes with inputs that can't be synthesized (CONDITIONING, ...) are skipped,
+generation failures are detected through the errors_total metric.
+
+Usage:
+    python -m benchmarks.e2e_bench [--nodes flux,kling] [--repeat 5] [--concurrency 1]
+        [--image-size 512] [--result-cache] [--in-process] [--json results.json]
+        [--settings '{"rate_limits": {"default": {"max_in_flight": 2}}}']
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OMOST_CANVAS_CODE = """canvas = Canvas()
+canvas.set_global_description(
+    description='A cat sitting on a windowsill.',
+    detailed_descriptions=['Warm light fills the room.'],
+    tags='cat, window',
+    HTML_web_color_name='orange',
+)
+canvas.add_local_description(
+    location='in the center',
+    offset='no offset',
+    area='a medium-sized square area',
+    distance_to_viewer=2.0,
+    description='A ginger cat.',
+    detailed_descriptions=['The cat looks outside.'],
+    tags='cat',
+    atmosphere='calm',
+    style='photograph',
+    quality_meta='high quality',
+    HTML_web_color_name='darkorange',
+)
+"""
+
+# Inputs that need a specific value to exercise the node, by node name and input name.
+# "{api}" is replaced by the stand-in URL.
+INPUT_OVERRIDES = {
+    "Comflowy_Http_Request": {"url": "{api}/api/open/v0/flowy", "method": "POST", "body_json": '{"prompt": "a cat"}'},
+    "Comflowy_Load_JSON": {"json_str": '{"a": {"b": [1, 2, 3]}}'},
+    "Comflowy_Extract_JSON": {"json_path1": "a.b.0"},
+    "Comflowy_Set_API_Key": {"api_key": "benchmark"},
+    "Comflowy_Omost_Load_Canvas_Conditioning": {"omost_canvas_json": "[]"},
+    "Comflowy_Omost_Load_Canvas_Python_Code": {"python_str": OMOST_CANVAS_CODE},
+    "Comflowy_Video_To_Images": {"video_uri": "{api}/files/video.mp4"},
+    "Comflowy_LLM_Batch": {"prompts": "\n".join(f"a photo of a cat, variant {index}" for index in range(8))},
+}
+
+DEFAULT_TEXT = "a photo of a cat sitting on a windowsill"
+
+# Text models answer with a list of tokens, like Replicate's LLMs
+FIXTURE_TOKENS = ["A", " cat", " sitting", " on", " a", " windowsill", "."]
+
+FIXTURE_BY_RETURN_TYPE = {
+    "IMAGE": ["/files/image.png"],
+    "AUDIO": ["/files/audio.wav"],
+    "VIDEO": ["/files/video.mp4"],
+    "VIDEO_URI": ["/files/video.mp4"],
+    "STRING": FIXTURE_TOKENS,
+}
+
+
+# Token ids and embedding size of the placeholder CLIP, the ones of SD1.5's CLIP-L
+CLIP_START_TOKEN = 49406
+CLIP_END_TOKEN = 49407
+CLIP_EMBEDDING_SIZE = 768
+
+# Input types synthesized from the placeholder classes, only set when ComfyUI's own are not importable
+PLACEHOLDER_INPUTS = {}
+
+
+def install_comfy_stubs(output_dir):
+    """Register minimal folder_paths, nodes and comfy.sd modules when ComfyUI is not importable."""
+    try:
+        import folder_paths  # noqa: F401
+    except ImportError:
+        folder_paths = types.ModuleType("folder_paths")
+        folder_paths.get_output_directory = lambda: output_dir
+        folder_paths.get_temp_directory = lambda: output_dir
+        folder_paths.get_input_directory = lambda: output_dir
+        sys.modules["folder_paths"] = folder_paths
+
+    try:
+        import comfy.sd  # noqa: F401
+    except ImportError:
+        comfy = types.ModuleType("comfy")
+        comfy_sd = types.ModuleType("comfy.sd")
+
+        class CLIP:
+            """Placeholder text encoder: one token per word, zero embeddings."""
+
+            def tokenize(self, text):
+                words = [(1000 + len(word), 1.0) for word in text.split()][:75]
+                tokens = [(CLIP_START_TOKEN, 1.0)] + words + [(CLIP_END_TOKEN, 1.0)] * (77 - len(words) - 1)
+                return {"l": [tokens]}
+
+            def encode_from_tokens(self, tokens, return_pooled=False):
+                cond = torch.zeros((1, 77 * len(tokens["l"]), CLIP_EMBEDDING_SIZE))
+                pooled = torch.zeros((1, CLIP_EMBEDDING_SIZE))
+                return (cond, pooled) if return_pooled else cond
+
+        comfy_sd.CLIP = CLIP
+        comfy.sd = comfy_sd
+        sys.modules["comfy"] = comfy
+        sys.modules["comfy.sd"] = comfy_sd
+        PLACEHOLDER_INPUTS["CLIP"] = CLIP
+
+    try:
+        import nodes  # noqa: F401
+    except ImportError:
+        comfy_nodes = types.ModuleType("nodes")
+
+        # Same conditioning format as ComfyUI's nodes, computed from the CLIP in use
+        class CLIPTextEncode:
+            def encode(self, clip, text):
+                cond, pooled = clip.encode_from_tokens(clip.tokenize(text), return_pooled=True)
+                return ([[cond, {"pooled_output": pooled}]],)
+
+        class ConditioningSetMask:
+            def append(self, conditioning, mask, set_cond_area, strength):
+                if len(mask.shape) < 3:
+                    mask = mask.unsqueeze(0)
+                options = {"mask": mask, "set_area_to_bounds": set_cond_area != "default", "mask_strength": strength}
+                return ([[cond, {**extra, **options}] for cond, extra in conditioning],)
+
+        comfy_nodes.CLIPTextEncode = CLIPTextEncode
+        comfy_nodes.ConditioningSetMask = ConditioningSetMask
+        sys.modules["nodes"] = comfy_nodes
+
+
+def install_run_context(api_url, settings):
+    """Point the nodes at the stand-in through the run context config read by types._read_config."""
+    context = types.ModuleType("flowy_execute_thread_context")
+    options = {
+        "custom_node_api_config": {"domain": api_url, "modal_cloud_web_url": api_url, "settings": settings}
+    }
+    context.get_run_context = lambda key: options if key == "options" else None
+    sys.modules["flowy_execute_thread_context"] = context
+
+
+def load_node_class_mappings(api_url, output_dir, settings):
+    install_comfy_stubs(output_dir)
+    install_run_context(api_url, settings)
+    sys.path.insert(0, ROOT)
+
+    from flowy import api_key_manager
+
+    # Never touch the user's key file
+    api_key_manager.API_KEY_FILE = os.path.join(output_dir, "api_key.json")
+    api_key_manager.save_api_key("benchmark")
+
+    from flowy.nodes import NODE_CLASS_MAPPINGS
+
+    return NODE_CLASS_MAPPINGS
+
+
+def synthesize_input(name, spec, image_size):
+    """Return a value for one input, or raise TypeError when the input type can't be synthesized."""
+    input_type = spec[0]
+    config = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+
+    if isinstance(input_type, (list, tuple)):
+        return config.get("default", input_type[0] if input_type else "")
+    if input_type == "IMAGE":
+        return torch.rand(1, image_size, image_size, 3)
+    if input_type == "AUDIO":
+        return {"waveform": torch.rand(1, 1, 44100) * 0.2 - 0.1, "sample_rate": 44100}
+    if input_type == "JSON":
+        return {"a": {"b": [1, 2, 3]}}
+    if input_type in ("INT", "FLOAT"):
+        value = config.get("default", config.get("min", 0))
+        if "min" in config:
+            value = max(value, config["min"])
+        if "max" in config:
+            value = min(value, config["max"])
+        return int(value) if input_type == "INT" else float(value)
+    if input_type == "BOOLEAN":
+        return config.get("default", False)
+    if input_type == "STRING":
+        return config.get("default") or DEFAULT_TEXT
+    if input_type in PLACEHOLDER_INPUTS:
+        return PLACEHOLDER_INPUTS[input_type]()
+    if input_type == "OMOST_CANVAS_CONDITIONING":
+        from flowy.lib_omost.canvas import Canvas
+
+        return Canvas.from_python_code(OMOST_CANVAS_CODE).process()
+    raise TypeError(f"input '{name}' needs {input_type}")
+
+
+def build_inputs(node_name, node_class, image_size, api_url):
+    input_types = node_class.INPUT_TYPES()
+    overrides = {
+        key: value.replace("{api}", api_url) if isinstance(value, str) else value
+        for key, value in INPUT_OVERRIDES.get(node_name, {}).items()
+    }
+    inputs = {}
+    for name, spec in input_types.get("required", {}).items():
+        inputs[name] = overrides[name] if name in overrides else synthesize_input(name, spec, image_size)
+    for name, spec in input_types.get("optional", {}).items():
+        config = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+        # Optional inputs are only passed when they have a default, like an unconnected widget
+        if name in overrides:
+            inputs[name] = overrides[name]
+        elif "default" in config:
+            inputs[name] = config["default"]
+    return inputs
+
+
+def configure_outputs(state, node_classes):
+    """Answer every Replicate model with a fixture matching its first return type."""
+    for node_class in node_classes:
+        model = getattr(node_class, "REPLICATE_MODEL", None)
+        if model is None:
+            continue
+        return_type = node_class.RETURN_TYPES[0] if node_class.RETURN_TYPES else "STRING"
+        state.outputs[model] = list(FIXTURE_BY_RETURN_TYPE.get(return_type, FIXTURE_BY_RETURN_TYPE["STRING"]))
+
+
+def check_output(node_class, output):
+    """Reason a Replicate text node turned its token list into the wrong outputs, None when they look right."""
+    if getattr(node_class, "REPLICATE_MODEL", None) is None or node_class.RETURN_TYPES != ("STRING",):
+        return None
+    if isinstance(output, dict):
+        output = output.get("result")
+    if output != ("".join(FIXTURE_TOKENS),):
+        return f"returned {output!r:.80} instead of the joined tokens"
+    return None
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(index)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_node(node_name, node_class, api_url, repeat, concurrency, image_size):
+    from flowy.metrics import registry
+
+    try:
+        inputs = build_inputs(node_name, node_class, image_size, api_url)
+    except TypeError as e:
+        return {"node": node_name, "status": "skipped", "reason": str(e)}
+
+    function = getattr(node_class(), node_class.FUNCTION)
+
+    def errors():
+        return sum(item["value"] for item in registry.snapshot()["counters"].get("errors_total", []))
+
+    # Warm up imports, connections and caches
+    errors_before = errors()
+    try:
+        output = function(**inputs)
+    except Exception as e:
+        return {"node": node_name, "status": "error", "reason": f"{type(e).__name__}: {e}"}
+    reason = check_output(node_class, output)
+    if reason:
+        return {"node": node_name, "status": "error", "reason": reason}
+
+    latencies = []
+    latencies_lock = threading.Lock()
+    failures = []
+
+    def worker(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                function(**inputs)
+            except Exception as e:
+                failures.append(f"{type(e).__name__}: {e}")
+                continue
+            with latencies_lock:
+                latencies.append(time.perf_counter() - start)
+
+    per_worker = [repeat // concurrency + (1 if index < repeat % concurrency else 0) for index in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(count,)) for count in per_worker if count]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+
+    generation_errors = errors() - errors_before
+    result = {
+        "node": node_name,
+        "status": "ok" if not failures and not generation_errors else "error",
+        "calls": len(latencies),
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+        "p50_ms": 1000 * percentile(latencies, 50) if latencies else None,
+        "p95_ms": 1000 * percentile(latencies, 95) if latencies else None,
+        "throughput_per_s": len(latencies) / wall if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if failures or generation_errors:
+        result["reason"] = failures[0] if failures else f"{generation_errors} generation error(s), see the log"
+    return result
+
+
+def run_nodes(names, api_url, args, state=None):
+    output_dir = tempfile.mkdtemp(prefix="flowy_bench_")
+    settings = {
+        **json.loads(args.settings or "{}"),
+        "result_cache_enabled": args.result_cache,
+        "llm_cache_enabled": args.result_cache,
+    }
+    mappings = load_node_class_mappings(api_url, output_dir, settings)
+    if state is not None:
+        configure_outputs(state, mappings.values())
+    return [
+        bench_node(name, mappings[name], api_url, args.repeat, args.concurrency, args.image_size)
+        for name in names
+    ]
+
+
+def select_nodes(api_url, args, state):
+    """Import the node mappings in a scratch process to list the node names, and set up the fixtures."""
+    command = [sys.executable, "-m", "benchmarks.e2e_bench", "--list", "--api-url", api_url]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    listed = json.loads(completed.stdout.strip().splitlines()[-1])
+    for model, fixture in listed["outputs"].items():
+        state.outputs[model] = fixture
+    names = listed["nodes"]
+    if args.nodes:
+        patterns = [pattern.lower() for pattern in args.nodes.split(",")]
+        names = [name for name in names if any(pattern in name.lower() for pattern in patterns)]
+    return names
+
+
+def print_table(results):
+    header = f"{'node':48} {'status':8} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'ops/s':>8} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    for result in results:
+        print(
+            f"{result['node'][:48]:48} {result['status']:8} "
+            f"{fmt(result.get('p50_ms'), '9.1f'):>9} {fmt(result.get('p95_ms'), '9.1f'):>9} "
+            f"{fmt(result.get('mean_ms'), '9.1f'):>9} {fmt(result.get('throughput_per_s'), '8.2f'):>8} "
+            f"{fmt(result.get('peak_rss_mb'), '8.0f'):>8}"
+        )
+        if result.get("reason"):
+            print(f"    {result['reason'][:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", help="Comma separated substrings of the node names to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured calls per node, after one warm-up call")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads calling the node at the same time")
+    parser.add_argument("--image-size", type=int, default=512, help="Width and height of synthesized images")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the API result and LLM answer caches enabled")
+    parser.add_argument("--in-process", action="store_true", help="Run all nodes in this process, peak RSS is then cumulative")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--settings", help="JSON object of settings passed to the nodes, e.g. rate_limits")
+    # Internal, used by the worker processes
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--list", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.concurrency = max(1, args.concurrency)
+
+    if args.list:
+        mappings = load_node_class_mappings(args.api_url, tempfile.mkdtemp(prefix="flowy_bench_"), {})
+        state = types.SimpleNamespace(outputs={})
+        configure_outputs(state, mappings.values())
+        print(json.dumps({"nodes": list(mappings), "outputs": state.outputs}))
+        return
+    if args.worker:
+        print(json.dumps(run_nodes([args.worker], args.api_url, args)[0]))
+        return
+
+    sys.path.insert(0, ROOT)
+    from standin_server import StandinServer
+
+    with StandinServer() as server:
+        names = select_nodes(server.url, args, server.state)
+        print(f"Benchmarking {len(names)} node(s) against the stand-in API at {server.url}\n")
+
+        if args.in_process:
+            results = run_nodes(names, server.url, args, server.state)
+        else:
+            results = []
+            forwarded = ["--repeat", str(args.repeat), "--concurrency", str(args.concurrency), "--image-size", str(args.image_size)]
+            if args.result_cache:
+                forwarded.append("--result-cache")
+            if args.settings:
+                forwarded += ["--settings", args.settings]
+            for name in names:
+                command = [sys.executable, "-m", "benchmarks.e2e_bench", "--worker", name, "--api-url", server.url, *forwarded]
+                completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+                try:
+                    results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+                except (IndexError, ValueError):
+                    stderr = completed.stderr.strip().splitlines()
+                    results.append({"node": name, "status": "crashed", "reason": stderr[-1] if stderr else "no output"})
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark of the input image encoder.
+
+Compares the previous float -> uint8 -> JPEG pipeline of image_to_base64 with
+media.encode_images. Each variant runs in its own process so the peak RSS
+numbers don't influence each other.
+
+Usage:
+    python -m benchmarks.encode_bench [--width 3840] [--height 2160] [--batch 1] [--repeat 5] [--stage quantize]
+"""
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from flowy import media
+
+
+def legacy_quantize(image):
+    """The float -> uint8 conversion used by image_to_base64 before it became batch aware."""
+    if image.dim() == 4:
+        image = image.squeeze(0)
+    return (image.cpu().numpy() * 255).astype(np.uint8)
+
+
+def legacy_encode(image):
+    image = legacy_quantize(image)
+    buffered = io.BytesIO()
+    Image.fromarray(image).save(buffered, format="JPEG", quality=85)
+    return [buffered.getvalue()]
+
+
+def new_encode(image):
+    return media.encode_images(image, "JPEG", 85)
+
+
+def new_quantize(image):
+    return [media.quantize_frame(frame) for frame in media.image_frames(image)]
+
+
+VARIANTS = {"legacy": legacy_encode, "new": new_encode}
+QUANTIZE_VARIANTS = {"legacy": legacy_quantize, "new": new_quantize}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(name, width, height, batch, repeat, stage):
+    torch.manual_seed(0)
+    image = torch.rand(batch, height, width, 3)
+    variants = QUANTIZE_VARIANTS if stage == "quantize" else VARIANTS
+    encode = variants[name]
+    if name == "legacy" and batch > 1:
+        # The legacy encoder cannot handle batches, encode frame by frame
+        legacy = variants[name]
+        encode = lambda images: [legacy(frame.unsqueeze(0)) for frame in images]
+
+    baseline_rss = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = encode(image)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "variant": name,
+        "frames": len(encoded),
+        "best_s": min(timings),
+        "mean_s": sum(timings) / len(timings),
+        "peak_rss_mb": peak_rss_mb(),
+        "transient_mb": peak_rss_mb() - baseline_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--stage",
+        choices=("encode", "quantize"),
+        default="encode",
+        help="Measure the full JPEG encode or only the float to uint8 conversion",
+    )
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.width, args.height, args.batch, args.repeat, args.stage)))
+        return
+
+    print(f"Stage {args.stage} of {args.batch}x{args.height}x{args.width}x3 float32, best of {args.repeat}")
+    for name in VARIANTS:
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.encode_bench", "--variant", name]
+            + [f"--{key}={getattr(args, key)}" for key in ("width", "height", "batch", "repeat", "stage")]
+        )
+        result = json.loads(output)
+        print(
+            f"{name:>8}: best {result['best_s'] * 1000:7.1f} ms, mean {result['mean_s'] * 1000:7.1f} ms, "
+            f"transient {result['transient_mb']:7.1f} MB, peak RSS {result['peak_rss_mb']:7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import logging
+import time
+from urllib.parse import urljoin
+
+import requests
+
+from . import http_client, retry_policy, uploads
+from .retry_policy import parse_retry_after
+from .types import (
+    JOB_POLL_INITIAL_INTERVAL,
+    JOB_POLL_MAX_INTERVAL,
+    JOB_POLL_BACKOFF,
+    JOB_TIMEOUT,
+    get_setting,
+)
+
+logger = logging.getLogger(__name__)
+
+# 长时间运行的模型 (视频等) 使用提交 + 轮询的任务模式:
+# 提交后服务端立即返回 job_id, 客户端按自适应间隔轮询任务状态,
+# 轮询过程中的网络错误只会重试轮询, 不会重新提交任务 (避免重复扣费)
+
+# Any other status (queued, running, ...) means the job is still pending
+JOB_SUCCEEDED_STATUSES = ("succeeded", "success", "completed")
+JOB_FAILED_STATUSES = ("failed", "error", "canceled", "cancelled")
+
+# Status codes that mean "try again later" rather than "the job failed"
+TRANSIENT_STATUS_CODES = retry_policy.RETRY_STATUS_CODES
+
+
+class JobFailedError(Exception):
+    """Raised when the remote job finished without a usable output."""
+
+
+def default_poll_url(api_url, job_id):
+    return f"{api_url}/jobs/{job_id}"
+
+
+def submit_job(api_url, headers, payload, timeout=None, policy=None, hooks=None, before_retry=None):
+    """
+    Submit a payload in job mode.
+
+    The submit is retried according to the job_submit retry policy, with one
+    idempotency key for all attempts. A submit that may have reached the server is
+    only sent again when the policy's idempotency_keys confirms the server
+    deduplicates by that key, so a retried submit never starts a second job.
+
+    Returns:
+        dict: The submit response. Contains data.job_id when the server queued the job,
+            or data.output when it finished synchronously.
+    """
+    if policy is None:
+        policy = retry_policy.get_policy("job_submit", payload.get("model_type"))
+    if timeout is None:
+        timeout = (policy.connect_timeout, float(get_setting("job_submit_timeout", policy.read_timeout)))
+
+    response = uploads.post_payload(
+        api_url,
+        {**payload, "async": True},
+        headers,
+        model_type=payload.get("model_type"),
+        policy=policy,
+        idempotency_key=retry_policy.new_idempotency_key(),
+        timeout=timeout,
+        hooks=hooks,
+        before_retry=before_retry,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def poll_job(
+    poll_url,
+    headers,
+    initial_interval=None,
+    max_interval=None,
+    backoff=None,
+    timeout=None,
+    sleep=time.sleep,
+):
+    """
+    Poll a submitted job until it finishes.
+
+    The interval starts at initial_interval and grows by backoff up to max_interval.
+    A Retry-After header from the server always takes precedence. Network errors and
+    transient status codes keep the job polling, the job is never submitted again.
+
+    Args:
+        poll_url (str): Job status URL.
+        headers (dict): Request headers, including authorization.
+        initial_interval (float, optional): First wait between polls in seconds.
+        max_interval (float, optional): Upper bound of the wait between polls.
+        backoff (float, optional): Multiplier applied to the wait after each pending poll.
+        timeout (float, optional): Give up after this many seconds.
+        sleep (callable, optional): Sleep function, replaceable in tests.
+
+    Returns:
+        dict: The final job response, with data.output set.
+
+    Raises:
+        JobFailedError: If the job reports a failed status.
+        TimeoutError: If the job does not finish before the timeout.
+    """
+    if initial_interval is None:
+        initial_interval = float(get_setting("job_poll_initial_interval", JOB_POLL_INITIAL_INTERVAL))
+    if max_interval is None:
+        max_interval = float(get_setting("job_poll_max_interval", JOB_POLL_MAX_INTERVAL))
+    if backoff is None:
+        backoff = float(get_setting("job_poll_backoff", JOB_POLL_BACKOFF))
+    if timeout is None:
+        timeout = float(get_setting("job_timeout", JOB_TIMEOUT))
+
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    attempt = 0
+
+    while True:
+        attempt += 1
+        wait = interval
+        try:
+            response = http_client.get(poll_url, headers=headers)
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if response.status_code in TRANSIENT_STATUS_CODES:
+                logger.warning(
+                    f"Polling {poll_url} returned {response.status_code}, will poll again"
+                )
+            else:
+                response.raise_for_status()
+                result = response.json()
+                data = result.get("data") or {}
+                status = str(data.get("status", "")).lower()
+
+                if data.get("output") and status not in JOB_FAILED_STATUSES:
+                    logger.info(f"Job at {poll_url} finished after {attempt} poll(s)")
+                    return result
+                if status in JOB_FAILED_STATUSES or result.get("success") is False:
+                    raise JobFailedError(
+                        f"Job failed with status '{status}': {data.get('error') or result.get('error')}"
+                    )
+                if status in JOB_SUCCEEDED_STATUSES:
+                    raise JobFailedError(f"Job succeeded without output: {result}")
+                interval = min(max_interval, interval * backoff)
+
+            if retry_after is not None:
+                wait = retry_after
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning(f"Polling {poll_url} failed with {e}, will poll again")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Job at {poll_url} did not finish within {timeout:.0f}s")
+        sleep(min(wait, remaining))
+
+
+def run_job(
+    api_url,
+    headers,
+    payload,
+    poll_url_builder=default_poll_url,
+    submit_policy=None,
+    submit_hooks=None,
+    submit_before_retry=None,
+    on_submitted=None,
+    **poll_options,
+):
+    """
+    Submit a payload in job mode and wait for its output.
+
+    Servers that answer the submit with the output directly are supported as well.
+    submit_policy overrides the retry policy of the submit, see submit_job,
+    submit_hooks are requests response hooks of the submit and submit_before_retry
+    is called before each retry of the submit. on_submitted is called once the
+    submit is answered, before polling, e.g. to free a rate limiter slot.
+
+    Returns:
+        dict: A response of the same shape as a synchronous request, {"success": True, "data": {"output": [...]}}.
+    """
+    submitted = submit_job(
+        api_url, headers, payload, policy=submit_policy, hooks=submit_hooks, before_retry=submit_before_retry
+    )
+    if on_submitted is not None:
+        on_submitted()
+    data = submitted.get("data") or {}
+    if not submitted.get("success", True) or data.get("output"):
+        return submitted
+
+    job_id = data.get("job_id")
+    if not job_id:
+        raise JobFailedError(f"Job submit returned neither output nor job id: {submitted}")
+
+    poll_url = urljoin(api_url, data["poll_url"]) if data.get("poll_url") else poll_url_builder(api_url, job_id)
+    logger.info(f"Submitted job {job_id}, polling {poll_url}")
+    return poll_job(poll_url, headers, **poll_options)
+
+
+__all__ = [
+    "JobFailedError",
+    "parse_retry_after",
+    "submit_job",
+    "poll_job",
+    "run_job",
+]
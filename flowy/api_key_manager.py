@@ -1,37 +1,224 @@
 import os
 import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .retry_policy import parse_retry_after
+from .types import API_KEY_COOLDOWN, get_setting
 
 logger = logging.getLogger(__name__)
 
 API_KEY_FILE = os.path.join(os.path.dirname(__file__), "api_key.json")
 
+RATE_LIMITED = 429
+
+# api_key.json 的解析结果, 按 (路径, mtime, 大小) 缓存, 文件变化后重新读取
+_key_file_lock = threading.Lock()
+_key_file_cache = {"signature": None, "keys": []}
+
+
 def save_api_key(api_key):
     """
-    Save the API key to a JSON file.
-    
+    Save the API key to a JSON file, keeping the api_keys pool already in it.
+
     Args:
         api_key (str): The API key to be saved.
     """
+    # 只替换 api_key, 保留文件中配置的 api_keys 池
+    data = {}
+    try:
+        with open(API_KEY_FILE, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Failed to read {API_KEY_FILE}, overwriting it: {str(e)}")
+    if not isinstance(data, dict):
+        data = {}
+    data["api_key"] = api_key
     try:
         with open(API_KEY_FILE, "w") as f:
-            json.dump({"api_key": api_key}, f)
+            json.dump(data, f)
         logger.debug(f"API Key saved to {API_KEY_FILE}")
     except Exception as e:
         logger.error(f"Failed to save API Key: {str(e)}")
+    with _key_file_lock:
+        _key_file_cache["signature"] = None
+
+
+def _parse_keys(data):
+    keys = []
+    for key in [data.get("api_key")] + list(data.get("api_keys") or []):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def load_api_keys():
+    """
+    Load all API keys from the JSON file.
+
+    The file holds one key as {"api_key": "..."}, a pool of keys as
+    {"api_keys": ["...", "..."]}, or both. It is only parsed again after it changed.
+
+    Returns:
+        list[str]: The keys, api_key first. Empty if not found or an error occurred.
+    """
+    try:
+        stat = os.stat(API_KEY_FILE)
+        signature = (API_KEY_FILE, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return []
+    with _key_file_lock:
+        if _key_file_cache["signature"] == signature:
+            return list(_key_file_cache["keys"])
+        try:
+            with open(API_KEY_FILE, "r") as f:
+                keys = _parse_keys(json.load(f))
+        except Exception as e:
+            logger.error(f"Failed to load API Key: {str(e)}")
+            return []
+        _key_file_cache["signature"] = signature
+        _key_file_cache["keys"] = keys
+        return list(keys)
+
 
 def load_api_key():
     """
     Load the API key from the JSON file.
-    
+
     Returns:
         str or None: The loaded API key, or None if not found or an error occurred.
     """
-    try:
-        if os.path.exists(API_KEY_FILE):
-            with open(API_KEY_FILE, "r") as f:
-                data = json.load(f)
-                return data.get("api_key")
-    except Exception as e:
-        logger.error(f"Failed to load API Key: {str(e)}")
-    return None
+    keys = load_api_keys()
+    return keys[0] if keys else None
+
+
+class _KeyState:
+    __slots__ = ("in_flight", "cooldown_until", "last_leased")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.last_leased = 0
+
+
+class KeyLease:
+    """One request's use of a pooled key, see ApiKeyPool.lease."""
+
+    def __init__(self, pool, key):
+        self.pool = pool
+        self.key = key
+
+    @property
+    def hooks(self) -> dict:
+        """requests hooks that put the key in cooldown when a response is 429"""
+        return {"response": self._on_response}
+
+    def _on_response(self, response, *args, **kwargs):
+        if response.status_code == RATE_LIMITED and self.key is not None:
+            self.pool.cooldown(self.key, parse_retry_after(response.headers.get("Retry-After")))
+        return response
+
+    def renew(self) -> bool:
+        """Swap the key for the pool's current best choice, True when the key changed."""
+        key = self.pool.acquire()
+        self.pool.release(self.key)
+        changed = key != self.key
+        self.key = key
+        return changed
+
+    def retry_hook(self, error):
+        """
+        before_retry hook for retry_policy.send: after a 429 the request continues with a
+        newly leased key. Returns the Authorization header of the new key, or None to keep
+        the current one.
+        """
+        response = getattr(error, "response", None)
+        if response is None or response.status_code != RATE_LIMITED or not self.renew():
+            return None
+        logger.info(f"Retrying with API key ...{self.key[-4:]} after a 429")
+        return {"Authorization": f"Bearer {self.key}"}
+
+
+class ApiKeyPool:
+    """
+    Spread requests over the API keys of api_key.json.
+
+    Each request leases the key with the fewest requests in flight, keys that were
+    answered 429 are skipped until their cooldown ends. With a single key this is
+    just a cached load_api_key.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._states = {}
+        self._leases = 0
+
+    def _choose(self, keys):
+        now = self.clock()
+        states = [(key, self._states.setdefault(key, _KeyState())) for key in keys]
+        ready = [(key, state) for key, state in states if state.cooldown_until <= now]
+        if not ready:
+            # 所有 key 都在冷却中, 使用最先结束冷却的 key, 由重试策略等待 Retry-After
+            return min(states, key=lambda item: item[1].cooldown_until)[0]
+        # 并发数相同的 key 轮流使用
+        return min(ready, key=lambda item: (item[1].in_flight, item[1].last_leased))[0]
+
+    def acquire(self):
+        """Return the key to use for a request, or None when no key is set. Pair with release."""
+        keys = load_api_keys()
+        if not keys:
+            return None
+        with self._lock:
+            key = self._choose(keys)
+            state = self._states[key]
+            self._leases += 1
+            state.in_flight += 1
+            state.last_leased = self._leases
+            return key
+
+    def release(self, key):
+        if key is None:
+            return
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None and state.in_flight > 0:
+                state.in_flight -= 1
+
+    @contextmanager
+    def lease(self):
+        """Lease a key for the with block, yields a KeyLease whose key is None when no key is set."""
+        lease = KeyLease(self, self.acquire())
+        try:
+            yield lease
+        finally:
+            # The key may have been renewed during the lease
+            self.release(lease.key)
+
+    def cooldown(self, key, seconds=None):
+        """Skip key for seconds, defaults to the api_key_cooldown setting."""
+        if seconds is None:
+            seconds = float(get_setting("api_key_cooldown", API_KEY_COOLDOWN))
+        with self._lock:
+            state = self._states.setdefault(key, _KeyState())
+            state.cooldown_until = max(state.cooldown_until, self.clock() + seconds)
+        logger.warning(f"API key ...{key[-4:]} was rate limited, cooling down for {seconds:.0f}s")
+
+    def stats(self) -> dict:
+        """In-flight count and remaining cooldown of every key, keyed by the key's last 4 characters"""
+        now = self.clock()
+        with self._lock:
+            return {
+                f"...{key[-4:]}": {
+                    "in_flight": state.in_flight,
+                    "cooldown": max(0.0, state.cooldown_until - now),
+                }
+                for key, state in self._states.items()
+            }
+
+
+key_pool = ApiKeyPool()
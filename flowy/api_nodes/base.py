@@ -1,26 +1,53 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import base64
 import io
-from PIL import Image
 import torch
-import numpy as np
 import logging
 import json
 import os
-from ..types import get_api_host
-from ..api_key_manager import load_api_key
+import shutil
+import uuid
+from urllib.parse import urlparse
+from ..types import (
+    get_api_host,
+    get_setting,
+    DOWNLOAD_CONCURRENCY,
+    BATCH_CONCURRENCY,
+    DECODE_STRIP_BYTES,
+    DECODE_MEMMAP_MIN_BYTES,
+)
+from ..api_key_manager import load_api_key, load_api_keys, key_pool
+from .. import http_client, media, api_jobs, result_cache, retry_policy, rate_limiter, single_flight, uploads
+from ..metrics import registry as metrics
 import soundfile as sf
 
 import folder_paths
 
 logger = logging.getLogger(__name__)
 
+DECODE_DTYPES = {"float32": torch.float32, "float16": torch.float16}
+
 class FlowyApiNode(ABC):
     CATEGORY = "Comflowy"
     FUNCTION = "generate"
     RETURN_TYPES = []
+    # 长时间运行的模型设为 True, 表示支持提交 + 轮询的任务模式, 需要通过 job_mode 设置开启,
+    # 默认仍然使用同步请求
+    ASYNC_JOB = False
+    # 结果由 payload 决定的节点 (payload 带 seed 的确定性模型) 设为 True, 开启基于 payload 哈希的结果缓存.
+    # 默认关闭: 没有 seed 或结果不确定的模型, 重新运行相同的输入是为了得到新的结果
+    RESULT_CACHE = False
+    # 图像输入的名字, 设置后该输入的批次中每一张图都作为单独的 API 任务并发执行
+    BATCH_INPUT = None
+    # 图像输入上传前的目标: 最长边的最大像素数 (None 为原始分辨率) 和编码格式 (JPEG / WEBP / PNG),
+    # 模型本身会缩小输入时设为模型实际使用的分辨率, 可通过 input_encoding 设置覆盖
+    INPUT_MAX_RESOLUTION = None
+    INPUT_FORMAT = "JPEG"
+    INPUT_QUALITY = 85
 
     @classmethod
     @abstractmethod
@@ -46,118 +73,228 @@ class FlowyApiNode(ABC):
         API_URL = f"{API_HOST}/api/open/v0/flowy"
         return API_URL
 
+    # 返回某类请求的重试策略, 按 模型类型 > 请求类型 > 默认 的顺序合并配置
+    def request_policy(self, kind: str) -> retry_policy.RetryPolicy:
+        """Return the retry policy of a kind of request (api, download) for this model"""
+        return retry_policy.get_policy(kind, self.get_model_type())
+
+    # 下载输出文件的原始字节
+    def download_output_bytes(self, output_url: str) -> bytes:
+        """Download an output URL into memory, retrying transient failures"""
+        try:
+            with metrics.timer("download_seconds", self.get_model_type()):
+                response = retry_policy.send("GET", output_url, policy=self.request_policy("download"))
+                response.raise_for_status()
+                content = response.content
+            metrics.observe("download_bytes", self.get_model_type(), len(content))
+            return content
+        except requests.RequestException as e:
+            logger.error(f"Unable to access output URL: {str(e)}")
+            raise Exception(f"Unable to access output URL: {str(e)}")
+
+    # 把输出文件流式下载到磁盘, 失败时整个文件重新下载
+    def download_output_file(self, output_url: str, path: str) -> str:
+        """Stream an output URL to path, retrying transient failures. Returns the sha256 of the file"""
+        policy = self.request_policy("download")
+        with metrics.timer("download_seconds", self.get_model_type()):
+            checksum = retry_policy.call(
+                lambda: http_client.download_to_file(output_url, path, timeout=policy.timeout()),
+                policy,
+                f"Download of {output_url}",
+            )
+        metrics.observe("download_bytes", self.get_model_type(), os.path.getsize(path))
+        return checksum
+
     # 从 URL 下载图片并转换为 tensor
     def parse_image_output(self, output_url: str) -> torch.Tensor:
         """Convert image URL to tensor"""
-        start_time = time.time()
-        for attempt in range(3):
-            try:
-                img_response = requests.get(output_url, stream=True)
-                img_response.raise_for_status()
-                break
-            except requests.RequestException as e:
-                if attempt == 2:  # Last attempt
-                    logger.error(f"Unable to access output URL after 3 attempts: {str(e)}")
-                    raise Exception(f"Unable to access output URL: {str(e)}")
-                logger.warning(f"Attempt {attempt + 1} failed, retrying in 1s...")
-                time.sleep(1)
-
-        logger.info(f"[Timing] Image download took {time.time() - start_time:.2f}s")
-        download_start = time.time()
-
-        logger.info(f"[Timing] Image download took {time.time() - download_start:.2f}s")
-        process_start = time.time()
-
-        # Convert image data to PIL Image
-        img = Image.open(img_response.raw)
-
-        # Convert to numpy array
-        img_np = np.array(img)
-
-        # Ensure image has 3 RGB channels
-        if len(img_np.shape) == 2:  # Grayscale image
-            img_np = np.stack([img_np] * 3, axis=-1)
-        elif img_np.shape[-1] == 4:  # RGBA image
-            img_np = img_np[:, :, :3]
-
-        # Convert to float32 and normalize to 0-1 range
-        img_np = img_np.astype(np.float32) / 255.0
-
-        # Convert to torch tensor, ensure shape is [B,H,W,C]
-        img_tensor = torch.from_numpy(img_np).unsqueeze(0)  # Add batch dimension
-
-        logger.info(f"[Timing] Image processing took {time.time() - process_start:.2f}s")
-        logger.info(f"[Timing] Total image parsing took {time.time() - start_time:.2f}s")
+        return self.parse_image_outputs([output_url])
+
+    # 并发下载多张图片, 直接解码到同一个预分配的 [B,H,W,3] tensor 中
+    def parse_image_outputs(self, output_urls: list, fetch=None, with_mask=False):
+        """
+        Download and decode image URLs concurrently into one batch tensor, keeping their order.
+
+        Returns the [B,H,W,3] image batch, or (images, masks) with a [B,H,W] alpha mask
+        batch when with_mask is set. The image dtype comes from the image_decode_dtype
+        setting, masks are always float32.
+
+        Images are decoded in strips of image_decode_strip_bytes, and batches of at least
+        image_decode_memmap_min_bytes are decoded into a memory-mapped temporary file
+        (in image_decode_memmap_dir), which keeps large upscaled outputs within memory.
+        """
+        fetch = fetch or self.download_output_bytes
+        dtype = DECODE_DTYPES[get_setting("image_decode_dtype", "float32")]
+        strip_bytes = int(get_setting("image_decode_strip_bytes", DECODE_STRIP_BYTES))
+        memmap_min_bytes = int(get_setting("image_decode_memmap_min_bytes", DECODE_MEMMAP_MIN_BYTES))
+        memmap_dir = get_setting("image_decode_memmap_dir")
+        model_type = self.get_model_type()
+        batch_size = len(output_urls)
+        batch = None
+        masks = None
+        batch_lock = threading.Lock()
+
+        def fetch_and_decode(index, url):
+            nonlocal batch, masks
+            data = fetch(url)
+            decode_start = time.perf_counter()
+            img = media.open_image(data)
+            width, height = img.size
+            with batch_lock:
+                if batch is None:
+                    batch = media.empty_tensor((batch_size, height, width, 3), dtype, memmap_min_bytes, memmap_dir)
+                    if with_mask:
+                        masks = media.empty_tensor(
+                            (batch_size, height, width), torch.float32, memmap_min_bytes, memmap_dir
+                        )
+                elif batch.shape[1:3] != (height, width):
+                    raise ValueError(
+                        f"Output images have different sizes: {tuple(batch.shape[1:3])} and {(height, width)}"
+                    )
+            with img:
+                media.decode_image_into(
+                    img, batch[index], masks[index] if with_mask else None, media.strip_rows_for(width, strip_bytes)
+                )
+            metrics.observe("decode_seconds", model_type, time.perf_counter() - decode_start)
 
-        return img_tensor
+        max_workers = min(batch_size, int(get_setting("download_concurrency", DOWNLOAD_CONCURRENCY)))
+        if max_workers <= 1:
+            for index, url in enumerate(output_urls):
+                fetch_and_decode(index, url)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(fetch_and_decode, index, url)
+                    for index, url in enumerate(output_urls)
+                ]
+                for future in futures:
+                    future.result()
+
+        if with_mask:
+            return batch, masks
+        return batch
+
+    def returns_mask(self) -> bool:
+        """Whether the node exposes the alpha channel of its images as a MASK output"""
+        return len(self.RETURN_TYPES) > 1 and self.RETURN_TYPES[1] == "MASK"
+
+    def image_result(self, decoded) -> tuple:
+        """Turn parse_image_outputs results into the node's IMAGE (and MASK) outputs"""
+        return tuple(decoded) if self.returns_mask() else (decoded,)
+
+    def new_output_path(self, extension: str) -> str:
+        """Return a new file path in the ComfyUI output directory"""
+        output_dir = folder_paths.get_output_directory()
+        curr_time = time.time()
+        # Batch jobs download concurrently, the suffix keeps names unique within the same timestamp
+        return os.path.join(output_dir, f"output_{curr_time}_{uuid.uuid4().hex[:8]}{extension}")
 
     # 从 URL 下载视频并返回本地路径
     def parse_video_output(self, output_url: str) -> str:
         """Download video from URL and return local path"""
-        output_dir = folder_paths.get_output_directory()
-        curr_time = time.time()
-        vid_name = f"output_{curr_time}.mp4"
-        output_video_path = os.path.join(output_dir, vid_name)
-
-        response = requests.get(output_url)
-        response.raise_for_status()
+        output_video_path = self.new_output_path(".mp4")
 
-        with open(output_video_path, "wb") as f:
-            f.write(response.content)
+        checksum = self.download_output_file(output_url, output_video_path)
+        logger.info(f"Saved video output to {output_video_path}, sha256={checksum}")
 
         return output_video_path
     
     def parse_audio_output(self, output_url: str) -> str:
         """Download audio from URL and return local path"""
-        output_dir = folder_paths.get_output_directory()
-        curr_time = time.time()
-        audio_name = f"output_{curr_time}.wav"
-        output_audio_path = os.path.join(output_dir, audio_name)
+        output_audio_path = self.new_output_path(".wav")
 
-        response = requests.get(output_url)
-        response.raise_for_status()
-
-        with open(output_audio_path, "wb") as f:
-            f.write(response.content)
+        checksum = self.download_output_file(output_url, output_audio_path)
+        logger.info(f"Saved audio output to {output_audio_path}, sha256={checksum}")
 
         return output_audio_path
 
-    # 处理输入图像
-    def image_to_base64(self, image) -> str:
-        """Process input image to base64 string"""
-        if isinstance(image, torch.Tensor):
-            if image.dim() == 4:
-                image = image.squeeze(0)  # Remove batch dimension
-            if image.shape[-1] == 3:
-                image = (image.cpu().numpy() * 255).astype(np.uint8)
-            elif image.shape[0] == 3:
-                image = (image.permute(1, 2, 0).cpu().numpy() * 255).astype(np.uint8)
-            else:
-                raise ValueError(f"Unsupported image shape: {image.shape}")
-        elif isinstance(image, np.ndarray):
-            if image.ndim == 2:
-                image = np.stack([image] * 3, axis=-1)
-            elif image.shape[-1] == 1:
-                image = np.repeat(image, 3, axis=-1)
-            elif image.shape[-1] != 3:
-                raise ValueError(f"Unsupported number of channels: {image.shape[-1]}")
-            image = (image * 255).astype(np.uint8)
-        else:
-            raise ValueError(f"Unsupported image type: {type(image)}")
-
-        buffered = io.BytesIO()
-        Image.fromarray(image).save(buffered, format="JPEG", quality=85)
-        return (
-            f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
-        )
-
-    def audio_to_base64(self, audio):
+    def input_encoding(self) -> dict:
+        """
+        Return the max_resolution, format and quality used for image inputs.
+
+        The node's INPUT_* attributes can be overridden by the input_encoding setting, e.g.
+        {"input_encoding": {"default": {"format": "WEBP"}, "kling": {"max_resolution": 1280}}},
+        a max_resolution of 0 sends the full resolution.
+        """
+        overrides = get_setting("input_encoding") or {}
+        encoding = {
+            "max_resolution": self.INPUT_MAX_RESOLUTION,
+            "format": self.INPUT_FORMAT,
+            "quality": self.INPUT_QUALITY,
+        }
+        encoding.update(overrides.get("default") or {})
+        encoding.update(overrides.get(self.get_model_type()) or {})
+        encoding["format"] = str(encoding["format"]).upper()
+        if encoding["format"] not in media.IMAGE_MIME_TYPES:
+            raise ValueError(f"Unsupported input format: {encoding['format']}")
+        return encoding
+
+    # 处理输入图像, 批次中的每一帧缩小到目标分辨率后单独编码, 相同内容的帧只编码一次
+    # 返回的 EncodedMedia 在 JSON 请求中序列化为 base64 data URI, 在 multipart 请求中作为二进制发送
+    def encode_image_inputs(self, image, format=None, quality=None, max_resolution=None) -> list:
+        """
+        Encode every frame of an image batch, returning one EncodedMedia per frame.
+
+        Args:
+            image: Image batch.
+            format (str, optional): JPEG, WEBP or PNG, defaults to input_encoding().
+            quality (int, optional): Encoder quality, defaults to input_encoding().
+            max_resolution (int, optional): Max longer side in pixels, on top of input_encoding().
+        """
+        encoding = self.input_encoding()
+        format = (format or encoding["format"]).upper()
+        quality = quality or encoding["quality"]
+        limits = [limit for limit in (max_resolution, encoding["max_resolution"]) if limit]
+        max_resolution = min(limits) if limits else None
+        mime_type = media.IMAGE_MIME_TYPES[format]
+        encoded = []
+        for frame in media.image_frames(image):
+            size = media.fit_size(frame.shape[0], frame.shape[1], max_resolution)
+            key = ("image", media.tensor_digest(frame), size, format, quality)
+            encoded.append(media.encode_cache.get_or_encode(
+                key,
+                lambda: media.EncodedMedia(
+                    media.encode_frame(
+                        media.resize_pixels(media.quantize_frame(frame), max_resolution), format, quality
+                    ),
+                    mime_type,
+                ),
+            ))
+        return encoded
+
+    def encode_image_input(self, image, max_resolution=None) -> media.EncodedMedia:
+        """Encode the input image for the payload, only the first frame of a batch is used"""
+        frames = media.image_frames(image)
+        if frames.shape[0] > 1:
+            logger.warning(f"Image batch of {frames.shape[0]} given, only the first image is sent")
+        return self.encode_image_inputs(frames[:1], max_resolution=max_resolution)[0]
+
+    def encode_audio_input(self, audio) -> media.EncodedMedia:
+        """Encode the input audio as WAV for the payload"""
         if isinstance(audio, dict) and "waveform" in audio and "sample_rate" in audio:
             waveform = audio["waveform"]
             sample_rate = audio["sample_rate"]
         else:
             waveform, sample_rate = audio
 
+        key = ("audio", media.tensor_digest(waveform), sample_rate, "wav")
+        return media.encode_cache.get_or_encode(
+            key, lambda: self._encode_audio_base64(waveform, sample_rate)
+        )
+
+    # 以下返回 base64 data URI 字符串, 与原来的接口相同
+    def images_to_base64(self, image, format=None, quality=None, max_resolution=None) -> list:
+        """Encode every frame of an image batch to a base64 data URI, see encode_image_inputs"""
+        return [item.data_uri() for item in self.encode_image_inputs(image, format, quality, max_resolution)]
+
+    def image_to_base64(self, image, max_resolution=None) -> str:
+        """Process input image to base64 string"""
+        return self.encode_image_input(image, max_resolution).data_uri()
+
+    def audio_to_base64(self, audio) -> str:
+        return self.encode_audio_input(audio).data_uri()
+
+    def _encode_audio_base64(self, waveform, sample_rate) -> media.EncodedMedia:
         # Ensure waveform is 2D
         if waveform.dim() == 1:
             waveform = waveform.unsqueeze(0)
@@ -168,9 +305,7 @@ class FlowyApiNode(ABC):
 
         buffer = io.BytesIO()
         sf.write(buffer, waveform.numpy().T, sample_rate, format="wav")
-        buffer.seek(0)
-        audio_str = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:audio/wav;base64,{audio_str}"
+        return media.EncodedMedia(buffer.getvalue(), "audio/wav")
 
     # 发送 API 请求
     def make_api_request(self, payload: dict):
@@ -182,91 +317,360 @@ class FlowyApiNode(ABC):
             )
 
         API_URL = self.get_api_host()
-        response = requests.post(
-            API_URL,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        model_type = self.get_model_type()
+        pinned_key = self.payload_api_key(payload)
+
+        def send():
+            # 同一模型和 host 的请求共享一个限流器, 限额按 key 池大小放大, 排队等待的时间不计入 API 延迟.
+            # 任务模式下提交完成后就释放名额, 轮询期间不占用; 重试同样要等待令牌
+            api_keys = 1 if pinned_key else len(load_api_keys())
+            limiter = rate_limiter.get_limiter(model_type, urlparse(API_URL).netloc, api_keys)
+            metrics.observe("queue_wait_seconds", model_type, limiter.acquire())
+            released = []
+
+            def release_slot():
+                if not released:
+                    released.append(True)
+                    limiter.release()
+
+            try:
+                # 配置了多个 API key 时使用并发最少的 key, 返回 429 的 key 暂停使用一段时间, 重试时换用其他 key.
+                # payload 中带有 key 的请求始终使用该 key, 请求头和 payload 中的 key 保持一致
+                with nullcontext() if pinned_key else key_pool.lease() as lease:
+                    request_key = pinned_key or lease.key or api_key
+                    request_headers = {**headers, "Authorization": f"Bearer {request_key}"}
+
+                    def before_retry(error):
+                        limiter.wait_for_token()
+                        if lease is None or lease.key is None:
+                            return None
+                        changed = lease.retry_hook(error)
+                        # 任务模式下轮询使用提交任务的 key
+                        request_headers.update(changed or {})
+                        return changed
+
+                    with metrics.timer("api_latency_seconds", model_type):
+                        return self.send_api_request(
+                            API_URL,
+                            request_headers,
+                            payload,
+                            hooks=lease.hooks if lease is not None else None,
+                            before_retry=before_retry,
+                            on_submitted=release_slot,
+                        )
+            finally:
+                release_slot()
+
+        # 同一 API key 相同 URL + payload 的请求正在进行时, 等待它完成并共享结果, 不再重复请求
+        if not single_flight.enabled():
+            return send()
+        result, shared = single_flight.api_requests.do(result_cache.canonical_hash(API_URL, payload, api_key), send)
+        if shared:
+            metrics.increment("coalesced_requests_total", model_type)
+        return result
+
+    # payload 中自带的 API key, 有则该请求只使用这个 key, 不从 key 池中分配
+    def payload_api_key(self, payload: dict):
+        """The API key the payload itself carries, None when it carries none"""
+        return None
+
+    # 是否使用任务模式: 节点支持 (ASYNC_JOB) 并且服务端支持任务时, 由 job_mode 设置开启
+    def use_job_mode(self) -> bool:
+        """
+        Whether requests are sent in job mode (submit, then poll).
+
+        Off by default. The job_mode setting is true to enable it for every node with
+        ASYNC_JOB, or a list of model types, e.g. {"job_mode": ["kling", "luma"]}.
+        """
+        if not self.ASYNC_JOB:
+            return False
+        job_mode = get_setting("job_mode", False)
+        if isinstance(job_mode, (list, tuple)):
+            return self.get_model_type() in job_mode
+        return job_mode is True
+
+    # 把 payload 发送到 API, 任务模式下提交并轮询直到任务完成
+    def send_api_request(
+        self, api_url: str, headers: dict, payload: dict, hooks=None, before_retry=None, on_submitted=None
+    ) -> dict:
+        """
+        Send the payload and return the API answer.
+
+        hooks are requests response hooks of the POST and before_retry is called before
+        each of its retries. In job mode, on_submitted is called once the job is submitted.
+        """
+        if self.use_job_mode():
+            return api_jobs.run_job(
+                api_url,
+                headers,
+                payload,
+                submit_policy=self.request_policy("job_submit"),
+                submit_hooks=hooks,
+                submit_before_retry=before_retry,
+                on_submitted=on_submitted,
+            )
+
+        # One key for all attempts, the server deduplicates retried generations
+        response = uploads.post_payload(
+            api_url,
+            payload,
+            headers,
+            model_type=self.get_model_type(),
+            policy=self.request_policy("api"),
+            idempotency_key=retry_policy.new_idempotency_key(),
+            hooks=hooks,
+            before_retry=before_retry,
         )
         response.raise_for_status()
         return response.json()
 
-    # 主生成方法
-    def generate(self, **kwargs):
-        """Main generation method"""
+    # 是否对本次执行使用结果缓存, 只缓存 payload 带 seed 的请求, 子类可以根据输入关闭
+    def use_result_cache(self, payload: dict, **kwargs) -> bool:
+        """Whether this execution may be served from and stored in the result cache"""
+        return (
+            self.RESULT_CACHE
+            and self.RETURN_TYPES[0] in ("IMAGE", "VIDEO", "AUDIO")
+            and payload.get("seed") is not None
+        )
+
+    def cached_files(self, cache_key: str):
+        """Return the output files of a usable result cache entry, or None on a miss"""
+        cache = result_cache.get_result_cache()
+        entry = cache.get(cache_key) if cache else None
+        if entry is None:
+            return None
+        meta, files = entry
+        if meta.get("return_type") != self.RETURN_TYPES[0] or not all(os.path.exists(path) for path in files):
+            logger.warning(f"Ignoring unusable result cache entry {cache_key}")
+            return None
+        return files
+
+    def store_cached_result(self, cache_key: str, return_type: str, files: list):
+        """Store the original output files of an execution in the result cache"""
+        cache = result_cache.get_result_cache()
+        if cache is None:
+            return
         try:
-            start_time = time.time()
-            
-            # Prepare payload with common fields
+            cache.put(cache_key, {"return_type": return_type, "model_type": self.get_model_type()}, files)
+        except OSError as e:
+            logger.warning(f"Failed to store result in cache: {e}")
+
+    # 解析 API 返回的输出 URL, cache_key 不为空时同时把原始输出写入结果缓存
+    def parse_outputs(self, output_urls: list, cache_key=None):
+        """Download and parse output URLs according to RETURN_TYPES"""
+        return_type = self.RETURN_TYPES[0]
+        if return_type == "IMAGE":
+            # 单个或多个图像都解码到同一个批次中
+            downloaded = {}
+
+            def fetch(url):
+                data = self.download_output_bytes(url)
+                if cache_key:
+                    downloaded[url] = data
+                return data
+
+            result = self.image_result(
+                self.parse_image_outputs(output_urls, fetch=fetch, with_mask=self.returns_mask())
+            )
+            if cache_key:
+                self.store_cached_result(cache_key, return_type, [downloaded[url] for url in output_urls])
+        elif return_type == "VIDEO":
+            result = tuple(self.parse_video_output(url) for url in output_urls)
+            if cache_key:
+                self.store_cached_result(cache_key, return_type, list(result))
+        elif return_type == "AUDIO":
+            result = tuple(self.parse_audio_output(url) for url in output_urls)
+            if cache_key:
+                self.store_cached_result(cache_key, return_type, list(result))
+        elif return_type in ("STRING", "STERING"):
+            # 文本模型按 token 列表输出, 合并成一个字符串
+            result = ("".join(str(item) for item in output_urls),)
+        else:
+            raise ValueError(f"Unsupported return type: {return_type}")
+        return result
+
+    # 单个 API 任务: 准备 payload, 命中结果缓存时返回缓存的文件, 否则请求 API 得到输出 URL
+    def request_job(self, **kwargs) -> dict:
+        """
+        Run the API request of one job, or look its outputs up in the result cache.
+
+        Returns:
+            dict: "sources" are the output URLs, or the cached files when "cached" is set.
+                "cache_key" is where fresh outputs are stored, None when the result cache is not used.
+        """
+        model_type = self.get_model_type()
+
+        # Prepare payload with common fields
+        with metrics.timer("payload_prep_seconds", model_type):
             payload = self.prepare_payload(**kwargs)
-            payload["model_type"] = self.get_model_type()
-            
-            logger.info(f"[Timing] Payload preparation took {time.time() - start_time:.2f}s")
-            api_start = time.time()
-
-            # Make API request
-            result = self.make_api_request(payload)
-            
-            logger.info(f"[Timing] API request took {time.time() - api_start:.2f}s")
-
-            if not result.get("success"):
-                raise Exception(
-                    f"API request failed. Response: {json.dumps(result, indent=2)}"
-                )
+            payload["model_type"] = model_type
+
+        # 相同 model_type + payload 的结果直接从缓存返回, 不再请求 API 和下载
+        cache_key = None
+        if self.use_result_cache(payload, **kwargs):
+            cache_key = result_cache.canonical_hash(payload["model_type"], payload)
+            files = self.cached_files(cache_key)
+            if files is not None:
+                metrics.increment("result_cache_hits_total", model_type)
+                logger.info(f"Result cache hit {cache_key} for {model_type}")
+                return {"sources": files, "cached": True, "cache_key": cache_key}
+
+        # Make API request
+        result = self.make_api_request(payload)
+
+        if not result.get("success"):
+            raise Exception(
+                f"API request failed. Response: {json.dumps(result, indent=2)}"
+            )
 
-            output_urls = result.get("data", {}).get("output")
-            if not output_urls or not isinstance(output_urls, list):
-                raise Exception(
-                    f"Invalid output URLs in response: {json.dumps(result, indent=2)}"
-                )
+        output_urls = result.get("data", {}).get("output")
+        if not output_urls or not isinstance(output_urls, list):
+            raise Exception(
+                f"Invalid output URLs in response: {json.dumps(result, indent=2)}"
+            )
+        return {"sources": output_urls, "cached": False, "cache_key": cache_key}
+
+    # 解析任务的输出: 所有任务的图像直接解码到同一个预分配 (或内存映射) 的批次中, 视频和音频保存到输出目录,
+    # 新下载的原始输出写入结果缓存
+    def parse_jobs(self, jobs: list) -> tuple:
+        """Parse the outputs of jobs from request_job, in job order"""
+        return_type = self.RETURN_TYPES[0]
+        if return_type == "IMAGE":
+            def fetch(item):
+                job, index = item
+                if job["cached"]:
+                    with open(job["sources"][index], "rb") as f:
+                        return f.read()
+                if job["data"][index] is None:
+                    job["data"][index] = self.download_output_bytes(job["sources"][index])
+                data = job["data"][index]
+                if not job["cache_key"]:
+                    # 不缓存时不保留下载的字节
+                    job["data"][index] = b""
+                return data
+
+            for job in jobs:
+                if not job["cached"]:
+                    job.setdefault("data", [None] * len(job["sources"]))
+            items = [(job, index) for job in jobs for index in range(len(job["sources"]))]
+            result = self.image_result(self.parse_image_outputs(items, fetch=fetch, with_mask=self.returns_mask()))
+            for job in jobs:
+                if job["cache_key"] and not job["cached"]:
+                    self.store_cached_result(job["cache_key"], return_type, job.pop("data"))
+            return result
 
-            parse_start = time.time()
-            
-            # Handle different return types based on RETURN_TYPES
+        results = []
+        for job in jobs:
+            if job["cached"] and return_type in ("VIDEO", "AUDIO"):
+                # Copy cached videos and audios into the output directory, like a fresh download
+                for path in job["sources"]:
+                    output_path = self.new_output_path(os.path.splitext(path)[1])
+                    shutil.copyfile(path, output_path)
+                    results.append(output_path)
+            else:
+                results.extend(self.parse_outputs(job["sources"], job["cache_key"]))
+        return tuple(results)
+
+    # 单次生成: 请求 API (或命中缓存), 解析输出, 每个阶段的耗时记录到 metrics
+    def run_generation(self, **kwargs):
+        """Run one API job and return its parsed outputs, raising on failure"""
+        model_type = self.get_model_type()
+        start_time = time.perf_counter()
+
+        job = self.request_job(**kwargs)
+        result = self.parse_jobs([job])
+
+        elapsed = time.perf_counter() - start_time
+        metrics.observe("generation_seconds", model_type, elapsed)
+        logger.info(f"Generation of {model_type} with {len(job['sources'])} output(s) took {elapsed:.2f}s")
+
+        return result
+
+    # 把批次输入拆成单独的 API 任务并发执行, 按输入顺序合并结果
+    def run_batch_generation(self, batch_size: int, **kwargs):
+        """Fan a batched BATCH_INPUT out to one API job per element and merge the results"""
+        model_type = self.get_model_type()
+        start_time = time.perf_counter()
+        frames = media.image_frames(kwargs[self.BATCH_INPUT])
+        max_workers = min(batch_size, max(1, int(get_setting("batch_concurrency", BATCH_CONCURRENCY))))
+
+        def run_job(index):
+            job = self.request_job(**{**kwargs, self.BATCH_INPUT: frames[index:index + 1]})
             if self.RETURN_TYPES[0] == "IMAGE":
-                if len(output_urls) == 1:
-                    # 单个图像，直接返回
-                    result = (self.parse_image_output(output_urls[0]),)
-                else:
-                    # 多个图像，合并成一个批次
-                    tensors = [self.parse_image_output(url) for url in output_urls]
-                    result = (torch.cat(tensors, dim=0),)
-            elif self.RETURN_TYPES[0] == "VIDEO":
-                if len(output_urls) == 1:
-                    result = (self.parse_video_output(output_urls[0]),)
-                else:
-                    result = tuple(self.parse_video_output(url) for url in output_urls)
-            elif self.RETURN_TYPES[0] == "AUDIO":
-                if len(output_urls) == 1:
-                    result = (self.parse_audio_output(output_urls[0]),)
-                else:
-                    result = tuple(self.parse_audio_output(url) for url in output_urls)
-            elif self.RETURN_TYPES[0] == "STERING":
-                if len(output_urls) == 1:
-                    result = (output_urls[0],)
-                else:
-                    result = tuple(output_urls)
+                # 任务线程只下载压缩的输出, 全部任务完成后再一次性解码到同一个批次中,
+                # 不会同时持有每个任务的解码结果和合并后的批次
+                if not job["cached"]:
+                    job["data"] = [self.download_output_bytes(url) for url in job["sources"]]
             else:
-                raise ValueError(f"Unsupported return type: {self.RETURN_TYPES[0]}")
-            
-            logger.info(f"[Timing] Output parsing took {time.time() - parse_start:.2f}s")
-            logger.info(f"[Timing] Total generation took {time.time() - start_time:.2f}s")
-            
-            return result
+                job["result"] = self.parse_jobs([job])
+            metrics.observe("generation_seconds", model_type, time.perf_counter() - start_time)
+            return job
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_job, index) for index in range(batch_size)]
+            try:
+                jobs = [future.result() for future in futures]
+            except Exception:
+                # Don't start (and pay for) the remaining jobs once one has failed
+                for future in futures:
+                    future.cancel()
+                raise
+
+        if self.RETURN_TYPES[0] == "IMAGE":
+            result = self.parse_jobs(jobs)
+        else:
+            result = tuple(output for job in jobs for output in job["result"])
+
+        logger.info(
+            f"Batch of {batch_size} jobs with concurrency {max_workers} took {time.perf_counter() - start_time:.2f}s"
+        )
+        return result
+
+    def batch_size(self, **kwargs) -> int:
+        """Number of API jobs this execution fans out to"""
+        if not self.BATCH_INPUT or kwargs.get(self.BATCH_INPUT) is None:
+            return 1
+        return media.image_frames(kwargs[self.BATCH_INPUT]).shape[0]
+
+    # 批次输入生成的多个视频或音频作为一个列表放在同一个输出中, 单个任务的输出与原来相同
+    def format_outputs(self, result: tuple, batch_size: int = 1) -> tuple:
+        """Shape parsed outputs for ComfyUI"""
+        if batch_size > 1 and self.RETURN_TYPES[0] in ("VIDEO", "AUDIO"):
+            return (list(result),)
+        return result
+
+    # 主生成方法
+    def generate(self, **kwargs):
+        """Main generation method"""
+        try:
+            batch_size = self.batch_size(**kwargs)
+            if batch_size > 1:
+                result = self.run_batch_generation(batch_size, **kwargs)
+            else:
+                result = self.run_generation(**kwargs)
+            return self.format_outputs(result, batch_size)
 
         except Exception as e:
+            metrics.increment("errors_total", self.get_model_type(), error=type(e).__name__)
             logger.error(f"Error during generation: {str(e)}")
             logger.exception("Detailed error information:")
 
             if self.RETURN_TYPES[0] == "IMAGE":
+                if self.returns_mask():
+                    return (
+                        torch.zeros((1, 100, 400, 3), dtype=torch.float32),
+                        torch.zeros((1, 100, 400), dtype=torch.float32),
+                    )
                 return (torch.zeros((1, 100, 400, 3), dtype=torch.float32),)
             elif self.RETURN_TYPES[0] == "VIDEO":
                 return (os.path.join("output", "error.mp4"),)
             elif self.RETURN_TYPES[0] == "AUDIO":
                 return (os.path.join("output", "error.wav"),)
-            elif self.RETURN_TYPES[0] == "STERING":
+            elif self.RETURN_TYPES[0] in ("STRING", "STERING"):
                 return (str(e),)
             else:
                 raise ValueError(f"Unsupported return type: {self.RETURN_TYPES[0]}")
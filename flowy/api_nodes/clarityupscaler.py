@@ -1,4 +1,7 @@
+import math
+
 from .base import FlowyApiNode
+from .. import media
 from ..types import STRING, INT, get_api_host
 
 class FlowyClarityUpscale(FlowyApiNode):
@@ -54,12 +57,14 @@ class FlowyClarityUpscale(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
+    BATCH_INPUT = "image"
     FUNCTION = "generate"  # Changed from upscale to match parent class
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to upscale images using AI models.
 - How to use: 
-    - Provide an image to upscale.
+    - Provide an image to upscale. Every image of a batch is upscaled in parallel.
     - Dynamic: HDR, try from 3 - 9.
     - Pattern: Upscale a pattern with seamless tiling.
     - Creativity: Try from 0.3 - 0.9.
@@ -76,8 +81,17 @@ Nodes from https://comflowy.com:
         API_HOST = get_api_host()
         return f"{API_HOST}/api/open/v0/clarityupscaler"
 
+    # 开启 downscaling 时服务端会先把图像缩小到 downscaling_resolution, 上传前在本地缩小即可
+    def downscaled_size(self, kwargs):
+        """Longer side that keeps the shorter side at downscaling_resolution, None without downscaling"""
+        if not kwargs.get("downscaling"):
+            return None
+        frame = media.image_frames(kwargs["image"])[0]
+        height, width = frame.shape[0], frame.shape[1]
+        return math.ceil(kwargs["downscaling_resolution"] * max(height, width) / min(height, width))
+
     def prepare_payload(self, **kwargs) -> dict:
-        image_base64 = self.image_to_base64(kwargs["image"])
+        image_base64 = self.encode_image_input(kwargs["image"], max_resolution=self.downscaled_size(kwargs))
         return {
             "image": image_base64,
             "scale_factor": kwargs["scale_factor"],
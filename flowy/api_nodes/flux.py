@@ -59,6 +59,7 @@ class FlowyFlux(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
     FUNCTION = "generate"
     DESCRIPTION = """Nodes from https://comflowy.com: 
     - Description: A service to generate images using Flux AI.
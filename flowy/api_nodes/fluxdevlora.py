@@ -63,6 +63,7 @@ class FlowyFluxDevLora(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
     FUNCTION = "generate"
     DESCRIPTION = """Nodes from https://comflowy.com: 
     - Description: A service to generate images using Flux AI.
@@ -19,6 +19,7 @@ class FlowyFluxProUltra(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate images using Flux AI.
@@ -16,12 +16,16 @@ class FlowyHailuo(FlowyApiNode):
     RETURN_TYPES = ("VIDEO",)
     RETURN_NAMES = ("video",)
     OUTPUT_IS_PREVIEW = True
+    ASYNC_JOB = True
+    BATCH_INPUT = "image"
+    # Hailuo renders 720p, larger inputs are downscaled by the model anyway
+    INPUT_MAX_RESOLUTION = 1280
     FUNCTION = "generate"
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate videos from images by Hailuo AI.
 - How to use: 
-    - Provide an image and a prompt.
+    - Provide an image and a prompt. Each image of a batch is generated as its own video, the video output is then a list of videos.
     - Make sure to set your API Key using the 'Comflowy Set API Key' node before using this node.
 - Output: Returns the generated video.
 """
@@ -34,7 +38,7 @@ Nodes from https://comflowy.com:
         return f"{API_HOST}/api/open/v0/flowy"
 
     def prepare_payload(self, **kwargs) -> dict:
-        image_base64 = self.image_to_base64(kwargs["image"])
+        image_base64 = self.encode_image_input(kwargs["image"])
         return {
             "image": image_base64,
             "prompt": kwargs["prompt"],
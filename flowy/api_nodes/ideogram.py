@@ -21,6 +21,7 @@ class FlowyIdeogram(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate images using Ideogram AI.
@@ -18,12 +18,16 @@ class FlowyKling(FlowyApiNode):
     RETURN_TYPES = ("VIDEO",)
     RETURN_NAMES = ("video",)
     OUTPUT_IS_PREVIEW = True
+    ASYNC_JOB = True
+    BATCH_INPUT = "image"
+    # Kling renders at most 1080p, larger inputs are downscaled by the model anyway
+    INPUT_MAX_RESOLUTION = 1920
     FUNCTION = "generate"  # Changed from image_to_video to match parent class
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate videos from images by Kling AI.
 - How to use: 
-    - Provide an image and a prompt.
+    - Provide an image and a prompt. Each image of a batch is generated as its own video, the video output is then a list of videos.
     - Make sure to set your API Key using the 'Comflowy Set API Key' node before using this node.
     - Pro costs 1250 per second of video. Standard will cost 300 per second of video.
 - Output: Returns the generated video.
@@ -33,7 +37,7 @@ Nodes from https://comflowy.com:
         return "kling"
 
     def prepare_payload(self, **kwargs) -> dict:
-        image_base64 = self.image_to_base64(kwargs["image"])
+        image_base64 = self.encode_image_input(kwargs["image"])
         return {
             "image": image_base64,
             "prompt": kwargs["prompt"],
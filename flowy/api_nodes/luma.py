@@ -21,12 +21,16 @@ class FlowyLuma(FlowyApiNode):
     RETURN_TYPES = ("VIDEO",)
     RETURN_NAMES = ("video",)
     OUTPUT_IS_PREVIEW = True
+    ASYNC_JOB = True
+    BATCH_INPUT = "image"
+    # Luma renders at most 1080p, larger inputs are downscaled by the model anyway
+    INPUT_MAX_RESOLUTION = 1920
     FUNCTION = "generate"  # Changed from image_to_video to match parent class
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate videos from images by Luma AI.
 - How to use: 
-    - Provide an image and a prompt.
+    - Provide an image and a prompt. Each image of a batch is generated as its own video, the video output is then a list of videos.
     - Loop: Whether the video should loop (end of video is blended with the beginning).
     - Make sure to set your API Key using the 'Comflowy Set API Key' node before using this node.
 - Output: Returns the generated video.
@@ -36,12 +40,13 @@ Nodes from https://comflowy.com:
         return "luma"
 
     def prepare_payload(self, **kwargs) -> dict:
-        image_base64 = self.image_to_base64(kwargs["image"])
+        image_base64 = self.encode_image_input(kwargs["image"])
+        end_image = kwargs.get("end_image_optional")
         return {
             "image": image_base64,
             "prompt": kwargs["prompt"],
             "aspect_ratio": kwargs["aspect_ratio"],
-            "end_image": kwargs.get("end_image_optional"),  # Optional parameter
+            "end_image": self.encode_image_input(end_image) if end_image is not None else None,  # Optional parameter
             "loop": kwargs.get("loop", False),  # Optional parameter with default
             "seed": kwargs["seed"],
         }
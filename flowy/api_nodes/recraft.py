@@ -70,6 +70,7 @@ class FlowyRecraft(FlowyApiNode):
         }
 
     RETURN_TYPES = ("IMAGE",)
+    RESULT_CACHE = True
     DESCRIPTION = """
 Nodes from https://comflowy.com: 
 - Description: A service to generate images using Recraft AI.
@@ -12,9 +12,14 @@ from .schema_to_node import (
 )
 from ...api_key_manager import load_api_key
 
+# 返回透明背景图像的模型, 额外把 alpha 通道作为 MASK 输出
+ALPHA_OUTPUT_MODELS = {"smoretalk/rembg-enhance"}
+
 def create_comfyui_node(schema):
     replicate_model, node_name = name_and_version(schema)
     return_type = get_return_type(schema)
+    if return_type == "IMAGE" and f"{schema['owner']}/{schema['name']}" in ALPHA_OUTPUT_MODELS:
+        return_type = {"image": "IMAGE", "mask": "MASK"}
 
     class ReplicateNode(FlowyApiNode):
         @classmethod
@@ -31,10 +36,17 @@ def create_comfyui_node(schema):
             else (return_type,)
         )
         CATEGORY = "Comflowy Replicate"
+        REPLICATE_MODEL = replicate_model
 
         def get_model_type(self) -> str:
             return "replicate"
 
+        def use_result_cache(self, payload, **kwargs) -> bool:
+            return super().use_result_cache(payload, **kwargs) and not kwargs.get("force_rerun")
+
+        def payload_api_key(self, payload):
+            return payload.get("api_key")
+
         def get_api_key(self) -> str:
             """获取 Comflowy API token"""
             api_key = load_api_key()
@@ -67,9 +79,9 @@ def create_comfyui_node(schema):
                         or self.INPUT_TYPES().get("optional", {}).get(key, (None,))[0]
                     )
                     if input_type == "IMAGE":
-                        kwargs[key] = self.image_to_base64(value)
+                        kwargs[key] = self.encode_image_input(value)
                     elif input_type == "AUDIO":
-                        kwargs[key] = self.audio_to_base64(value)
+                        kwargs[key] = self.encode_audio_input(value)
 
             # Remove empty optional inputs
             optional_inputs = self.INPUT_TYPES().get("optional", {})
@@ -0,0 +1,208 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from .metrics import percentile, registry as metrics
+from .types import (
+    LLM_HEDGE_BUDGET,
+    LLM_HEDGE_BURST,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_WINDOW,
+    get_setting,
+)
+
+logger = logging.getLogger(__name__)
+
+# 对冲请求: 请求在该模型最近延迟的高百分位 (默认 p95) 内还没有返回时, 再发送一个相同的请求,
+# 先成功的结果胜出, 另一个被取消. 对冲次数受预算限制, 最多多发约 10% 的请求
+
+DEFAULT_OPTIONS = {
+    "percentile": LLM_HEDGE_PERCENTILE,
+    "window": LLM_HEDGE_WINDOW,
+    "min_samples": LLM_HEDGE_MIN_SAMPLES,
+    "min_delay": LLM_HEDGE_MIN_DELAY,
+    "budget": LLM_HEDGE_BUDGET,
+    "burst": LLM_HEDGE_BURST,
+}
+
+
+class Cancelled(Exception):
+    """Raised in an attempt that lost the race, instead of waiting for its next retry."""
+
+
+class LatencyWindow:
+    """The last size latencies of a model."""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max(1, int(size)))
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the window, None when it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        return percentile(samples, percent)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeBudget:
+    """
+    Cap the number of hedges relative to the number of requests.
+
+    Every request adds ratio to the budget, up to burst, and a hedge spends 1.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+
+    def on_request(self, ratio, burst):
+        with self._lock:
+            self._tokens = min(float(burst), self._tokens + float(ratio))
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        with self._lock:
+            return self._tokens
+
+
+class Hedger:
+    """
+    Run calls with a hedge: when a call is slower than usual for its model, start a
+    second identical call and return whichever succeeds first.
+
+    Latencies are kept in a rolling window per model. A model without min_samples
+    latencies yet is never hedged.
+
+    Args:
+        options (dict, optional): Overrides of DEFAULT_OPTIONS. Options not given are
+            read from the llm_hedge_<name> settings on each call.
+        clock (callable, optional): Monotonic clock, replaceable in tests.
+    """
+
+    def __init__(self, options=None, clock=time.monotonic):
+        self.options = options or {}
+        self.clock = clock
+        self.budget = HedgeBudget()
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def option(self, name):
+        if name in self.options:
+            return self.options[name]
+        return get_setting(f"llm_hedge_{name}", DEFAULT_OPTIONS[name])
+
+    def window(self, model) -> LatencyWindow:
+        with self._lock:
+            window = self._windows.get(model)
+            if window is None:
+                window = self._windows[model] = LatencyWindow(self.option("window"))
+            return window
+
+    def hedge_delay(self, model):
+        """Seconds after which a call of model is hedged, None while too few latencies are known."""
+        window = self.window(model)
+        if len(window) < max(1, int(self.option("min_samples"))):
+            return None
+        return max(float(self.option("min_delay")), window.percentile(float(self.option("percentile"))))
+
+    def _start(self, model, func, answers, index):
+        cancel = threading.Event()
+
+        def sleep(seconds):
+            if cancel.wait(seconds):
+                raise Cancelled()
+
+        def attempt():
+            start = self.clock()
+            try:
+                result = func(sleep)
+            except BaseException as e:
+                answers.put((index, None, e))
+                return
+            # 失败的一方完成时也记录延迟, 慢请求不会从延迟窗口中消失
+            self.window(model).add(self.clock() - start)
+            answers.put((index, result, None))
+
+        threading.Thread(target=attempt, name=f"flowy-hedge-{index}", daemon=True).start()
+        return cancel
+
+    def run(self, model, func):
+        """
+        Call func, hedged.
+
+        Args:
+            model (str): Model of the call, selects the latency window.
+            func (callable): Makes the call. It is passed a sleep function to wait between
+                retries with, which raises Cancelled once the other call has won.
+
+        Returns:
+            The result of the first call that succeeded.
+
+        Raises:
+            Exception: The error of the first call when all calls failed.
+
+        A request that is already on the wire can't be aborted, the losing call is
+        left to finish in the background and its result is dropped. It is not retried
+        anymore once cancelled.
+        """
+        self.budget.on_request(self.option("budget"), self.option("burst"))
+        delay = self.hedge_delay(model)
+        answers = queue.Queue()
+        cancels = [self._start(model, func, answers, 0)]
+        pending = 1
+        can_hedge = delay is not None
+        first_error = None
+        while True:
+            try:
+                index, result, error = answers.get(timeout=delay if can_hedge else None)
+            except queue.Empty:
+                can_hedge = False
+                if self.budget.try_spend():
+                    logger.info(f"No answer from {model} after {delay:.2f}s, sending a hedged request")
+                    metrics.increment("hedged_requests_total", model)
+                    cancels.append(self._start(model, func, answers, len(cancels)))
+                    pending += 1
+                continue
+
+            pending -= 1
+            if error is None:
+                for cancel in cancels:
+                    cancel.set()
+                if index > 0:
+                    logger.info(f"Hedged request to {model} answered first")
+                return result
+            if first_error is None:
+                first_error = error
+            if pending == 0:
+                raise first_error
+            # 一方失败时不再对冲, 等待另一方的结果
+            can_hedge = False
+
+
+llm_hedger = Hedger()
+
+
+def enabled() -> bool:
+    return bool(get_setting("llm_hedging", False))
+
+
+__all__ = ["Cancelled", "LatencyWindow", "HedgeBudget", "Hedger", "llm_hedger", "enabled"]
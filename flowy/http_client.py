@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .types import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_MAX_BYTES,
+    get_setting,
+)
+
+logger = logging.getLogger(__name__)
+
+# 进程级共享的 HTTP 连接池, 所有 API 节点、LLM 请求和 HTTP 节点都通过它发请求,
+# 避免每次执行节点都重新建立 TCP + TLS 连接
+_session = None
+_session_lock = threading.Lock()
+_options = {}
+
+
+def _option(name, default):
+    if name in _options:
+        return _options[name]
+    return get_setting(name, default)
+
+
+def _create_session():
+    pool_connections = int(_option("http_pool_connections", HTTP_POOL_CONNECTIONS))
+    pool_maxsize = int(_option("http_pool_maxsize", HTTP_POOL_MAXSIZE))
+
+    session = requests.Session()
+    # urllib3 keeps one pool per host, pool_connections bounds how many hosts are cached
+    # and pool_maxsize bounds how many idle keep-alive connections are kept per host.
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=0,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # The session is shared by unrelated nodes, never let cookies leak between them
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    logger.debug(
+        f"Created HTTP session with pool_connections={pool_connections}, pool_maxsize={pool_maxsize}"
+    )
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def configure(**options):
+    """
+    Override transport options and rebuild the shared session.
+
+    Args:
+        http_pool_connections (int, optional): Number of per-host pools to keep.
+        http_pool_maxsize (int, optional): Keep-alive connections kept per host.
+        http_connect_timeout (float, optional): Default connect timeout in seconds.
+        http_read_timeout (float, optional): Default read timeout in seconds.
+    """
+    global _session
+    with _session_lock:
+        _options.update(options)
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+
+def default_timeout():
+    """Return the default (connect, read) timeout tuple."""
+    return (
+        float(_option("http_connect_timeout", HTTP_CONNECT_TIMEOUT)),
+        float(_option("http_read_timeout", HTTP_READ_TIMEOUT)),
+    )
+
+
+def request(method, url, timeout=None, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        timeout (float or tuple, optional): Seconds or (connect, read) seconds.
+            Defaults to default_timeout().
+        **kwargs: Passed through to requests.Session.request.
+
+    Returns:
+        requests.Response: The response.
+    """
+    if timeout is None:
+        timeout = default_timeout()
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+
+def get(url, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def download_to_file(url, path, chunk_size=None, max_bytes=None, **kwargs) -> str:
+    """
+    Stream a URL to disk without holding the body in memory.
+
+    The body is written in chunks to a temporary file next to path and renamed
+    into place only once it is complete, so a failed download never leaves a
+    partial file behind.
+
+    Args:
+        url (str): URL to download.
+        path (str): Final file path.
+        chunk_size (int, optional): Bytes per chunk. Defaults to the download_chunk_size setting.
+        max_bytes (int, optional): Abort when the body is larger than this.
+            Defaults to the download_max_bytes setting.
+        **kwargs: Passed through to request().
+
+    Returns:
+        str: The sha256 hex digest of the downloaded bytes.
+
+    Raises:
+        ValueError: If the body is larger than max_bytes.
+        requests.RequestException: If the request fails.
+    """
+    if chunk_size is None:
+        chunk_size = int(_option("download_chunk_size", DOWNLOAD_CHUNK_SIZE))
+    if max_bytes is None:
+        max_bytes = int(_option("download_max_bytes", DOWNLOAD_MAX_BYTES))
+
+    with request("GET", url, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ValueError(
+                f"Download of {url} is {content_length} bytes, larger than the {max_bytes} bytes limit"
+            )
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=".download_",
+            suffix=".part",
+        )
+        try:
+            checksum = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(
+                            f"Download of {url} exceeded the {max_bytes} bytes limit"
+                        )
+                    checksum.update(chunk)
+                    f.write(chunk)
+            # mkstemp creates the file as 0600, give it the usual permissions of an output file
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    logger.debug(f"Downloaded {size} bytes from {url} to {path}, sha256={checksum.hexdigest()}")
+    return checksum.hexdigest()
+
+
+__all__ = [
+    "get_session",
+    "configure",
+    "default_timeout",
+    "request",
+    "get",
+    "post",
+    "download_to_file",
+]
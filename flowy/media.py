@@ -0,0 +1,465 @@
+import base64
+import hashlib
+import io
+import logging
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .types import ENCODE_CACHE_MAX_ENTRIES, ENCODE_CACHE_MAX_BYTES, get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def open_image(data: bytes) -> Image.Image:
+    """Open encoded image bytes lazily, only the header is parsed until the pixels are needed."""
+    return Image.open(io.BytesIO(data))
+
+
+def has_alpha(img: Image.Image) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _normalize_into(pixels: np.ndarray, target: np.ndarray, mask: np.ndarray = None):
+    if pixels.ndim == 2:
+        np.divide(pixels[..., None], np.float32(255.0), out=target, casting="unsafe")
+    else:
+        np.divide(pixels[..., :3], np.float32(255.0), out=target, casting="unsafe")
+
+    if mask is not None:
+        if pixels.ndim == 3 and pixels.shape[-1] == 4:
+            np.divide(pixels[..., 3], np.float32(255.0), out=mask, casting="unsafe")
+            np.subtract(1.0, mask, out=mask, casting="unsafe")
+        else:
+            mask.fill(0)
+
+
+def decode_image_into(
+    img: Image.Image, out: torch.Tensor, mask_out: torch.Tensor = None, strip_rows: int = None
+) -> torch.Tensor:
+    """
+    Decode a PIL image into a preallocated [H,W,3] float tensor normalized to 0-1.
+
+    The uint8 pixels are normalized straight into out in a single pass, without float
+    temporaries. Grayscale is broadcast to 3 channels. When mask_out ([H,W]) is given it
+    receives the alpha channel as a ComfyUI mask (1 - alpha), or zeros without alpha.
+
+    With strip_rows, the pixels are converted and normalized strip_rows rows at a time,
+    so apart from out only the decoder's own buffer and one strip are held in memory.
+    """
+    alpha = has_alpha(img)
+    if alpha:
+        mode = "RGBA"
+    elif img.mode in ("L", "RGB"):
+        mode = img.mode
+    else:
+        mode = "RGB"
+
+    height = img.size[1]
+    target = out.numpy()
+    mask = mask_out.numpy() if mask_out is not None else None
+    if not strip_rows or strip_rows >= height:
+        if img.mode != mode:
+            img = img.convert(mode)
+        _normalize_into(np.asarray(img), target, mask)
+        return out
+
+    width = img.size[0]
+    img.load()
+    for top in range(0, height, strip_rows):
+        bottom = min(top + strip_rows, height)
+        strip = img.crop((0, top, width, bottom))
+        if strip.mode != mode:
+            strip = strip.convert(mode)
+        _normalize_into(
+            np.asarray(strip), target[top:bottom], mask[top:bottom] if mask is not None else None
+        )
+    return out
+
+
+def strip_rows_for(width, budget_bytes):
+    """Rows per strip so that one RGBA uint8 strip stays within budget_bytes, None to decode at once."""
+    if not budget_bytes:
+        return None
+    return max(1, int(budget_bytes) // (width * 4))
+
+
+def empty_tensor(shape, dtype=torch.float32, memmap_min_bytes=0, directory=None) -> torch.Tensor:
+    """
+    Allocate an uninitialized tensor, backed by a temporary memory-mapped file when
+    it is at least memmap_min_bytes large (0 never maps).
+
+    Mapped tensors live in the page cache, so the OS can write them out under memory
+    pressure instead of the process being killed.
+    """
+    size = int(np.prod(shape)) * torch.empty((), dtype=dtype).element_size()
+    if not memmap_min_bytes or size < memmap_min_bytes:
+        return torch.empty(shape, dtype=dtype)
+
+    with tempfile.NamedTemporaryFile(prefix="flowy_decode_", suffix=".bin", dir=directory, delete=False) as f:
+        path = f.name
+    try:
+        array = np.memmap(path, dtype=torch.empty((), dtype=dtype).numpy().dtype, mode="w+", shape=tuple(shape))
+    finally:
+        # The mapping keeps the data alive, the name is not needed anymore (removal fails on Windows)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    logger.debug(f"Decoding {size / 1024 ** 2:.0f}MB into a memory-mapped tensor")
+    return torch.from_numpy(array)
+
+
+def _video_frame_estimate(container, stream) -> int:
+    if stream.frames:
+        return stream.frames
+    # Some containers don't store the frame count, estimate it from the duration
+    rate = float(stream.average_rate or stream.guessed_rate or 0)
+    if stream.duration and stream.time_base:
+        seconds = float(stream.duration * stream.time_base)
+    elif container.duration:
+        seconds = container.duration / 1_000_000
+    else:
+        seconds = 0
+    return max(1, math.ceil(seconds * rate)) if rate and seconds else 64
+
+
+def decode_video_frames(
+    path, stride=1, max_frames=0, max_resolution=0, dtype=torch.float32, memmap_min_bytes=0, directory=None
+):
+    """
+    Decode a video into a [N,H,W,3] float frame batch normalized to 0-1.
+
+    Frames are decoded one at a time, only every stride-th frame is converted, scaled to
+    max_resolution (longer side, 0 keeps the size) and written into the batch, which is
+    memory-mapped when at least memmap_min_bytes large, see empty_tensor. Needs PyAV.
+
+    Args:
+        path (str): Video file path or URL.
+        stride (int, optional): Keep one frame out of stride.
+        max_frames (int, optional): Stop after this many kept frames, 0 for all.
+        max_resolution (int, optional): Max longer side of the frames in pixels, 0 keeps the size.
+
+    Returns:
+        tuple: (frames tensor, frames per second of the kept frames)
+    """
+    try:
+        import av
+    except ImportError:
+        raise ImportError("Decoding videos requires PyAV, install it with: pip install av")
+
+    stride = max(1, int(stride))
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        height, width = fit_size(stream.codec_context.height, stream.codec_context.width, max_resolution)
+        capacity = math.ceil(_video_frame_estimate(container, stream) / stride)
+        if max_frames:
+            capacity = min(capacity, max_frames)
+        fps = float(stream.average_rate or stream.guessed_rate or 0) / stride
+
+        frames = empty_tensor((capacity, height, width, 3), dtype, memmap_min_bytes, directory)
+        count = 0
+        for index, frame in enumerate(container.decode(stream)):
+            if index % stride:
+                continue
+            if count == frames.shape[0]:
+                # The frame count was underestimated, grow the batch
+                grown = empty_tensor((count * 2, height, width, 3), dtype, memmap_min_bytes, directory)
+                grown[:count].copy_(frames)
+                frames = grown
+            pixels = frame.to_ndarray(width=width, height=height, format="rgb24", interpolation="AREA")
+            np.divide(pixels, np.float32(255.0), out=frames[count].numpy(), casting="unsafe")
+            count += 1
+            if max_frames and count >= max_frames:
+                break
+
+    if count == 0:
+        raise ValueError(f"No frames could be decoded from {path}")
+    return frames[:count], fps
+
+
+# Rows quantized per block, keeps the float scratch buffer small and cache resident
+QUANTIZE_BLOCK_ROWS = 64
+
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def image_frames(image) -> torch.Tensor:
+    """
+    Return a [B,H,W,C] view of an image tensor or numpy array without copying.
+
+    Accepts [B,H,W,C], [B,C,H,W], [H,W,C], [C,H,W] and [H,W] layouts with 1, 3 or 4 channels.
+    """
+    if isinstance(image, np.ndarray):
+        image = torch.from_numpy(image)
+    if not isinstance(image, torch.Tensor):
+        raise ValueError(f"Unsupported image type: {type(image)}")
+
+    channels = (1, 3, 4)
+    if image.dim() == 2:
+        return image[None, :, :, None]
+    if image.dim() == 3:
+        if image.shape[-1] in channels:
+            return image.unsqueeze(0)
+        if image.shape[0] in channels:
+            return image.permute(1, 2, 0).unsqueeze(0)
+    elif image.dim() == 4:
+        if image.shape[-1] in channels:
+            return image
+        if image.shape[1] in channels:
+            return image.permute(0, 2, 3, 1)
+    raise ValueError(f"Unsupported image shape: {tuple(image.shape)}")
+
+
+def fit_size(height, width, max_side):
+    """Return (height, width) scaled down so the longer side is at most max_side, never scaled up."""
+    if not max_side or max(height, width) <= max_side:
+        return height, width
+    scale = max_side / max(height, width)
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+# Box-reduce by the integer part of the scale first, then Lanczos for the rest. Several
+# times cheaper than a fair Lanczos pass on 4K inputs, which upload targets don't need.
+RESIZE_REDUCING_GAP = 1.0
+
+
+def resize_pixels(pixels: np.ndarray, max_side) -> np.ndarray:
+    """
+    Downscale a [H,W,3] uint8 array so its longer side is at most max_side.
+
+    Runs on the quantized frame, before encoding, so only the small image is encoded.
+    Arrays already small enough are returned as is.
+    """
+    height, width = pixels.shape[:2]
+    size = fit_size(height, width, max_side)
+    if size == (height, width):
+        return pixels
+    img = Image.fromarray(pixels).resize(
+        (size[1], size[0]), Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP
+    )
+    return np.asarray(img)
+
+
+def quantize_frame(frame: torch.Tensor) -> np.ndarray:
+    """
+    Convert a [H,W,C] 0-1 float frame to a [H,W,3] uint8 array.
+
+    Clamp, round and cast happen block by block through one small scratch buffer, so
+    no full-size float temporaries are created. Grayscale is broadcast and alpha dropped.
+    """
+    frame = frame.detach()
+    if frame.device.type != "cpu":
+        frame = frame.cpu()
+    if frame.dtype == torch.bfloat16:
+        frame = frame.float()
+    if frame.shape[-1] == 1:
+        frame = frame.expand(-1, -1, 3)
+    elif frame.shape[-1] == 4:
+        frame = frame[..., :3]
+    pixels = frame.numpy()
+
+    height, width, _ = pixels.shape
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    if pixels.dtype == np.uint8:
+        np.copyto(out, pixels)
+        return out
+
+    rows = min(QUANTIZE_BLOCK_ROWS, height)
+    scratch = np.empty((rows, width, 3), dtype=np.float32)
+    for y in range(0, height, rows):
+        block = pixels[y:y + rows]
+        buffer = scratch[:block.shape[0]]
+        np.multiply(block, 255.0, out=buffer)
+        np.clip(buffer, 0.0, 255.0, out=buffer)
+        np.rint(buffer, out=buffer)
+        np.copyto(out[y:y + rows], buffer, casting="unsafe")
+    return out
+
+
+def encode_frame(pixels: np.ndarray, format="JPEG", quality=85) -> bytes:
+    """Encode a [H,W,3] uint8 array."""
+    buffered = io.BytesIO()
+    Image.fromarray(pixels).save(buffered, format=format, quality=quality)
+    return buffered.getvalue()
+
+
+def encode_images(image, format="JPEG", quality=85) -> list:
+    """
+    Encode every frame of an image batch.
+
+    Returns:
+        list[bytes]: One encoded image per batch element, in order.
+    """
+    return [encode_frame(quantize_frame(frame), format, quality) for frame in image_frames(image)]
+
+
+# Inputs larger than this are hashed in parallel chunks, hashlib releases the GIL while hashing
+DIGEST_CHUNK_BYTES = 16 * 1024 * 1024
+
+_digest_executor = None
+_digest_executor_lock = threading.Lock()
+
+
+def _get_digest_executor():
+    global _digest_executor
+    if _digest_executor is None:
+        with _digest_executor_lock:
+            if _digest_executor is None:
+                _digest_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="flowy-digest")
+    return _digest_executor
+
+
+def tensor_digest(value) -> str:
+    """Return a digest of the dtype, shape and contents of a tensor or numpy array."""
+    if isinstance(value, torch.Tensor):
+        value = value.detach()
+        if value.device.type != "cpu":
+            value = value.cpu()
+        if value.dtype == torch.bfloat16:
+            value = value.float()
+        value = value.numpy()
+    value = np.ascontiguousarray(value)
+    data = memoryview(value).cast("B")
+
+    digest = hashlib.sha256(f"{value.dtype}:{value.shape}".encode())
+    if len(data) <= DIGEST_CHUNK_BYTES:
+        digest.update(data)
+    else:
+        chunks = [data[i:i + DIGEST_CHUNK_BYTES] for i in range(0, len(data), DIGEST_CHUNK_BYTES)]
+        for chunk_digest in _get_digest_executor().map(lambda chunk: hashlib.sha256(chunk).digest(), chunks):
+            digest.update(chunk_digest)
+    return digest.hexdigest()
+
+
+class EncodedMedia:
+    """
+    An encoded media input (image, audio) placed in a request payload.
+
+    It is sent as a base64 data URI in JSON bodies and as a binary part in
+    multipart bodies, so the base64 string is only built when it is needed.
+    """
+
+    __slots__ = ("data", "mime_type", "_digest")
+
+    def __init__(self, data: bytes, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+        self._digest = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"EncodedMedia({self.mime_type}, {len(self.data)} bytes)"
+
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64," + base64.b64encode(self.data).decode()
+
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return self._digest
+
+
+def json_default(value):
+    """json.dumps default= hook serializing EncodedMedia values as data URIs."""
+    if isinstance(value, EncodedMedia):
+        return value.data_uri()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class EncodeCache:
+    """
+    A bounded in-memory LRU cache of encoded inputs.
+
+    The same upstream IMAGE or AUDIO is often encoded by several nodes, or again when a
+    node is re-run with other parameters, so encodes are memoized by a digest of the
+    input plus the encode settings.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_encode(self, key, encode):
+        """Return the cached value for key, or call encode() and cache its result."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = encode()
+        size = len(value)
+        if size > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+encode_cache = EncodeCache(
+    int(get_setting("encode_cache_max_entries", ENCODE_CACHE_MAX_ENTRIES)),
+    int(get_setting("encode_cache_max_bytes", ENCODE_CACHE_MAX_BYTES)),
+)
+
+
+__all__ = [
+    "open_image",
+    "has_alpha",
+    "decode_image_into",
+    "strip_rows_for",
+    "empty_tensor",
+    "decode_video_frames",
+    "image_frames",
+    "fit_size",
+    "resize_pixels",
+    "quantize_frame",
+    "encode_frame",
+    "encode_images",
+    "tensor_digest",
+    "EncodedMedia",
+    "json_default",
+    "EncodeCache",
+    "encode_cache",
+]
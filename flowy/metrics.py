@@ -0,0 +1,235 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 进程内的指标注册表: 按 model_type 记录每个阶段的耗时和字节数直方图, 以及按错误类型的计数,
+# 通过 ComfyUI 服务的 /flowy/metrics (Prometheus 文本格式) 和 /flowy/metrics.json 导出
+
+METRIC_PREFIX = "flowy_"
+
+# Upper bounds of the histogram buckets, +Inf is implicit
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(11))  # 1KB .. 1GB
+
+HISTOGRAMS = {
+    "payload_prep_seconds": ("Time spent preparing the request payload, input encoding included", TIME_BUCKETS),
+    "upload_bytes": ("Size of the request body sent to the API", BYTES_BUCKETS),
+    "queue_wait_seconds": ("Time a request waited for the per-model rate limiter", TIME_BUCKETS),
+    "api_latency_seconds": ("Time from sending the request until the API answered with the outputs", TIME_BUCKETS),
+    "download_seconds": ("Time spent downloading one output file", TIME_BUCKETS),
+    "download_bytes": ("Size of one downloaded output file", BYTES_BUCKETS),
+    "decode_seconds": ("Time spent decoding one output image", TIME_BUCKETS),
+    "generation_seconds": ("Total time of one generation, result cache hits included", TIME_BUCKETS),
+}
+
+COUNTERS = {
+    "errors_total": "Failed generations by error class",
+    "result_cache_hits_total": "Generations served from the result cache",
+    "coalesced_requests_total": "Requests that shared the answer of an identical request in flight",
+    "hedged_requests_total": "Duplicate LLM requests sent because the first one was slower than usual",
+}
+
+# Recent samples kept per series to report exact percentiles in the JSON snapshot
+SAMPLE_WINDOW = 1024
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class _Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            **{f"p{percent}": percentile(samples, percent) for percent in PERCENTILES},
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of the histograms and counters declared in HISTOGRAMS and COUNTERS.
+
+    Every series is labelled by model_type, counters can carry extra labels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, model_type, value):
+        """Record one value of a histogram."""
+        if name not in HISTOGRAMS:
+            raise ValueError(f"Unknown histogram: {name}")
+        with self._lock:
+            histogram = self._histograms.get((name, model_type))
+            if histogram is None:
+                histogram = self._histograms[(name, model_type)] = _Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, model_type, amount=1, **labels):
+        """Add to a counter."""
+        if name not in COUNTERS:
+            raise ValueError(f"Unknown counter: {name}")
+        key = (name, model_type, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, model_type):
+        """Observe the duration of the with block in seconds, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, model_type, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """
+        Return all series as JSON-serializable data.
+
+        Returns:
+            dict: {"histograms": {name: {model_type: {count, sum, mean, max, p50, ...}}},
+                "counters": {name: [{"model_type": ..., <labels>, "value": ...}]}}
+        """
+        with self._lock:
+            histograms = {}
+            for (name, model_type), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, {})[model_type] = histogram.snapshot()
+            counters = {}
+            for (name, model_type, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({"model_type": model_type, **dict(labels), "value": value})
+        return {"histograms": histograms, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        """Return all series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in HISTOGRAMS.items():
+                series = sorted(
+                    (model_type, histogram)
+                    for (histogram_name, model_type), histogram in self._histograms.items()
+                    if histogram_name == name
+                )
+                if not series:
+                    continue
+                metric = METRIC_PREFIX + name
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for model_type, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + (float("inf"),), histogram.bucket_counts):
+                        cumulative += count
+                        labels = _format_labels((("model_type", model_type), ("le", _format_value(bound))))
+                        lines.append(f"{metric}_bucket{labels} {cumulative}")
+                    labels = _format_labels((("model_type", model_type),))
+                    lines.append(f"{metric}_sum{labels} {_format_value(histogram.sum)}")
+                    lines.append(f"{metric}_count{labels} {histogram.count}")
+
+            for name, help_text in COUNTERS.items():
+                series = sorted(
+                    (model_type, labels, value)
+                    for (counter_name, model_type, labels), value in self._counters.items()
+                    if counter_name == name
+                )
+                if not series:
+                    continue
+                metric = METRIC_PREFIX + name
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for model_type, labels, value in series:
+                    lines.append(f"{metric}{_format_labels((('model_type', model_type),) + labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = MetricsRegistry()
+
+
+def register_routes():
+    """
+    Expose the registry on the ComfyUI server as /flowy/metrics (Prometheus text)
+    and /flowy/metrics.json. Does nothing when not running inside ComfyUI.
+
+    Returns:
+        bool: Whether the routes were registered.
+    """
+    try:
+        from aiohttp import web
+        from server import PromptServer
+    except ImportError:
+        logger.debug("ComfyUI server is not available, metrics routes are not registered")
+        return False
+
+    server = getattr(PromptServer, "instance", None)
+    if server is None:
+        return False
+
+    @server.routes.get("/flowy/metrics")
+    async def prometheus_metrics(request):
+        return web.Response(
+            body=registry.prometheus_text().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    @server.routes.get("/flowy/metrics.json")
+    async def json_metrics(request):
+        return web.json_response(registry.snapshot())
+
+    logger.info("Registered metrics routes /flowy/metrics and /flowy/metrics.json")
+    return True
+
+
+__all__ = ["MetricsRegistry", "registry", "register_routes", "HISTOGRAMS", "COUNTERS"]
@@ -3,6 +3,7 @@ import json
 import logging
 from .types import STRING
 from .api_key_manager import save_api_key
+from .metrics import register_routes as register_metrics_routes
 
 # 设置日志
 logging.basicConfig(level=logging.DEBUG)
@@ -18,7 +19,7 @@ from .nodes_omost import (
 
 from .nodes_json import FlowyPreviewJSON, FlowyExtractJSON, ComflowyLoadJSON
 from .nodes_http import FlowyHttpRequest
-from .nodes_llm import FlowyLLM
+from .nodes_llm import FlowyLLM, FlowyLLMBatch
 from .api_nodes import (
     FlowyClarityUpscale,
     FlowyFlux,
@@ -33,6 +34,7 @@ from .api_nodes import (
 )
 
 from .nodes_previewvideo import PreviewVideo
+from .nodes_video import FlowyVideoToImages
 
 API_KEY_FILE = os.path.join(os.path.dirname(__file__), "api_key.json")
 
@@ -68,9 +70,13 @@ class ComflowySetAPIKey:
         print("Comflowy API Key has been set globally")
         return ()
 
+# 在 ComfyUI 服务上注册 /flowy/metrics 和 /flowy/metrics.json
+register_metrics_routes()
+
 NODE_CLASS_MAPPINGS = {
     "Comflowy_Http_Request": FlowyHttpRequest,
     "Comflowy_LLM": FlowyLLM,
+    "Comflowy_LLM_Batch": FlowyLLMBatch,
     "Comflowy_Preview_JSON": FlowyPreviewJSON,
     "Comflowy_Extract_JSON": FlowyExtractJSON,
     "Comflowy_Load_JSON": ComflowyLoadJSON,
@@ -86,6 +92,7 @@ NODE_CLASS_MAPPINGS = {
     "Comflowy_Recraft": FlowyRecraft,
     "Comflowy_Hailuo": FlowyHailuo,
     "Comflowy_Preview_Video": PreviewVideo,
+    "Comflowy_Video_To_Images": FlowyVideoToImages,
     "Comflowy_Luma": FlowyLuma,
     "Comflowy_Kling": FlowyKling,
     "Comflowy_Flux_Pro_Ultra": FlowyFluxProUltra,
@@ -97,6 +104,7 @@ NODE_CLASS_MAPPINGS = {
 NODE_DISPLAY_NAME_MAPPINGS = {
     "Comflowy_Http_Request": "Comflowy Http Request",
     "Comflowy_LLM": "Comflowy LLM",
+    "Comflowy_LLM_Batch": "Comflowy LLM Batch",
     "Comflowy_Preview_JSON": "Comflowy Preview JSON",
     "Comflowy_Extract_JSON": "Comflowy Extract JSON",
     "Comflowy_Load_JSON": "Comflowy Load JSON",
@@ -112,6 +120,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "Comflowy_Recraft": "Comflowy Recraft",
     "Comflowy_Hailuo": "Comflowy Hailuo",
     "Comflowy_Preview_Video": "Comflowy Preview Video",
+    "Comflowy_Video_To_Images": "Comflowy Video To Images",
     "Comflowy_Luma": "Comflowy Luma",
     "Comflowy_Kling": "Comflowy Kling",
     "Comflowy_Flux_Pro_Ultra": "Comflowy Flux Pro Ultra",
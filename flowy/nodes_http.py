@@ -12,6 +12,7 @@ from .types import (
     STRING,
     STRING_ML,
 )
+from . import http_client
 
 class FlowyHttpRequest:
     @classmethod
@@ -45,26 +46,15 @@ Nodes from https://comflowy.com:
                 raise ValueError(f"Invalid headers or body: {e}")
             print("http request with", url, headers, body)
 
-            response = None
-            if method == "GET":
-                response = requests.get(url, headers=headers, timeout=timeout)
-            elif method == "POST":
-                response = requests.post(
-                    url, headers=headers, json=body, timeout=timeout
-                )
-            elif method == "PUT":
-                response = requests.put(
-                    url, headers=headers, json=body, timeout=timeout
-                )
-            elif method == "DELETE":
-                response = requests.delete(url, headers=headers, timeout=timeout)
-            elif method == "PATCH":
-                response = requests.patch(
-                    url, headers=headers, json=body, timeout=timeout
-                )
-            else:
+            if method not in HTTP_REQUEST_METHOD:
                 raise ValueError(f"Invalid method {method}")
 
+            # GET and DELETE requests are sent without a body
+            body_kwargs = {} if method in ("GET", "DELETE") else {"json": body}
+            response = http_client.request(
+                method, url, headers=headers, timeout=timeout, **body_kwargs
+            )
+
             response.raise_for_status()  # Raise an HTTPError for bad responses
 
             ret = response.json()
@@ -1,15 +1,69 @@
+import json
 import logging
+import time
 from .api_key_manager import load_api_key
 from .types import (
     API_HOST,
+    BOOLEAN_FALSE,
     LLM_MODELS,
+    LLM_STREAM_UI_INTERVAL,
     STRING,
     STRING_ML,
+    get_setting,
 )
-from .utils import llm_request
+from .utils import llm_batch_request, llm_request, parse_prompt_list
 
 logger = logging.getLogger(__name__)
 
+
+class TextProgress:
+    """
+    Show the partial answer of a node in the ComfyUI frontend while it is generated.
+
+    Uses the progress text of ComfyUI (PromptServer.send_progress_text) when the server
+    has it, otherwise sends a "comflowy.llm.text" event with the node id and the text.
+    Updates are throttled to one per interval seconds, the last one is always sent
+    by flush. Does nothing outside ComfyUI or without a node id.
+    """
+
+    def __init__(self, node_id, interval=LLM_STREAM_UI_INTERVAL, clock=time.monotonic):
+        self.node_id = node_id
+        self.interval = interval
+        self.clock = clock
+        self.server = self._get_server() if node_id is not None else None
+        self._sent_at = None
+        self._pending = None
+
+    @staticmethod
+    def _get_server():
+        try:
+            from server import PromptServer
+        except ImportError:
+            return None
+        return getattr(PromptServer, "instance", None)
+
+    def __call__(self, text):
+        self._pending = text
+        now = self.clock()
+        if self._sent_at is None or now - self._sent_at >= self.interval:
+            self._sent_at = now
+            self.flush()
+
+    def flush(self):
+        text, self._pending = self._pending, None
+        if self.server is None or text is None:
+            return
+        try:
+            if hasattr(self.server, "send_progress_text"):
+                self.server.send_progress_text(text, self.node_id)
+            else:
+                self.server.send_sync(
+                    "comflowy.llm.text", {"node": self.node_id, "text": text}, self.server.client_id
+                )
+        except Exception as e:
+            # 界面更新失败不影响生成
+            logger.debug(f"Failed to send partial LLM text: {e}")
+
 class FlowyLLM:
     """
     A node for making requests to the Comflowy LLM service.
@@ -22,7 +76,13 @@ class FlowyLLM:
                 "system_prompt": STRING_ML,
                 "llm_model": (LLM_MODELS,),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFFFFFFFFFF}),
-            }
+            },
+            "optional": {
+                "bypass_cache": BOOLEAN_FALSE,
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING",)
@@ -35,11 +95,13 @@ Nodes from https://comflowy.com:
 - How to use: 
     - Provide a prompt and a system prompt to generate a response from the LLM model.
     - Choose the LLM model from the available options.
+    - Answers are cached on disk by model, prompts, seed and max tokens. Change the seed or enable bypass_cache to get a new answer.
+    - The answer is streamed and shown on the node while it is generated.
     - Make sure to set your API Key using the 'Comflowy Set API Key' node before using this node.
 - Output: Return the generated text from the LLM model.
 """
 
-    def llm_request(self, prompt, system_prompt, llm_model, seed, timeout=10):
+    def llm_request(self, prompt, system_prompt, llm_model, seed, bypass_cache=False, unique_id=None, timeout=10):
         """
         Make a request to the Comflowy LLM service.
         
@@ -48,6 +110,8 @@ Nodes from https://comflowy.com:
             system_prompt (str): The system prompt for the LLM.
             llm_model (str): The LLM model to use.
             seed (int): The seed for random number generation.
+            bypass_cache (bool, optional): Ignore and don't update the LLM answer cache.
+            unique_id (str, optional): Node id the partial answer is shown on, set by ComfyUI.
             timeout (int, optional): Timeout for the request in seconds. Defaults to 10.
         
         Returns:
@@ -64,16 +128,108 @@ Nodes from https://comflowy.com:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
+        # llm_streaming 设置为 false 时等待完整回答, 结果与流式相同
+        progress = None
+        if get_setting("llm_streaming", True):
+            progress = TextProgress(unique_id, float(get_setting("llm_stream_ui_interval", LLM_STREAM_UI_INTERVAL)))
         try:
             generated_text = llm_request(
                 prompt=prompt, 
                 llm_model=llm_model, 
                 system_prompt=system_prompt, 
                 api_key=api_key, 
-                max_tokens=4000, 
-                timeout=10
+                max_tokens=4000,
+                seed=seed,
+                use_cache=not bypass_cache,
+                on_text=progress,
             )
+            if progress is not None:
+                progress.flush()
             return {"ui": {"text": [generated_text]}, "result": (generated_text,)}
         except Exception as e:
             logger.error(f"Error in LLM request: {str(e)}")
-            return {"ui": {"text": [str(e)]}, "result": (str(e),)}
\ No newline at end of file
+            return {"ui": {"text": [str(e)]}, "result": (str(e),)}
+
+class FlowyLLMBatch:
+    """
+    A node sending a list of prompts to the Comflowy LLM service concurrently.
+    """
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "prompts": STRING_ML,
+                "system_prompt": STRING_ML,
+                "llm_model": (LLM_MODELS,),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFFFFFFFFFF}),
+            },
+            "optional": {
+                "bypass_cache": BOOLEAN_FALSE,
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("texts", "json")
+    OUTPUT_IS_LIST = (True, False)
+    FUNCTION = "llm_batch_request"
+    OUTPUT_NODE = True
+    CATEGORY = "Comflowy"
+    DESCRIPTION = """
+Nodes from https://comflowy.com: 
+- Description: Send a list of prompts to a LLM model at the same time, and get the responses in order.
+- How to use: 
+    - Provide one prompt per line, or a JSON list of prompts, and a system prompt shared by all prompts.
+    - Prompt i is sent with seed + i, so repeating a prompt gives different variants.
+    - A failed prompt doesn't stop the others, its text is empty and its error is in the JSON output.
+    - Make sure to set your API Key using the 'Comflowy Set API Key' node before using this node.
+- Output: Return the generated texts as a list, and a JSON list of {prompt, text, error}.
+"""
+
+    def llm_batch_request(self, prompts, system_prompt, llm_model, seed, bypass_cache=False):
+        """
+        Make concurrent requests to the Comflowy LLM service.
+
+        Args:
+            prompts (str): One prompt per line, or a JSON list of prompts.
+            system_prompt (str): The system prompt for the LLM.
+            llm_model (str): The LLM model to use.
+            seed (int): The seed of the first prompt.
+            bypass_cache (bool, optional): Ignore and don't update the LLM answer cache.
+
+        Returns:
+            dict: A dictionary containing the UI output and the result.
+        """
+        seed = seed & 0xFFFFFFFF
+        prompt_list = parse_prompt_list(prompts)
+        if not prompt_list:
+            raise ValueError("No prompts given, provide one prompt per line or a JSON list of prompts")
+
+        api_key = load_api_key()
+        if not api_key:
+            error_msg = "API Key is not set. Please use the 'Comflowy Set API Key' node to set a global API Key before using this node."
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        results = llm_batch_request(
+            prompt_list,
+            system_prompt,
+            llm_model,
+            api_key,
+            max_tokens=4000,
+            seed=seed,
+            use_cache=not bypass_cache,
+        )
+        errors = [error for _, error in results if error is not None]
+        if len(errors) == len(results):
+            raise Exception(f"All {len(results)} LLM prompts failed, first error: {errors[0]}")
+
+        texts = [text or "" for text, _ in results]
+        output = json.dumps(
+            [
+                {"prompt": prompt, "text": text, "error": error}
+                for prompt, (text, error) in zip(prompt_list, results)
+            ],
+            ensure_ascii=False,
+            indent=2,
+        )
+        return {"ui": {"text": [output]}, "result": (texts, output)}
@@ -16,8 +16,8 @@ from .lib_omost.greedy_encode import (
 )
 
 CATEGORY = "Comflowy/Omost"
-from .utils import llm_request, logger
-from .types import LLM_MODELS, STRING
+from .utils import is_canvas_json, llm_request, logger, race_llm_requests
+from .types import BOOLEAN_FALSE, LLM_MODELS, STRING
 from .api_key_manager import load_api_key  # Add this import
 
 CANVAS_SIZE = 90
@@ -96,6 +96,7 @@ Example:
 }
 """
 
+
 # 运行 LLM 生成区域描述
 class OmostLLMNode:
     @classmethod
@@ -106,6 +107,10 @@ class OmostLLMNode:
                 "llm_model": (LLM_MODELS,),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFFFFFFFFFF}),
             },
+            "optional": {
+                "bypass_cache": BOOLEAN_FALSE,
+                "race_models": ("STRING", {"default": ""}),
+            },
         }
     RETURN_TYPES = (
         "OMOST_CANVAS_CONDITIONING",
@@ -118,8 +123,23 @@ class OmostLLMNode:
     FUNCTION = "run_llm"
     CATEGORY = CATEGORY
 
-    def run_llm(self, prompt: str, llm_model: str, seed: int) -> Tuple[list[OmostCanvasCondition]]:
-        """Run LLM to generate area conditioning."""
+    # 竞速模式: 同一个请求同时发给多个模型, 第一个有效的画布胜出
+    def parse_race_models(self, llm_model: str, race_models: str) -> list[str]:
+        """llm_model followed by the comma-separated race_models, without duplicates"""
+        models = [llm_model]
+        for model in (race_models or "").split(","):
+            model = model.strip()
+            if not model or model in models:
+                continue
+            if model not in LLM_MODELS:
+                raise ValueError(f"Unknown race model {model}, choose from {', '.join(LLM_MODELS)}")
+            models.append(model)
+        return models
+
+    def run_llm(
+        self, prompt: str, llm_model: str, seed: int, bypass_cache: bool = False, race_models: str = ""
+    ) -> Tuple[list[OmostCanvasCondition]]:
+        """Run LLM to generate area conditioning. With race_models, the first valid canvas of the models wins."""
         if seed > 0xFFFFFFFF:
             seed = seed & 0xFFFFFFFF
             logger.warning("Seed is too large. Truncating to 32-bit: %d", seed)
@@ -128,8 +148,31 @@ class OmostLLMNode:
         if not api_key:
             raise ValueError("API Key is not set. Please use the 'Comflowy Set API Key' node to set a global API Key before using this node.")
 
+        models = self.parse_race_models(llm_model, race_models)
         try:
-            generated_text = llm_request(prompt=prompt, llm_model=llm_model, system_prompt=system_prompt, api_key=api_key, max_tokens=4000, timeout=10)
+            if len(models) > 1:
+                winner, generated_text = race_llm_requests(
+                    prompt,
+                    system_prompt,
+                    models,
+                    api_key,
+                    validate=is_canvas_json,
+                    max_tokens=4000,
+                    seed=seed,
+                    use_cache=not bypass_cache,
+                )
+                logger.info("Canvas generated by %s", winner)
+            else:
+                generated_text = llm_request(
+                    prompt=prompt,
+                    llm_model=llm_model,
+                    system_prompt=system_prompt,
+                    api_key=api_key,
+                    max_tokens=4000,
+                    seed=seed,
+                    use_cache=not bypass_cache,
+                    validate=is_canvas_json,
+                )
             # If the generated text contains extra characters, such as "```json" or "```", remove the line
             generated_text = generated_text.replace("```json", "").replace("```", "")
 
@@ -21,6 +21,12 @@ class PreviewVideo:
         logger.info(f"PreviewVideo.load_video called with video: {video}")
         logger.info(f"Video type: {type(video)}")
 
+        # 批次生成的视频节点输出视频列表, 预览第一个视频, 其他视频保存在输出目录中
+        if isinstance(video, (list, tuple)):
+            if len(video) > 1:
+                logger.info(f"Previewing the first of {len(video)} videos, the others are: {list(video[1:])}")
+            video = video[0] if video else None
+
         # 确保视频路径是有效的字符串
         if not video or not isinstance(video, str):
             logger.error(f'Invalid video path or type: {video}')
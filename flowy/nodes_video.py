@@ -0,0 +1,101 @@
+import os
+import logging
+import uuid
+
+import folder_paths
+
+from . import http_client, media, retry_policy
+from .api_nodes.base import DECODE_DTYPES
+from .types import VIDEO_MEMMAP_MIN_BYTES, get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class FlowyVideoToImages:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "frame_stride": ("INT", {"default": 1, "min": 1, "max": 1000}),
+                "max_frames": ("INT", {"default": 0, "min": 0, "max": 100000}),
+                "max_resolution": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 8}),
+            },
+            "optional": {
+                "video": ("VIDEO",),
+                "video_uri": ("VIDEO_URI",),
+            },
+        }
+
+    CATEGORY = "Comflowy"
+    RETURN_TYPES = ("IMAGE", "FLOAT", "INT")
+    RETURN_NAMES = ("images", "fps", "frame_count")
+    FUNCTION = "decode"
+    DESCRIPTION = """
+Nodes from https://comflowy.com:
+- Description: Decode the frames of a video into an image batch.
+- How to use:
+    - Connect the video output of a video node (Kling, Luma, Hailuo), or the video URI output of a Replicate node.
+    - frame_stride: Keep one frame out of frame_stride.
+    - max_frames: Stop after this many frames, 0 decodes the whole video.
+    - max_resolution: Scale frames down so their longer side is at most this, 0 keeps the video size.
+    - Long videos are decoded into a memory-mapped buffer instead of RAM.
+    - A video URI is downloaded to the temp directory and deleted once decoded.
+    - Requires PyAV (pip install av).
+- Output: Returns the frames, the frame rate of the returned frames, and their number.
+"""
+
+    # 视频 URI 先下载到 ComfyUI 的临时目录, 解码后删除; 本地视频直接解码
+    def resolve_video(self, video=None, video_uri=None) -> tuple:
+        """Return a local path of the connected video, and whether it is a download to delete after decoding"""
+        if isinstance(video, (list, tuple)):
+            # 批次生成的视频节点输出视频列表, 解码第一个视频
+            if len(video) > 1:
+                logger.warning(f"Got {len(video)} videos, only the first one is decoded")
+            video = video[0] if video else None
+        if video:
+            if not os.path.exists(video):
+                raise ValueError(f"Video file does not exist at path: {video}")
+            return video, False
+        if not video_uri:
+            raise ValueError("Connect a video or a video URI")
+
+        extension = os.path.splitext(video_uri.split("?", 1)[0])[1] or ".mp4"
+        path = os.path.join(folder_paths.get_temp_directory(), f"video_{uuid.uuid4().hex}{extension}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            retry_policy.call(
+                lambda: http_client.download_to_file(video_uri, path),
+                retry_policy.get_policy("download"),
+                f"GET {video_uri}",
+            )
+        except Exception:
+            self.remove_download(path)
+            raise
+        return path, True
+
+    def remove_download(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove downloaded video {path}: {e}")
+
+    def decode(self, frame_stride, max_frames, max_resolution, video=None, video_uri=None):
+        path, downloaded = self.resolve_video(video, video_uri)
+        try:
+            frames, fps = media.decode_video_frames(
+                path,
+                stride=frame_stride,
+                max_frames=max_frames,
+                max_resolution=max_resolution,
+                dtype=DECODE_DTYPES[get_setting("image_decode_dtype", "float32")],
+                memmap_min_bytes=int(get_setting("video_decode_memmap_min_bytes", VIDEO_MEMMAP_MIN_BYTES)),
+                directory=get_setting("image_decode_memmap_dir"),
+            )
+        finally:
+            # 帧已解码到 tensor (或内存映射文件) 中, 不再需要下载的视频
+            if downloaded:
+                self.remove_download(path)
+        logger.info(f"Decoded {frames.shape[0]} frame(s) of {tuple(frames.shape[1:3])} from {video_uri if downloaded else path}")
+        return (frames, fps, frames.shape[0])
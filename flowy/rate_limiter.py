@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .types import (
+    RATE_LIMIT_MAX_IN_FLIGHT,
+    RATE_LIMIT_REQUESTS_PER_SECOND,
+    RATE_LIMIT_MAX_QUEUE_WAIT,
+    get_setting,
+)
+
+logger = logging.getLogger(__name__)
+
+# 按 (model_type, API host) 共享的限流器, 限额按每个 API key 计算, 乘以 key 池的大小:
+# 限制同时进行的请求数, 用令牌桶平滑每秒请求数,
+# 等待的请求按到达顺序 (FIFO) 放行, 超过最长排队时间则放弃,
+# 避免多个工作流同时请求同一个模型时产生成批的 429 和无效重试. 默认不限制, 由 rate_limits 设置开启
+
+DEFAULT_LIMITS = {
+    "max_in_flight": RATE_LIMIT_MAX_IN_FLIGHT,
+    "requests_per_second": RATE_LIMIT_REQUESTS_PER_SECOND,
+    "burst": None,
+    "max_queue_wait": RATE_LIMIT_MAX_QUEUE_WAIT,
+}
+
+
+class LimiterTimeout(TimeoutError):
+    """Raised when a request waited longer than max_queue_wait for its turn."""
+
+
+class RateLimiter:
+    """
+    Concurrency and rate limit with a fair FIFO queue.
+
+    Args:
+        max_in_flight (int): Requests allowed at the same time, 0 for no limit.
+        requests_per_second (float): Token bucket refill rate, 0 for no limit.
+        burst (float, optional): Token bucket capacity. Defaults to max(1, requests_per_second).
+        max_queue_wait (float): Seconds a request may wait before LimiterTimeout is raised.
+    """
+
+    def __init__(self, max_in_flight=0, requests_per_second=0, burst=None, max_queue_wait=RATE_LIMIT_MAX_QUEUE_WAIT, name=""):
+        self.name = name
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._in_flight = 0
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self.configure(max_in_flight, requests_per_second, burst, max_queue_wait)
+        self._tokens = self.burst
+
+    def configure(self, max_in_flight=0, requests_per_second=0, burst=None, max_queue_wait=RATE_LIMIT_MAX_QUEUE_WAIT):
+        """Change the limits, waiting requests are re-evaluated against the new values."""
+        with self._cond:
+            self.max_in_flight = int(max_in_flight or 0)
+            self.requests_per_second = float(requests_per_second or 0)
+            self.burst = float(burst) if burst else max(1.0, self.requests_per_second)
+            self.max_queue_wait = float(max_queue_wait)
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def _take_token(self):
+        """Take a token if one is available. Returns 0 on success, otherwise the seconds until the next token."""
+        if self.requests_per_second <= 0:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.requests_per_second)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.requests_per_second
+
+    def acquire(self, timeout=None) -> float:
+        """
+        Wait for a free slot and a token, in order of arrival.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most. Defaults to max_queue_wait.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            LimiterTimeout: If no slot was free in time.
+        """
+        start = time.monotonic()
+        deadline = start + (self.max_queue_wait if timeout is None else timeout)
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    has_slot = self.max_in_flight <= 0 or self._in_flight < self.max_in_flight
+                    if self._queue[0] is ticket and has_slot:
+                        wait = self._take_token()
+                        if wait == 0:
+                            self._queue.popleft()
+                            self._in_flight += 1
+                            # The next request in line may be able to go as well
+                            self._cond.notify_all()
+                            return time.monotonic() - start
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LimiterTimeout(
+                            f"Waited {time.monotonic() - start:.1f}s for {self.name or 'the API'}, "
+                            f"{self._in_flight} request(s) in flight and {len(self._queue) - 1} queued"
+                        )
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    # 重试的请求已经占有名额, 只从令牌桶取令牌, 不排在等待名额的请求后面
+    def wait_for_token(self, timeout=None) -> float:
+        """
+        Wait for a token without taking a slot or joining the queue, for a retry of a
+        request that already holds its slot.
+
+        Returns:
+            float: Seconds spent waiting, 0 at once without a requests_per_second limit.
+
+        Raises:
+            LimiterTimeout: If no token was available in time.
+        """
+        start = time.monotonic()
+        deadline = start + (self.max_queue_wait if timeout is None else timeout)
+        with self._cond:
+            while True:
+                wait = self._take_token()
+                if wait == 0:
+                    return time.monotonic() - start
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LimiterTimeout(f"Waited {time.monotonic() - start:.1f}s for a token of {self.name or 'the API'}")
+                self._cond.wait(min(wait, remaining))
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Hold a slot for the duration of the with block, yielding the seconds spent waiting."""
+        waited = self.acquire(timeout)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limits_for(model_type):
+    """
+    Return the limits of a model, from the rate_limits setting, e.g.
+    {"rate_limits": {"default": {"max_in_flight": 4}, "kling": {"requests_per_second": 0.5}}}
+    """
+    overrides = get_setting("rate_limits") or {}
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(overrides.get("default") or {})
+    limits.update(overrides.get(model_type) or {})
+    return limits
+
+
+def get_limiter(model_type, host, api_keys=1) -> RateLimiter:
+    """
+    Return the limiter shared by all requests to model_type on host, updated to the current settings.
+
+    The limits are per API key, they are multiplied by api_keys, the size of the key pool
+    the requests are spread over.
+    """
+    limits = limits_for(model_type)
+    scale = max(1, int(api_keys or 1))
+    if scale > 1:
+        limits = dict(limits)
+        for name in ("max_in_flight", "requests_per_second", "burst"):
+            if limits.get(name):
+                limits[name] = limits[name] * scale
+    key = (model_type, host)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(name=f"{model_type} on {host}", **limits)
+            logger.debug(f"Created rate limiter for {model_type} on {host}: {limits}")
+            return limiter
+    limiter.configure(**limits)
+    return limiter
+
+
+__all__ = ["RateLimiter", "LimiterTimeout", "get_limiter", "limits_for"]
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from .media import EncodedMedia
+from .types import RESULT_CACHE_MAX_BYTES, get_setting
+
+logger = logging.getLogger(__name__)
+
+# 基于内容寻址的结果缓存: 以 model_type + payload 的规范化哈希为 key,
+# 保存 API 返回的原始输出文件, 相同参数重新运行时跳过 API 请求和下载
+
+
+# 缓存默认放在 ComfyUI 的用户目录下 (没有用户目录的旧版本放在临时目录), 不写入插件自己的目录
+def default_cache_dir(name: str) -> str:
+    """Directory of the named cache under ComfyUI's user directory, or its temp directory"""
+    import folder_paths
+
+    get_user_directory = getattr(folder_paths, "get_user_directory", None)
+    base = get_user_directory() if get_user_directory is not None else folder_paths.get_temp_directory()
+    return os.path.join(base, "flowy", "cache", name)
+
+
+# Payload fields that don't change the result and must not be part of the key
+IGNORED_PAYLOAD_KEYS = ("api_key",)
+
+
+def _canonical(value):
+    """Replace large or non-JSON values with their digest so the payload can be hashed cheaply."""
+    if isinstance(value, dict):
+        return {
+            str(k): _canonical(v)
+            for k, v in value.items()
+            if k not in IGNORED_PAYLOAD_KEYS
+        }
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, EncodedMedia):
+        return "sha256:" + value.digest()
+    if isinstance(value, str) and value.startswith("data:"):
+        return "sha256:" + hashlib.sha256(value.encode()).hexdigest()
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().contiguous().numpy()
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return f"ndarray:{value.dtype}:{list(value.shape)}:{digest}"
+    if isinstance(value, (bytes, bytearray)):
+        return "sha256:" + hashlib.sha256(value).hexdigest()
+    return value
+
+
+def canonical_hash(*values) -> str:
+    """Return a stable sha256 hex digest of JSON-like values."""
+    canonical = json.dumps(
+        _canonical(list(values)), sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+class DiskCache:
+    """
+    A size-capped on-disk cache of file entries with LRU eviction.
+
+    Every entry is a directory holding meta.json and the cached files. Entries are
+    written to a temporary directory first and renamed into place, so readers never
+    see a half written entry. With a ttl, entries older than ttl seconds are misses.
+    """
+
+    META_FILE = "meta.json"
+
+    def __init__(self, directory, max_bytes, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> [size, last_used], loaded lazily from disk
+        self._index = None
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                meta_path = os.path.join(entry_dir, self.META_FILE)
+                if key.startswith(".") or not os.path.exists(meta_path):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                self._index[key] = [_dir_size(entry_dir), os.path.getmtime(meta_path)]
+
+    def get(self, key):
+        """
+        Look up an entry.
+
+        Returns:
+            tuple or None: (meta, file_paths) on a hit, None on a miss.
+        """
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                return None
+            entry_dir = self._entry_dir(key)
+            meta_path = os.path.join(entry_dir, self.META_FILE)
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                now = time.time()
+                if self.ttl and now - meta.get("created_at", 0) > self.ttl:
+                    logger.debug(f"Dropping expired cache entry {key}")
+                    self._remove(key)
+                    return None
+                os.utime(meta_path, (now, now))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+                self._remove(key)
+                return None
+            self._index[key][1] = now
+        files = [os.path.join(entry_dir, name) for name in meta.get("files", [])]
+        return meta, files
+
+    def put(self, key, meta, files):
+        """
+        Store an entry, replacing any existing entry with the same key.
+
+        Args:
+            key (str): Cache key.
+            meta (dict): JSON metadata stored with the entry.
+            files (list): Contents of the entry, each either bytes or a path to copy.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".entry_", dir=self.directory)
+        try:
+            names = []
+            for index, item in enumerate(files):
+                name = str(index)
+                if isinstance(item, (bytes, bytearray)):
+                    with open(os.path.join(tmp_dir, name), "wb") as f:
+                        f.write(item)
+                else:
+                    name += os.path.splitext(item)[1]
+                    target = os.path.join(tmp_dir, name)
+                    try:
+                        os.link(item, target)
+                    except OSError:
+                        shutil.copyfile(item, target)
+                names.append(name)
+            with open(os.path.join(tmp_dir, self.META_FILE), "w") as f:
+                json.dump({**meta, "files": names, "created_at": time.time()}, f)
+            size = _dir_size(tmp_dir)
+
+            with self._lock:
+                self._load_index()
+                if key in self._index:
+                    self._remove(key)
+                entry_dir = self._entry_dir(key)
+                os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+                os.rename(tmp_dir, entry_dir)
+                self._index[key] = [size, time.time()]
+                self._evict()
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _remove(self, key):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self._index.pop(key, None)
+
+    def _evict(self):
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            logger.debug(f"Evicted cache entry {key} ({size} bytes)")
+
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return sum(size for size, _ in self._index.values())
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._index = {}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Return the shared API result cache, or None when it is disabled.
+
+    Controlled by the result_cache_enabled, result_cache_dir and
+    result_cache_max_bytes settings. The directory defaults to flowy/cache/results
+    under ComfyUI's user directory.
+    """
+    global _result_cache
+    if not get_setting("result_cache_enabled", True):
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = DiskCache(
+                    get_setting("result_cache_dir") or default_cache_dir("results"),
+                    int(get_setting("result_cache_max_bytes", RESULT_CACHE_MAX_BYTES)),
+                )
+    return _result_cache
+
+
+__all__ = ["canonical_hash", "DiskCache", "default_cache_dir", "get_result_cache"]
@@ -0,0 +1,324 @@
+import logging
+import random
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from . import http_client
+from .types import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    API_READ_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    JOB_SUBMIT_TIMEOUT,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_AFTER_MAX,
+    RETRY_IDEMPOTENCY_KEYS,
+    get_setting,
+)
+
+logger = logging.getLogger(__name__)
+
+# 统一的请求重试策略: 每个模型可以配置自己的连接/读取超时,
+# 失败后按带抖动的指数退避重试, 429/503 优先遵循 Retry-After,
+# POST 请求带上幂等 key. 只有确认服务端按 key 去重 (idempotency_keys) 后, 可能已被处理的 POST
+# (读取超时, 5xx) 才会重发, 否则只重试连接失败和 429/503 这类服务端未处理的请求, 避免重复扣费
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Methods that can always be sent again without side effects
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Status codes that are retried
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Status codes that mean the server did not process the request, safe to retry for any method
+REJECTED_STATUS_CODES = (429, 503)
+
+# Built-in policies by name, a model type can be configured under its own name as well.
+# The retry_policies setting overrides any field, e.g.
+# {"retry_policies": {"default": {"max_attempts": 5}, "kling": {"read_timeout": 900}}}
+DEFAULT_POLICIES = {
+    "default": {
+        "connect_timeout": HTTP_CONNECT_TIMEOUT,
+        "read_timeout": HTTP_READ_TIMEOUT,
+        "max_attempts": RETRY_MAX_ATTEMPTS,
+        "backoff_base": RETRY_BACKOFF_BASE,
+        "backoff_max": RETRY_BACKOFF_MAX,
+        "retry_after_max": RETRY_AFTER_MAX,
+        "jitter": True,
+        "idempotency_keys": RETRY_IDEMPOTENCY_KEYS,
+    },
+    "api": {"read_timeout": API_READ_TIMEOUT},
+    "job_submit": {"read_timeout": JOB_SUBMIT_TIMEOUT},
+    "llm": {"read_timeout": LLM_READ_TIMEOUT},
+    "download": {},
+}
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header value.
+
+    Args:
+        value (str or None): Delay in seconds or an HTTP date.
+
+    Returns:
+        float or None: Seconds to wait, or None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def new_idempotency_key() -> str:
+    return uuid.uuid4().hex
+
+
+class RetryableStatus(Exception):
+    """Raised inside a retried call when the response has a retryable status code."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} from {response.url}")
+        self.response = response
+
+
+class RetryPolicy:
+    """
+    Timeouts and retry rules of one kind of request.
+
+    Args:
+        connect_timeout (float): Seconds to wait for the connection.
+        read_timeout (float or None): Seconds to wait between bytes of the answer, None waits forever.
+        max_attempts (int): Attempts including the first one.
+        backoff_base (float): Delay before the second attempt, doubled for each further attempt.
+        backoff_max (float): Upper bound of the backoff delay.
+        retry_after_max (float): Longest Retry-After that is waited for, longer ones fail right away.
+        jitter (bool): Pick the delay uniformly in [0, backoff] so that clients don't retry in lockstep.
+        idempotency_keys (bool): Whether the server deduplicates requests by their Idempotency-Key,
+            which makes a keyed POST safe to send again after it may have been processed.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        backoff_base=RETRY_BACKOFF_BASE,
+        backoff_max=RETRY_BACKOFF_MAX,
+        retry_after_max=RETRY_AFTER_MAX,
+        jitter=True,
+        idempotency_keys=RETRY_IDEMPOTENCY_KEYS,
+    ):
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = None if read_timeout is None else float(read_timeout)
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.retry_after_max = float(retry_after_max)
+        self.jitter = bool(jitter)
+        self.idempotency_keys = bool(idempotency_keys)
+
+    def __repr__(self):
+        return (
+            f"RetryPolicy(connect_timeout={self.connect_timeout}, read_timeout={self.read_timeout}, "
+            f"max_attempts={self.max_attempts}, backoff_base={self.backoff_base}, "
+            f"backoff_max={self.backoff_max})"
+        )
+
+    def timeout(self):
+        """Return the (connect, read) timeout tuple passed to requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff(self, attempt):
+        """Return the delay after the given failed attempt (1-based)."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_delay(self, error, attempt, safe=True):
+        """
+        Decide whether a failed attempt is retried.
+
+        Args:
+            error (Exception): The error of the attempt.
+            attempt (int): The 1-based number of the failed attempt.
+            safe (bool): Whether the request may have been processed and can still be sent again,
+                true for idempotent methods, and for requests carrying an idempotency key when
+                the policy's idempotency_keys is set.
+
+        Returns:
+            float or None: Seconds to wait before the next attempt, or None to give up.
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        response = getattr(error, "response", None)
+        if isinstance(error, (RetryableStatus, requests.HTTPError)) and response is not None:
+            status = response.status_code
+            if status not in RETRY_STATUS_CODES:
+                return None
+            if status in REJECTED_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    return retry_after if retry_after <= self.retry_after_max else None
+            elif not safe:
+                return None
+            return self.backoff(attempt)
+
+        # The connection was never established, nothing reached the server
+        if isinstance(error, requests.ConnectTimeout) or _connection_refused(error):
+            return self.backoff(attempt)
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return self.backoff(attempt) if safe else None
+        return None
+
+
+def _connection_refused(error) -> bool:
+    """Whether a requests error failed while opening the connection, before the request was sent"""
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    reason = getattr(error.args[0], "reason", error.args[0])
+    return isinstance(reason, NewConnectionError)
+
+
+def get_policy(*names) -> RetryPolicy:
+    """
+    Build the policy for a kind of request.
+
+    Args:
+        *names (str): Policy names from the most generic to the most specific,
+            e.g. get_policy("api", "kling"). Later names override earlier ones.
+
+    Returns:
+        RetryPolicy: The merged policy.
+    """
+    overrides = get_setting("retry_policies") or {}
+    fields = {}
+    for name in ("default",) + tuple(name for name in names if name):
+        fields.update(DEFAULT_POLICIES.get(name, {}))
+        fields.update(overrides.get(name) or {})
+    return RetryPolicy(**fields)
+
+
+def call(func, policy, description="request", safe=True, sleep=time.sleep, before_retry=None):
+    """
+    Call func until it succeeds or the policy gives up.
+
+    Args:
+        func (callable): Makes one attempt, raises on failure.
+        policy (RetryPolicy): Retry rules.
+        description (str, optional): Used in log messages.
+        safe (bool, optional): See RetryPolicy.retry_delay.
+        sleep (callable, optional): Sleep function, replaceable in tests.
+        before_retry (callable, optional): Called with the error after the backoff, before
+            each retry, e.g. to wait for a rate limiter token. Its return value is ignored here.
+
+    Returns:
+        The return value of func.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func()
+        except Exception as e:
+            delay = policy.retry_delay(e, attempt, safe)
+            if delay is None:
+                if attempt > 1:
+                    logger.error(f"{description} failed after {attempt} attempt(s): {e}")
+                raise
+            logger.warning(
+                f"{description} failed on attempt {attempt}/{policy.max_attempts}: {e}, retrying in {delay:.2f}s"
+            )
+            sleep(delay)
+            if before_retry is not None:
+                before_retry(e)
+
+
+def send(
+    method, url, policy=None, idempotency_key=None, sleep=time.sleep, before_retry=None, **kwargs
+) -> requests.Response:
+    """
+    Send a request through the shared session, retrying it according to the policy.
+
+    Non-idempotent methods are only sent again when the server can't have processed
+    the first attempt (connection errors, 429 and 503), unless an idempotency key is
+    given and the policy's idempotency_keys confirms the server deduplicates by it.
+    The key is sent in the Idempotency-Key header and stays the same across attempts.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        policy (RetryPolicy, optional): Defaults to get_policy().
+        idempotency_key (str, optional): Key that lets the server deduplicate attempts.
+        sleep (callable, optional): Sleep function, replaceable in tests.
+        before_retry (callable, optional): See call. It may return a dict of headers to
+            change for the next attempts, e.g. the Authorization of another API key.
+        **kwargs: Passed through to http_client.request. The timeout defaults to the policy's.
+
+    Returns:
+        requests.Response: The last response. Retryable statuses are returned once the
+            attempts are exhausted, callers still call raise_for_status.
+    """
+    if policy is None:
+        policy = get_policy()
+    method = method.upper()
+    headers = dict(kwargs.pop("headers", None) or {})
+    if idempotency_key:
+        headers[IDEMPOTENCY_HEADER] = idempotency_key
+    kwargs.setdefault("timeout", policy.timeout())
+    safe = method in IDEMPOTENT_METHODS or bool(idempotency_key and policy.idempotency_keys)
+
+    attempts = [0]
+
+    def attempt():
+        attempts[0] += 1
+        response = http_client.request(method, url, headers=headers, **kwargs)
+        if response.status_code in RETRY_STATUS_CODES:
+            error = RetryableStatus(response)
+            # 会重试的响应先关闭, 流式响应不会在重试期间占用连接池中的连接; 最后一次的响应返回给调用方
+            if policy.retry_delay(error, attempts[0], safe) is not None:
+                response.close()
+            raise error
+        return response
+
+    def update_headers(error):
+        headers.update(before_retry(error) or {})
+
+    try:
+        return call(
+            attempt,
+            policy,
+            f"{method} {url}",
+            safe=safe,
+            sleep=sleep,
+            before_retry=update_headers if before_retry is not None else None,
+        )
+    except RetryableStatus as e:
+        return e.response
+
+
+__all__ = [
+    "IDEMPOTENCY_HEADER",
+    "RetryPolicy",
+    "RetryableStatus",
+    "parse_retry_after",
+    "new_idempotency_key",
+    "get_policy",
+    "call",
+    "send",
+]
@@ -0,0 +1,103 @@
+import logging
+import threading
+
+from .types import get_setting
+
+logger = logging.getLogger(__name__)
+
+# 合并相同的并发请求: 同一个 key 的请求还在进行中时, 后来的调用方不再发送请求,
+# 而是等待第一个请求完成并共享它的结果 (或异常), 相同的 payload 只付费一次.
+# 键包含 API key, 不同账号的请求不会合并
+
+
+class SharedCallError(Exception):
+    """
+    Raised in a follower when the call it joined failed.
+
+    Every follower gets its own instance, the original exception is its cause
+    (and the error attribute), so followers never share a traceback.
+    """
+
+    def __init__(self, name, error):
+        super().__init__(f"Shared {name} request failed: {error}")
+        self.error = error
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time, callers arriving meanwhile share its outcome.
+
+    Only calls that overlap in time are merged, nothing is cached once the call finished.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Call func, or wait for the call already running for key.
+
+        Args:
+            key (str): Identity of the call, e.g. a canonical payload hash.
+            func (callable): Makes the call, without arguments.
+
+        Returns:
+            tuple: (result, shared), shared is True when the result came from another caller's call.
+
+        Raises:
+            Exception: The exception raised by func for the caller that ran it, followers
+                get a SharedCallError caused by it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            logger.debug(f"Joining in-flight {self.name} request {key[:12]}")
+            call.done.wait()
+            if call.error is not None:
+                raise SharedCallError(self.name, call.error) from call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.followers:
+                logger.info(f"Shared {self.name} request {key[:12]} with {call.followers} identical caller(s)")
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def enabled() -> bool:
+    return bool(get_setting("single_flight_enabled", True))
+
+
+# 生成请求和 LLM 请求各用一个分组
+api_requests = SingleFlight("API")
+llm_requests = SingleFlight("LLM")
+
+
+__all__ = ["SingleFlight", "SharedCallError", "enabled", "api_requests", "llm_requests"]
@@ -1,6 +1,9 @@
 import json
+import logging
 import sys
 import os
+import threading
+import time
 
 API_HOST = "https://app.comflowy.com" 
 # API_HOST = "http://127.0.0.1:3000" 
@@ -9,31 +12,96 @@ RUN_ID = ""
 ENV = "pro"
 # ENV = "preview"
 
+logger = logging.getLogger(__name__)
+
+# 配置文件的位置, 线程上下文中没有配置时使用
+CONFIG_PATH = "/comfyui/custom_node_api_config.json"
+# At most one stat of the config file per interval, changes are picked up within this delay
+CONFIG_STAT_INTERVAL = 1.0
+
+
+class _ConfigFileCache:
+    """Parsed config file, reparsed only when its mtime or size changed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.signature = None
+        self.config = {}
+        self.checked_at = None
+
+    def get(self, path):
+        now = time.monotonic()
+        if path == self.path and self.checked_at is not None and now - self.checked_at < CONFIG_STAT_INTERVAL:
+            return self.config
+        with self.lock:
+            if path == self.path and self.checked_at is not None and now - self.checked_at < CONFIG_STAT_INTERVAL:
+                return self.config
+            try:
+                stat = os.stat(path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature = None
+            if path != self.path or signature != self.signature:
+                self.config = self._load(path) if signature else {}
+                self.path = path
+                self.signature = signature
+            self.checked_at = now
+            return self.config
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+            logger.debug(f"Loaded custom node api config from {path}: {config}")
+            return config
+        except Exception as e:
+            logger.warning(f"Error reading custom node api config file: {e}")
+            return {}
+
+    def clear(self):
+        with self.lock:
+            self.path = None
+            self.signature = None
+            self.config = {}
+            self.checked_at = None
+
+
+_config_file = _ConfigFileCache()
+_thread_context_module = None
+
+
+def _get_thread_context_module():
+    # 执行器在节点包之后才会导入, 找到之前每次重新查找, 找到后缓存
+    global _thread_context_module
+    if _thread_context_module is None:
+        module = sys.modules.get("flowy_execute_thread_context")
+        if module is not None and hasattr(module, "get_run_context"):
+            _thread_context_module = module
+    return _thread_context_module
+
+
 def _read_config():
     try:
         # 首先尝试从线程上下文获取
-        thread_context_module = sys.modules.get("flowy_execute_thread_context")
-        if thread_context_module and hasattr(thread_context_module, "get_run_context"):
+        thread_context_module = _get_thread_context_module()
+        if thread_context_module is not None:
             options = thread_context_module.get_run_context("options")
             if options:
-                print("get_run_context", options.get("custom_node_api_config", {}))
                 return options.get("custom_node_api_config", {})
     except Exception as e:
-        print(f"Error getting context from thread: {e}")
+        logger.debug(f"Error getting context from thread: {e}")
 
-    # 回退到文件读取
-    try:
-        config_path = "/comfyui/custom_node_api_config.json"
-        if os.path.exists(config_path):
-            with open(config_path, "r") as f:
-                ret = json.load(f)
-                print("read_config", ret)
-                return ret
-    except Exception as e:
-        print(f"Error reading custom node api config file: {e}")
+    # 回退到文件读取, 文件内容按 mtime 缓存
+    return _config_file.get(CONFIG_PATH)
 
-    # 如果都失败了，返回空字典
-    return {}
+
+def clear_config_cache():
+    """Forget the cached config file and thread context module, the next read reloads them."""
+    global _thread_context_module
+    _thread_context_module = None
+    _config_file.clear()
 
 
 def get_api_host():
@@ -42,6 +110,8 @@ def get_api_host():
 
 def get_modal_cloud_web_url():
     config = _read_config()
+    if config.get("modal_cloud_web_url"):
+        return config["modal_cloud_web_url"]
     env = config.get("env", ENV)
     if env == "dev":
         return "https://comflowy--cloud-web-dev.modal.run"
@@ -56,6 +126,98 @@ def get_run_id():
     config = _read_config()
     return config.get("run_id", RUN_ID)
 
+def get_setting(key, default=None):
+    """Read a tunable from the "settings" section of the api config, falling back to default."""
+    settings = _read_config().get("settings") or {}
+    return settings.get(key, default)
+
+# HTTP transport defaults, can be overridden with get_setting keys of the same name in lower case
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 32
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 120
+
+# Retry policy defaults, see retry_policy.DEFAULT_POLICIES and the retry_policies setting.
+# Synchronous generation requests can take many minutes, they wait for the answer as long as a job
+# (JOB_TIMEOUT) so a stalled connection can't hang a worker forever. A POST that may have been
+# processed is not sent again after the timeout. LLM answers of a few thousand tokens take minutes too.
+API_READ_TIMEOUT = 30 * 60
+LLM_READ_TIMEOUT = 180
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_BASE = 1
+RETRY_BACKOFF_MAX = 30
+RETRY_AFTER_MAX = 120
+# Whether the server is known to deduplicate POSTs by their Idempotency-Key. Until it is confirmed,
+# a POST that may have been processed (read timeout, 5xx) is not sent again, it could be charged twice.
+RETRY_IDEMPOTENCY_KEYS = False
+
+# Shared limit of API requests per model and host, overridable per model with the rate_limits setting.
+# 0 disables a limit, both limits are disabled by default.
+# Requests wait in arrival order for at most RATE_LIMIT_MAX_QUEUE_WAIT seconds.
+RATE_LIMIT_MAX_IN_FLIGHT = 0
+RATE_LIMIT_REQUESTS_PER_SECOND = 0
+RATE_LIMIT_MAX_QUEUE_WAIT = 300
+
+# Seconds a pooled API key is skipped after a 429 without Retry-After
+API_KEY_COOLDOWN = 30
+
+# Max number of output files downloaded and decoded in parallel by one node
+DOWNLOAD_CONCURRENCY = 4
+
+# Max number of API jobs run in parallel when a node fans an image batch out to one job per image
+BATCH_CONCURRENCY = 4
+
+# Video and audio outputs are streamed to disk in chunks of this size, and aborted past the max size
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Job mode: submit returns a job id, then the job is polled with a growing interval until it finishes.
+# Only used for the nodes enabled by the job_mode setting, on servers that support jobs.
+JOB_SUBMIT_TIMEOUT = 60
+JOB_POLL_INITIAL_INTERVAL = 2
+JOB_POLL_MAX_INTERVAL = 15
+JOB_POLL_BACKOFF = 1.5
+JOB_TIMEOUT = 30 * 60
+
+# Size cap of the on-disk API result cache, least recently used entries are evicted first
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# On-disk cache of LLM answers, entries expire after LLM_CACHE_TTL seconds
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_TTL = 7 * 24 * 60 * 60
+
+# The LLM node streams its answer and shows the partial text on the node, at most every LLM_STREAM_UI_INTERVAL seconds
+LLM_STREAM_UI_INTERVAL = 0.1
+
+# Max number of prompts the batch LLM node sends at the same time
+LLM_BATCH_CONCURRENCY = 8
+
+# Hedged LLM requests (llm_hedging setting): a duplicate request is sent when no answer arrived by the
+# LLM_HEDGE_PERCENTILE of the last LLM_HEDGE_WINDOW latencies of the model, once LLM_HEDGE_MIN_SAMPLES are known.
+# Every request adds LLM_HEDGE_BUDGET hedges to a budget of at most LLM_HEDGE_BURST, so at most
+# about 10% more requests are sent.
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_WINDOW = 200
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_MIN_DELAY = 1.0
+LLM_HEDGE_BUDGET = 0.1
+LLM_HEDGE_BURST = 5
+
+# In-memory cache of encoded inputs (base64 images and audios), bounded by entries and bytes
+ENCODE_CACHE_MAX_ENTRIES = 32
+ENCODE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Output images are decoded in strips of at most this many bytes of uint8 pixels, so large
+# (upscaled) outputs don't need full-size intermediate copies. 0 decodes in one pass.
+DECODE_STRIP_BYTES = 16 * 1024 * 1024
+# Output batches of at least this many bytes are decoded into a memory-mapped temporary file, 0 never maps
+DECODE_MEMMAP_MIN_BYTES = 0
+# Video frame batches are memory-mapped from this size on, a few seconds of 1080p frames
+VIDEO_MEMMAP_MIN_BYTES = 256 * 1024 * 1024
+
+# gzip level of compressed JSON uploads, low levels already shrink base64 payloads and cost little CPU
+UPLOAD_GZIP_LEVEL = 1
+
 FLOAT = (
     "FLOAT",
     {"default": 1, "min": -sys.float_info.max, "max": sys.float_info.max, "step": 0.01},
@@ -0,0 +1,171 @@
+import gzip
+import json
+import logging
+import threading
+
+from urllib3 import encode_multipart_formdata
+
+from . import retry_policy
+from .media import EncodedMedia, json_default
+from .metrics import registry as metrics
+from .types import UPLOAD_GZIP_LEVEL, get_setting
+
+logger = logging.getLogger(__name__)
+
+# 请求体的上传方式, 按端点协商:
+# multipart: 媒体输入作为二进制 part 发送, JSON payload 中用 attachment://<part> 引用, 比 base64 少 33% 的字节
+# gzip: 整个 JSON 请求体 gzip 压缩 (Content-Encoding: gzip)
+# json: 原来的方式, 媒体输入作为 base64 data URI 内联在 JSON 中
+# 默认只用 json; multipart 和 gzip 需要按端点 (upload_modes 设置) 开启.
+# auto 模式下依次尝试, 服务端以 400/415/422 拒绝请求体时退回下一种方式, 并记住该端点接受的方式
+
+UPLOAD_MODES = ("multipart", "gzip", "json")
+
+# Name of the multipart part holding the JSON payload
+PAYLOAD_PART = "payload"
+
+# Prefix of the payload values that refer to a binary multipart part
+ATTACHMENT_PREFIX = "attachment://"
+
+DEFAULT_UPLOAD_MODE = "json"
+
+# Statuses that reject the body itself. In auto mode the next upload mode is tried, none of them
+# means the request was processed.
+REJECTED_BODY_STATUS_CODES = (400, 415, 422)
+
+MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "audio/wav": ".wav",
+}
+
+# API URL -> the first upload mode it accepted
+_accepted_modes = {}
+_accepted_modes_lock = threading.Lock()
+
+
+def _split_media(value, parts):
+    """Replace EncodedMedia values with attachment references, collecting them into parts."""
+    if isinstance(value, EncodedMedia):
+        name = f"file{len(parts)}"
+        parts.append((name, value))
+        return ATTACHMENT_PREFIX + name
+    if isinstance(value, dict):
+        return {key: _split_media(item, parts) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_split_media(item, parts) for item in value]
+    return value
+
+
+def encode_body(payload, mode):
+    """
+    Serialize a payload for an upload mode.
+
+    Args:
+        payload (dict): Request payload, media inputs as EncodedMedia.
+        mode (str): One of UPLOAD_MODES.
+
+    Returns:
+        tuple: (body bytes, headers dict).
+    """
+    if mode == "multipart":
+        parts = []
+        document = _split_media(payload, parts)
+        fields = [(PAYLOAD_PART, (None, json.dumps(document, allow_nan=False), "application/json"))]
+        for name, item in parts:
+            filename = name + MIME_EXTENSIONS.get(item.mime_type, "")
+            fields.append((name, (filename, item.data, item.mime_type)))
+        body, content_type = encode_multipart_formdata(fields)
+        return body, {"Content-Type": content_type}
+
+    body = json.dumps(payload, allow_nan=False, default=json_default).encode("utf-8")
+    if mode == "gzip":
+        level = int(get_setting("upload_gzip_level", UPLOAD_GZIP_LEVEL))
+        return gzip.compress(body, compresslevel=level), {
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        }
+    if mode == "json":
+        return body, {"Content-Type": "application/json"}
+    raise ValueError(f"Unknown upload mode: {mode}")
+
+
+def upload_modes(api_url, model_type=None):
+    """
+    Return the upload modes to try for an endpoint, in order.
+
+    The upload_mode setting is a fixed mode, "json" by default, or "auto" to negotiate.
+    upload_modes overrides it per model type, which is how the multipart and gzip
+    uploads are enabled for an endpoint that supports them, e.g.
+    {"upload_modes": {"kling": "multipart", "luma": "auto"}}.
+    """
+    mode = (get_setting("upload_modes") or {}).get(model_type) or get_setting("upload_mode", DEFAULT_UPLOAD_MODE)
+    if mode != "auto":
+        if mode not in UPLOAD_MODES:
+            raise ValueError(f"Unknown upload mode: {mode}")
+        return (mode,)
+    with _accepted_modes_lock:
+        accepted = _accepted_modes.get(api_url)
+    if accepted:
+        return UPLOAD_MODES[UPLOAD_MODES.index(accepted):]
+    return UPLOAD_MODES
+
+
+def _remember(api_url, mode):
+    with _accepted_modes_lock:
+        if _accepted_modes.get(api_url) != mode:
+            logger.info(f"Using {mode} uploads for {api_url}")
+            _accepted_modes[api_url] = mode
+
+
+def post_payload(api_url, payload, headers=None, model_type=None, policy=None, **kwargs):
+    """
+    POST a payload with the best upload mode the endpoint accepts.
+
+    Args:
+        api_url (str): Endpoint URL.
+        payload (dict): Request payload, media inputs as EncodedMedia.
+        headers (dict, optional): Extra headers, e.g. authorization. Content-Type is set here.
+        model_type (str, optional): Used for the upload mode setting and the upload_bytes metric.
+        policy (RetryPolicy, optional): Retry policy, see retry_policy.send.
+        **kwargs: Passed through to retry_policy.send, e.g. idempotency_key and timeout.
+
+    Returns:
+        requests.Response: The response to the first mode whose body was not rejected
+            (400, 415 or 422), or the last response.
+    """
+    headers = {key: value for key, value in (headers or {}).items() if key.lower() != "content-type"}
+    modes = upload_modes(api_url, model_type)
+    for index, mode in enumerate(modes):
+        body, body_headers = encode_body(payload, mode)
+        metrics.observe("upload_bytes", model_type or "unknown", len(body))
+        response = retry_policy.send(
+            "POST", api_url, policy=policy, headers={**headers, **body_headers}, data=body, **kwargs
+        )
+        rejected = response.status_code in REJECTED_BODY_STATUS_CODES
+        if rejected and index + 1 < len(modes):
+            logger.info(
+                f"{api_url} rejected a {mode} upload with {response.status_code}, falling back to {modes[index + 1]}"
+            )
+            continue
+        if not rejected and len(modes) > 1:
+            _remember(api_url, mode)
+        return response
+
+
+def reset_negotiation():
+    """Forget the upload modes accepted by the endpoints."""
+    with _accepted_modes_lock:
+        _accepted_modes.clear()
+
+
+__all__ = [
+    "UPLOAD_MODES",
+    "DEFAULT_UPLOAD_MODE",
+    "ATTACHMENT_PREFIX",
+    "encode_body",
+    "upload_modes",
+    "post_payload",
+    "reset_negotiation",
+]
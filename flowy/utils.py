@@ -1,10 +1,79 @@
+import hashlib
+import json
 import logging
-import requests
-from .types import API_HOST
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from .types import LLM_BATCH_CONCURRENCY, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL, get_api_host, get_setting
+from . import hedging, retry_policy, single_flight
+from .result_cache import DiskCache, canonical_hash, default_cache_dir
+from .metrics import registry as metrics
+from .api_key_manager import key_pool, load_api_keys
 
 logger = logging.getLogger(__name__)
 
-def llm_request(prompt, system_prompt, llm_model, api_key, max_tokens=3000, timeout=10):
+# LLM 回答的磁盘缓存: 以 (模型, system_prompt 哈希, prompt, seed, max_tokens) 为 key,
+# 重新运行相同的 LLM 节点时直接返回上次的回答, 不再等待 LLM 生成
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    Return the shared LLM answer cache, or None when it is disabled.
+
+    Controlled by the llm_cache_enabled, llm_cache_dir, llm_cache_max_bytes and
+    llm_cache_ttl settings. The directory defaults to flowy/cache/llm under ComfyUI's
+    user directory.
+    """
+    global _llm_cache
+    if not get_setting("llm_cache_enabled", True):
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = DiskCache(
+                    get_setting("llm_cache_dir") or default_cache_dir("llm"),
+                    int(get_setting("llm_cache_max_bytes", LLM_CACHE_MAX_BYTES)),
+                    ttl=float(get_setting("llm_cache_ttl", LLM_CACHE_TTL)),
+                )
+    return _llm_cache
+
+
+def llm_cache_key(llm_model, system_prompt, prompt, seed, max_tokens) -> str:
+    system_prompt_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    return canonical_hash("llm", llm_model, system_prompt_hash, prompt, seed, max_tokens)
+
+
+def _llm_payload(prompt, system_prompt, llm_model, max_tokens, seed):
+    payload = {
+        "prompt": prompt,
+        "system_prompt": system_prompt,
+        "model": llm_model,
+        "max_tokens": max_tokens,
+    }
+    if seed is not None:
+        payload["seed"] = seed
+    return payload
+
+
+def llm_request(
+    prompt,
+    system_prompt,
+    llm_model,
+    api_key,
+    max_tokens=3000,
+    timeout=None,
+    seed=None,
+    use_cache=True,
+    validate=None,
+    on_text=None,
+    hedge=None,
+    sleep=time.sleep,
+):
     """
     Send a request to the Comflowy LLM API.
     
@@ -12,41 +81,391 @@ def llm_request(prompt, system_prompt, llm_model, api_key, max_tokens=3000, time
         prompt (str): The main prompt for the LLM.
         system_prompt (str): The system prompt for the LLM.
         llm_model (str): The LLM model to use.
-        api_key (str): The API key for authentication.
+        api_key (str): The API key for authentication. A key of api_key.json is
+            spread over all the keys of the file, see api_key_manager.ApiKeyPool.
         max_tokens (int, optional): Maximum number of tokens to generate. Defaults to 3000.
-        timeout (int, optional): Timeout for the request in seconds. Defaults to 10.
+        timeout (float or tuple, optional): Seconds or (connect, read) seconds.
+            Defaults to the timeouts of the llm retry policy.
+        seed (int, optional): Sent to the model, and part of the cache key.
+        use_cache (bool, optional): Read and write the LLM answer cache. Defaults to True.
+        validate (callable, optional): Called with the answer, answers it returns False for are not cached.
+        on_text (callable, optional): Streams the answer, see stream_llm_request, and is
+            called with the text received so far after each piece. A cached answer is
+            passed once. The returned text is the same as without streaming.
+        hedge (bool, optional): Send a duplicate request when the answer takes longer than
+            usual for the model, see hedging.Hedger. Defaults to the llm_hedging setting.
+            Streamed requests are not hedged.
+        sleep (callable, optional): Waits between retries, see retry_policy.send.
     
     Returns:
         str: The generated text from the LLM.
     
     Raises:
         Exception: If there's an error in the API request or response.
+
+    Identical requests with the same API key that are in flight at the same time are
+    sent only once and share the answer, unless the single_flight_enabled setting is off.
     """
+    api_url = f"{get_api_host()}/api/open/v0/prompt"
+    payload = _llm_payload(prompt, system_prompt, llm_model, max_tokens, seed)
+
+    if hedge is None:
+        hedge = hedging.enabled()
+    cache = get_llm_cache() if use_cache else None
+    cache_key = llm_cache_key(llm_model, system_prompt, prompt, seed, max_tokens)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.increment("result_cache_hits_total", llm_model)
+            logger.info(f"LLM cache hit for {llm_model}, key {cache_key[:12]}")
+            if on_text is not None:
+                on_text(cached[0]["text"])
+            return cached[0]["text"]
+
     try:
-        response = requests.post(
-            f"{API_HOST}/api/open/v0/prompt",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            },
-            json={
-                "prompt": prompt,
-                "system_prompt": system_prompt,
-                "model": llm_model,
-                "max_tokens": max_tokens,
-            },
-            timeout=timeout,
-        )
-
-        response.raise_for_status()  # Raise an HTTPError for bad responses
-
-        ret = response.json()
-        if ret.get("success"):
-            return ret.get("text")
+        def send():
+            if hedge:
+                return hedging.llm_hedger.run(
+                    llm_model, lambda sleep: _send_llm_request(api_url, payload, api_key, timeout, sleep)
+                )
+            return _send_llm_request(api_url, payload, api_key, timeout, sleep)
+
+        if on_text is not None:
+            # 流式请求不合并, 每个调用方都需要自己的增量文本
+            text = ""
+            for delta in stream_llm_request(prompt, system_prompt, llm_model, api_key, max_tokens, timeout, seed):
+                text += delta
+                on_text(text)
+        elif not single_flight.enabled():
+            text = send()
         else:
-            raise Exception(f"Error: {ret.get('error')}")
+            text, shared = single_flight.llm_requests.do(canonical_hash(api_url, payload, api_key), send)
+            if shared:
+                metrics.increment("coalesced_requests_total", llm_model)
     except Exception as e:
-        raise Exception(f"Failed to get response from LLM model with {API_HOST}/api/open/v0/prompt, error: {str(e)}")
+        raise Exception(f"Failed to get response from LLM model with {api_url}, error: {str(e)}")
+
+    if cache is not None and text and (validate is None or validate(text)):
+        try:
+            cache.put(cache_key, {"model": llm_model, "text": text}, [])
+        except OSError as e:
+            logger.warning(f"Failed to cache LLM answer: {e}")
+    return text
+
+def _post_llm_request(api_url, payload, api_key, timeout=None, lease=None, stream=False, sleep=time.sleep):
+    policy = retry_policy.get_policy("llm", payload["model"])
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {(lease and lease.key) or api_key}",
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    # 流式请求只在收到响应头之前重试, read timeout 是两个数据块之间的最长等待时间
+    response = retry_policy.send(
+        "POST",
+        api_url,
+        policy=policy,
+        idempotency_key=retry_policy.new_idempotency_key(),
+        headers=headers,
+        json=payload,
+        timeout=timeout or policy.timeout(),
+        hooks=lease.hooks if lease else None,
+        before_retry=lease.retry_hook if lease and lease.key else None,
+        stream=stream,
+        sleep=sleep,
+    )
+    response.raise_for_status()  # Raise an HTTPError for bad responses
+    return response
+
+
+def _lease_for(api_key):
+    # api_key.json 中的 key 按并发数分摊到整个 key 池, 其他 key 原样使用
+    return key_pool.lease() if api_key in load_api_keys() else nullcontext()
+
+
+def _answer_text(ret):
+    if ret.get("success"):
+        return ret.get("text")
+    else:
+        raise Exception(f"Error: {ret.get('error')}")
+
+
+def _send_llm_request(api_url, payload, api_key, timeout=None, sleep=time.sleep):
+    with _lease_for(api_key) as lease:
+        response = _post_llm_request(api_url, payload, api_key, timeout, lease, sleep=sleep)
+    return _answer_text(response.json())
+
+
+def _iter_sse_data(lines):
+    """Yield the data of each server-sent event, data lines of one event are joined by newlines"""
+    data = []
+    for line in lines:
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+        elif line.startswith("data:"):
+            value = line[len("data:"):]
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield "\n".join(data)
+
+
+def _event_text(event):
+    """Return the text delta of a stream event, Comflowy {"text": ...} or OpenAI style choices[0].delta.content"""
+    if event.get("error") or event.get("success") is False:
+        raise Exception(f"Error: {event.get('error')}")
+    if "text" in event:
+        return event.get("text") or ""
+    choices = event.get("choices") or []
+    if choices:
+        return get_nested_value(choices[0], "delta.content") or ""
+    return ""
+
+
+def stream_llm_request(prompt, system_prompt, llm_model, api_key, max_tokens=3000, timeout=None, seed=None):
+    """
+    Send a streaming request to the Comflowy LLM API and yield the text as it is generated.
+
+    The request asks for server-sent events. A server answering with a plain JSON
+    body is still supported, its whole text is then yielded at once. Joining the
+    yielded pieces gives the same text as llm_request.
+
+    Args:
+        Same as llm_request. The read timeout applies between two received chunks,
+        not to the whole generation.
+
+    Yields:
+        str: Text deltas, in order.
+
+    Raises:
+        Exception: If there's an error in the API request or in the stream.
+    """
+    api_url = f"{get_api_host()}/api/open/v0/prompt"
+    payload = _llm_payload(prompt, system_prompt, llm_model, max_tokens, seed)
+    payload["stream"] = True
+
+    with _lease_for(api_key) as lease:
+        with _post_llm_request(api_url, payload, api_key, timeout, lease, stream=True) as response:
+            if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                text = _answer_text(response.json())
+                if text:
+                    yield text
+                return
+            # chunk_size=None 按服务端发送的数据块读取, 不等缓冲区填满
+            for data in _iter_sse_data(response.iter_lines(chunk_size=None)):
+                if data.strip() == "[DONE]":
+                    return
+                delta = _event_text(json.loads(data))
+                if delta:
+                    yield delta
+
+
+def parse_prompt_list(text):
+    """
+    Split the prompts of a batch.
+
+    Args:
+        text (str): A JSON list of prompts, or one prompt per line.
+
+    Returns:
+        list[str]: The non-empty prompts, in order.
+    """
+    stripped = (text or "").strip()
+    if stripped.startswith("["):
+        try:
+            items = json.loads(stripped)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            prompts = [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in items]
+            return [prompt for prompt in prompts if prompt.strip()]
+    return [line.strip() for line in stripped.splitlines() if line.strip()]
+
+
+def llm_batch_request(
+    prompts, system_prompt, llm_model, api_key, max_tokens=3000, timeout=None, seed=None, use_cache=True, concurrency=None
+):
+    """
+    Send a list of prompts through llm_request with bounded concurrency.
+
+    Args:
+        prompts (list[str]): The prompts.
+        seed (int, optional): Prompt i is sent with seed + i, so repeated prompts give variants.
+        concurrency (int, optional): Max prompts in flight. Defaults to the llm_batch_concurrency setting.
+        Other arguments are the same as llm_request.
+
+    Returns:
+        list[tuple]: One (text, error) per prompt, in order. error is None on success,
+            text is None on failure. A failed prompt doesn't stop the others.
+    """
+    if concurrency is None:
+        concurrency = int(get_setting("llm_batch_concurrency", LLM_BATCH_CONCURRENCY))
+
+    def run(index):
+        try:
+            text = llm_request(
+                prompts[index],
+                system_prompt,
+                llm_model,
+                api_key,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                seed=None if seed is None else (seed + index) & 0xFFFFFFFF,
+                use_cache=use_cache,
+            )
+            return text, None
+        except Exception as e:
+            logger.error(f"Prompt {index + 1}/{len(prompts)} of the batch failed: {e}")
+            return None, str(e)
+
+    if not prompts:
+        return []
+    start_time = time.time()
+    max_workers = min(len(prompts), max(1, concurrency))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flowy-llm") as executor:
+        results = list(executor.map(run, range(len(prompts))))
+    logger.info(
+        f"Batch of {len(prompts)} LLM prompts with concurrency {max_workers} took {time.time() - start_time:.2f}s"
+    )
+    return results
+
+
+# Omost 画布 JSON 的结构, 与 lib_omost.canvas.Canvas 的检查一致
+CANVAS_GLOBAL_FIELDS = ("description", "detailed_descriptions", "tags", "HTML_web_color_name")
+CANVAS_LOCAL_FIELDS = (
+    "location",
+    "offset",
+    "area",
+    "distance_to_viewer",
+    "description",
+    "detailed_descriptions",
+    "tags",
+    "atmosphere",
+    "style",
+    "quality_meta",
+    "HTML_web_color_name",
+)
+
+
+def _check_description(description, fields, name):
+    if not isinstance(description, dict):
+        raise ValueError(f"{name} is not an object")
+    missing = [field for field in fields if field not in description]
+    if missing:
+        raise ValueError(f"{name} is missing {', '.join(missing)}")
+    for field in fields:
+        value = description[field]
+        if field == "detailed_descriptions":
+            valid = isinstance(value, list) and all(isinstance(item, str) for item in value)
+        elif field == "distance_to_viewer":
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            raise ValueError(f"{field} of {name} is not valid: {value!r}")
+
+
+def parse_canvas_json(text):
+    """
+    Parse an LLM answer as an Omost canvas.
+
+    Args:
+        text (str): The answer, optionally wrapped in a ```json code block.
+
+    Returns:
+        dict: The canvas with its global_description and local_descriptions.
+
+    Raises:
+        ValueError: If the answer is not JSON or doesn't follow the Canvas schema.
+    """
+    data = json.loads(text.replace("```json", "").replace("```", ""))
+    if not isinstance(data, dict):
+        raise ValueError("Canvas is not an object")
+    _check_description(data.get("global_description"), CANVAS_GLOBAL_FIELDS, "global_description")
+    local_descriptions = data.get("local_descriptions")
+    if not isinstance(local_descriptions, list):
+        raise ValueError("local_descriptions is not a list")
+    for index, local_description in enumerate(local_descriptions):
+        _check_description(local_description, CANVAS_LOCAL_FIELDS, f"local_descriptions[{index}]")
+    return data
+
+
+def is_canvas_json(text) -> bool:
+    """Whether an LLM answer is a valid Omost canvas, see parse_canvas_json"""
+    try:
+        parse_canvas_json(text)
+    except ValueError:
+        return False
+    return True
+
+
+def race_llm_requests(
+    prompt, system_prompt, llm_models, api_key, validate, max_tokens=3000, timeout=None, seed=None, use_cache=True
+):
+    """
+    Send the same prompt to several models at the same time and keep the first valid answer.
+
+    Args:
+        llm_models (list[str]): The models, a cached valid answer of any of them wins at once.
+        validate (callable): Called with each answer, answers it returns False for are rejected.
+        Other arguments are the same as llm_request.
+
+    Returns:
+        tuple: (model, text) of the first valid answer.
+
+    Raises:
+        Exception: If no model gave a valid answer, with the error of every model.
+
+    The other requests are cancelled: they are not retried anymore and their answers are
+    dropped. Requests already sent can't be aborted, their valid answers are still cached.
+    """
+    answers = queue.Queue()
+    cancel = threading.Event()
+
+    def sleep(seconds):
+        if cancel.wait(seconds):
+            raise hedging.Cancelled()
+
+    def run(model):
+        try:
+            text = llm_request(
+                prompt,
+                system_prompt,
+                model,
+                api_key,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                seed=seed,
+                use_cache=use_cache,
+                validate=validate,
+                hedge=False,
+                sleep=sleep,
+            )
+            if not validate(text):
+                raise ValueError(f"Invalid answer: {(text or '')[:200]}")
+            answers.put((model, text, None))
+        except Exception as e:
+            answers.put((model, None, e))
+
+    start_time = time.time()
+    for model in llm_models:
+        threading.Thread(target=run, args=(model,), name="flowy-llm-race", daemon=True).start()
+
+    errors = []
+    for _ in llm_models:
+        model, text, error = answers.get()
+        if error is None:
+            cancel.set()
+            logger.info(
+                f"{model} gave the first valid answer of {len(llm_models)} models in {time.time() - start_time:.2f}s"
+            )
+            return model, text
+        logger.warning(f"{model} gave no valid answer: {error}")
+        errors.append(f"{model}: {error}")
+    raise Exception("No model gave a valid answer. " + "; ".join(errors))
+
 
 def get_nested_value(obj, path, default=None):
     """
@@ -69,4 +488,4 @@ def get_nested_value(obj, path, default=None):
     return obj
 
 # Make sure to export the functions
-__all__ = ['llm_request', 'get_nested_value']
+__all__ = ['llm_request', 'stream_llm_request', 'llm_batch_request', 'parse_prompt_list', 'parse_canvas_json', 'is_canvas_json', 'race_llm_requests', 'get_nested_value']
@@ -0,0 +1,133 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from flowy import hedging, utils
+from flowy.hedging import Cancelled, Hedger
+from standin_server import StandinServer
+
+OPTIONS = {"percentile": 95, "window": 50, "min_samples": 5, "min_delay": 0.05, "budget": 1, "burst": 2}
+
+
+class TestHedger(unittest.TestCase):
+    def setUp(self):
+        self.hedger = Hedger(options=dict(OPTIONS))
+        for _ in range(5):
+            self.hedger.window("gpt").add(0.05)
+        self.started = []
+        self.cancelled = threading.Event()
+
+    def slow_first(self, sleep):
+        index = len(self.started)
+        self.started.append(index)
+        if index == 0:
+            try:
+                # 模拟重试前的等待, 另一方胜出后被取消
+                sleep(2)
+            except Cancelled:
+                self.cancelled.set()
+                raise
+        return f"answer {index}"
+
+    def test_slow_call_is_hedged_and_the_loser_cancelled(self):
+        # Act
+        start = time.monotonic()
+        result = self.hedger.run("gpt", self.slow_first)
+        elapsed = time.monotonic() - start
+
+        # Assert
+        self.assertEqual(result, "answer 1")
+        self.assertLess(elapsed, 1)
+        self.assertTrue(self.cancelled.wait(1))
+        self.assertEqual(len(self.started), 2)
+
+    def test_models_without_enough_latencies_are_not_hedged(self):
+        # Act
+        result = self.hedger.run("other", lambda sleep: time.sleep(0.1) or "answer")
+
+        # Assert
+        self.assertEqual(result, "answer")
+        self.assertEqual(len(self.hedger.window("other")), 1)
+        self.assertIsNone(self.hedger.hedge_delay("gpt-4o"))
+
+    def test_budget_caps_the_hedges(self):
+        # Arrange
+        self.hedger.options.update(budget=0.5, burst=1, percentile=50)
+        for _ in range(45):
+            self.hedger.window("gpt").add(0.05)
+        calls = []
+
+        def slow(sleep):
+            calls.append(1)
+            time.sleep(0.1)
+            return "answer"
+
+        # Act
+        for _ in range(4):
+            self.hedger.run("gpt", slow)
+
+        # Assert
+        self.assertEqual(len(calls), 4 + 2)
+
+    def test_failed_call_waits_for_the_hedge(self):
+        # Arrange
+        def flaky(sleep):
+            index = len(self.started)
+            self.started.append(index)
+            if index == 0:
+                time.sleep(0.1)
+                raise ValueError("boom")
+            time.sleep(0.2)
+            return "answer 1"
+
+        # Act
+        result = self.hedger.run("gpt", flaky)
+
+        # Assert
+        self.assertEqual(result, "answer 1")
+
+    def test_all_calls_failing_raise_the_first_error(self):
+        # Act / Assert
+        with self.assertRaisesRegex(ValueError, "first"):
+            self.hedger.run("gpt", lambda sleep: (_ for _ in ()).throw(ValueError("first")))
+
+
+class TestHedgedLLMRequest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.server.state.llm_text = "a hedged answer"
+        self.hedger = Hedger(options=dict(OPTIONS))
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=None),
+            mock.patch.object(hedging, "llm_hedger", self.hedger),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+
+    def test_duplicate_request_answers_first(self):
+        # Arrange
+        for _ in range(5):
+            utils.llm_request("a cat", "You are helpful", "gpt-4o-mini", "key", hedge=True)
+        self.server.state.llm_delay_script = [1.5]
+
+        # Act
+        start = time.monotonic()
+        text = utils.llm_request("a cat", "You are helpful", "gpt-4o-mini", "key", hedge=True)
+        elapsed = time.monotonic() - start
+
+        # Assert
+        self.assertEqual(text, "a hedged answer")
+        self.assertLess(elapsed, 1)
+        submits = self.server.state.submits[5:]
+        self.assertEqual(len(submits), 2)
+        self.assertNotEqual(submits[0]["idempotency_key"], submits[1]["idempotency_key"])
+
+
+if __name__ == "__main__":
+    unittest.main()
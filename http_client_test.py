@@ -0,0 +1,62 @@
+import glob
+import hashlib
+import os
+import tempfile
+import unittest
+import requests
+from flowy import http_client
+from standin_server import StandinServer
+
+
+class TestDownloadToFile(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.url = f"{self.server.url}/files/video.mp4"
+        self.body = self.server.state.files["video.mp4"][1]
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "video.mp4")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def assertNothingLeft(self):
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(glob.glob(os.path.join(self.dir, ".download_*.part")), [])
+
+    def test_download_is_renamed_into_place(self):
+        # Act
+        checksum = http_client.download_to_file(self.url, self.path, chunk_size=64)
+
+        # Assert
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertEqual(checksum, hashlib.sha256(self.body).hexdigest())
+        self.assertEqual(os.listdir(self.dir), ["video.mp4"])
+
+    def test_truncated_body_leaves_no_file(self):
+        # Arrange
+        self.server.state.file_script = ["truncate"]
+
+        # Act / Assert
+        with self.assertRaises(requests.RequestException):
+            http_client.download_to_file(self.url, self.path, chunk_size=64)
+        self.assertNothingLeft()
+
+    def test_oversized_body_is_rejected_by_its_content_length(self):
+        # Act / Assert
+        with self.assertRaisesRegex(ValueError, "limit"):
+            http_client.download_to_file(self.url, self.path, max_bytes=len(self.body) - 1)
+        self.assertNothingLeft()
+
+    def test_oversized_body_without_content_length_is_aborted(self):
+        # Arrange
+        self.server.state.file_script = ["no_length"]
+
+        # Act / Assert
+        with self.assertRaisesRegex(ValueError, "exceeded"):
+            http_client.download_to_file(self.url, self.path, chunk_size=64, max_bytes=len(self.body) - 1)
+        self.assertNothingLeft()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import torch
+from PIL import Image
+from flowy import media
+
+
+class TestImageEncoding(unittest.TestCase):
+    def test_image_layouts(self):
+        # Arrange
+        layouts = {
+            (2, 40, 50, 3): 2,
+            (2, 3, 40, 50): 2,
+            (40, 50, 3): 1,
+            (3, 40, 50): 1,
+            (40, 50, 4): 1,
+            (40, 50): 1,
+        }
+
+        for shape, frames in layouts.items():
+            # Act
+            encoded = media.encode_images(torch.rand(*shape))
+
+            # Assert
+            self.assertEqual(len(encoded), frames, shape)
+            self.assertEqual(Image.open(io.BytesIO(encoded[0])).size, (50, 40), shape)
+
+    def test_resize_keeps_aspect_and_never_upscales(self):
+        # Arrange
+        pixels = np.full((3000, 4000, 3), 128, dtype=np.uint8)
+
+        # Act
+        resized = media.resize_pixels(pixels, 1000)
+        small = media.resize_pixels(pixels[:500, :800], 1000)
+
+        # Assert
+        self.assertEqual(resized.shape, (750, 1000, 3))
+        self.assertTrue((resized == 128).all())
+        self.assertEqual(small.shape, (500, 800, 3))
+        self.assertEqual(media.fit_size(3000, 4000, None), (3000, 4000))
+
+    def test_quantize_rounds_and_clamps(self):
+        # Arrange
+        frame = torch.rand(130, 20, 3) * 1.2 - 0.1
+
+        # Act
+        pixels = media.quantize_frame(frame)
+
+        # Assert
+        expected = np.clip(np.rint(frame.numpy() * 255), 0, 255).astype(np.uint8)
+        self.assertEqual(pixels.dtype, np.uint8)
+        np.testing.assert_array_equal(pixels, expected)
+
+    def test_decode_into_with_alpha_mask(self):
+        # Arrange
+        rgba = np.random.randint(0, 256, (20, 30, 4), dtype=np.uint8)
+        out = torch.empty(20, 30, 3, dtype=torch.float16)
+        mask = torch.empty(20, 30)
+
+        # Act
+        media.decode_image_into(Image.fromarray(rgba), out, mask)
+
+        # Assert
+        np.testing.assert_allclose(out.float().numpy(), rgba[..., :3] / 255.0, atol=1e-3)
+        np.testing.assert_allclose(mask.numpy(), 1.0 - rgba[..., 3] / 255.0, atol=1e-6)
+
+    def test_strip_decode_matches_full_decode(self):
+        # Arrange
+        palette = Image.fromarray(np.random.randint(0, 256, (37, 30, 3), dtype=np.uint8)).convert("P")
+        palette.paste(0, (0, 0, 5, 5))
+        palette.info["transparency"] = 0
+        full_out, full_mask = torch.empty(37, 30, 3), torch.empty(37, 30)
+        strip_out, strip_mask = torch.empty(37, 30, 3), torch.empty(37, 30)
+
+        # Act
+        media.decode_image_into(palette, full_out, full_mask)
+        media.decode_image_into(palette, strip_out, strip_mask, strip_rows=8)
+
+        # Assert
+        self.assertTrue(torch.equal(full_out, strip_out))
+        self.assertTrue(torch.equal(full_mask, strip_mask))
+        self.assertGreater(float(full_mask.max()), 0)
+
+    def test_large_tensors_are_memory_mapped(self):
+        # Act
+        with mock.patch.object(media.np, "memmap", wraps=np.memmap) as memmap:
+            small = media.empty_tensor((1, 4, 4, 3), torch.float32, memmap_min_bytes=1024)
+            large = media.empty_tensor((1, 64, 64, 3), torch.float16, memmap_min_bytes=1024)
+        large.fill_(0.5)
+
+        # Assert
+        self.assertEqual(memmap.call_count, 1)
+        self.assertEqual(memmap.call_args.kwargs["shape"], (1, 64, 64, 3))
+        self.assertEqual(tuple(small.shape), (1, 4, 4, 3))
+        self.assertEqual(large.dtype, torch.float16)
+        self.assertEqual(float(large.mean()), 0.5)
+
+    def test_encode_cache_stats(self):
+        # Arrange
+        cache = media.EncodeCache(max_entries=2, max_bytes=1024)
+        image = torch.rand(8, 8, 3)
+        key = ("image", media.tensor_digest(image))
+
+        # Act
+        first = cache.get_or_encode(key, lambda: b"encoded")
+        second = cache.get_or_encode(("image", media.tensor_digest(image.clone())), lambda: b"other")
+
+        # Assert
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+@unittest.skipUnless(av, "PyAV is not installed")
+class TestVideoDecoding(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "video.mp4")
+        with av.open(self.path, "w") as container:
+            stream = container.add_stream("mpeg4", rate=24)
+            stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+            for index in range(30):
+                frame = np.full((48, 64, 3), index * 8, dtype=np.uint8)
+                for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+
+    def test_stride_max_frames_and_resolution(self):
+        # Act
+        frames, fps = media.decode_video_frames(self.path, stride=3, max_frames=4, max_resolution=32)
+
+        # Assert
+        self.assertEqual(tuple(frames.shape), (4, 24, 32, 3))
+        self.assertEqual(fps, 8)
+        brightness = [float(frame.mean()) * 255 for frame in frames]
+        np.testing.assert_allclose(brightness, [0, 24, 48, 72], atol=6)
+
+    def test_all_frames_into_memory_mapped_batch(self):
+        # Act
+        frames, fps = media.decode_video_frames(self.path, memmap_min_bytes=1)
+
+        # Assert
+        self.assertEqual(tuple(frames.shape), (30, 48, 64, 3))
+        self.assertEqual(fps, 24)
+
+
+if __name__ == "__main__":
+    unittest.main()
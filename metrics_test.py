@@ -0,0 +1,63 @@
+import json
+import unittest
+from flowy.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_snapshot_percentiles_per_model(self):
+        # Arrange
+        for value in range(1, 101):
+            self.registry.observe("api_latency_seconds", "flux", value / 10)
+        self.registry.observe("api_latency_seconds", "kling", 42)
+
+        # Act
+        snapshot = self.registry.snapshot()
+
+        # Assert
+        flux = snapshot["histograms"]["api_latency_seconds"]["flux"]
+        self.assertEqual(flux["count"], 100)
+        self.assertEqual(flux["p50"], 5.0)
+        self.assertEqual(flux["p99"], 9.9)
+        self.assertEqual(flux["max"], 10.0)
+        self.assertEqual(snapshot["histograms"]["api_latency_seconds"]["kling"]["p50"], 42)
+        json.dumps(snapshot)
+
+    def test_prometheus_text(self):
+        # Arrange
+        self.registry.observe("download_bytes", "recraft", 1024)
+        self.registry.observe("download_bytes", "recraft", 5000)
+        self.registry.increment("errors_total", "recraft", error="HTTPError")
+        self.registry.increment("errors_total", "recraft", error="HTTPError")
+
+        # Act
+        lines = self.registry.prometheus_text().splitlines()
+
+        # Assert
+        self.assertIn("# TYPE flowy_download_bytes histogram", lines)
+        self.assertIn('flowy_download_bytes_bucket{model_type="recraft",le="1024"} 1', lines)
+        self.assertIn('flowy_download_bytes_bucket{model_type="recraft",le="4096"} 1', lines)
+        self.assertIn('flowy_download_bytes_bucket{model_type="recraft",le="16384"} 2', lines)
+        self.assertIn('flowy_download_bytes_bucket{model_type="recraft",le="+Inf"} 2', lines)
+        self.assertIn('flowy_download_bytes_count{model_type="recraft"} 2', lines)
+        self.assertIn('flowy_errors_total{model_type="recraft",error="HTTPError"} 2', lines)
+
+    def test_timer_records_failures(self):
+        # Act
+        with self.assertRaises(ValueError):
+            with self.registry.timer("decode_seconds", "flux"):
+                raise ValueError("broken image")
+
+        # Assert
+        self.assertEqual(self.registry.snapshot()["histograms"]["decode_seconds"]["flux"]["count"], 1)
+
+    def test_unknown_metric(self):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            self.registry.observe("latency", "flux", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
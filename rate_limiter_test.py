@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from flowy import rate_limiter
+from flowy.rate_limiter import RateLimiter, LimiterTimeout
+
+
+class TestRateLimiter(unittest.TestCase):
+    def run_concurrently(self, limiter, count, work=0.02):
+        order = []
+        lock = threading.Lock()
+        peak = [0]
+
+        def request(index):
+            with limiter.slot():
+                with lock:
+                    order.append((index, time.monotonic()))
+                    peak[0] = max(peak[0], limiter.in_flight)
+                time.sleep(work)
+
+        threads = []
+        for index in range(count):
+            thread = threading.Thread(target=request, args=(index,))
+            thread.start()
+            threads.append(thread)
+            # Make the arrival order deterministic
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join()
+        return order, peak[0]
+
+    def test_max_in_flight_and_fifo_order(self):
+        # Arrange
+        limiter = RateLimiter(max_in_flight=2)
+
+        # Act
+        order, peak = self.run_concurrently(limiter, 8)
+
+        # Assert
+        self.assertEqual(peak, 2)
+        self.assertEqual([index for index, _ in order], list(range(8)))
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_requests_are_spaced_by_the_rate(self):
+        # Arrange
+        limiter = RateLimiter(requests_per_second=50, burst=1)
+
+        # Act
+        order, _ = self.run_concurrently(limiter, 6, work=0)
+
+        # Assert
+        starts = [start for _, start in order]
+        gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+        self.assertGreaterEqual(min(gaps), 0.015)
+        self.assertGreaterEqual(starts[-1] - starts[0], 5 / 50 - 0.01)
+
+    def test_queue_wait_is_bounded(self):
+        # Arrange
+        limiter = RateLimiter(max_in_flight=1, max_queue_wait=0.05)
+        limiter.acquire()
+
+        # Act / Assert
+        with self.assertRaises(LimiterTimeout):
+            limiter.acquire()
+        self.assertEqual(limiter.queued, 0)
+        limiter.release()
+        self.assertGreaterEqual(limiter.acquire(), 0)
+
+    def test_retry_token_does_not_take_a_slot(self):
+        # Arrange
+        limiter = RateLimiter(max_in_flight=1, requests_per_second=20, burst=1, max_queue_wait=1)
+        limiter.acquire()
+
+        # Act
+        start = time.monotonic()
+        limiter.wait_for_token()
+        waited = time.monotonic() - start
+
+        # Assert
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertGreaterEqual(waited, 0.04)
+        limiter.release()
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_retry_of_the_slot_holder_skips_the_queue(self):
+        # Arrange
+        limiter = RateLimiter(max_in_flight=1, max_queue_wait=3)
+        limiter.acquire()
+        queued = []
+        waiter = threading.Thread(target=lambda: queued.append(limiter.acquire()))
+        waiter.start()
+        while limiter.queued == 0:
+            time.sleep(0.005)
+
+        # Act
+        start = time.monotonic()
+        limiter.wait_for_token()
+        waited = time.monotonic() - start
+        limiter.release()
+        waiter.join(1)
+
+        # Assert
+        self.assertLess(waited, 0.1)
+        self.assertEqual(len(queued), 1)
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_limits_scale_with_the_key_pool(self):
+        # Arrange
+        limits = {"max_in_flight": 2, "requests_per_second": 1.5, "burst": None, "max_queue_wait": 1}
+
+        # Act
+        with mock.patch.object(rate_limiter, "limits_for", return_value=limits):
+            single = rate_limiter.get_limiter("scale-test", "host-a")
+            pooled = rate_limiter.get_limiter("scale-test", "host-b", api_keys=3)
+
+        # Assert
+        self.assertEqual((single.max_in_flight, single.requests_per_second), (2, 1.5))
+        self.assertEqual((pooled.max_in_flight, pooled.requests_per_second), (6, 4.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
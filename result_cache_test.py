@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import unittest
+from flowy.result_cache import DiskCache, canonical_hash
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp.name, "results"), max_bytes=300)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_canonical_hash(self):
+        # Arrange
+        image = "data:image/jpeg;base64," + "A" * 1000
+        payload = {"prompt": "a cat", "seed": 1, "image": image, "api_key": "one"}
+
+        # Act / Assert
+        self.assertEqual(
+            canonical_hash("flux", payload),
+            canonical_hash("flux", {"seed": 1, "image": image, "prompt": "a cat", "api_key": "two"}),
+        )
+        self.assertNotEqual(canonical_hash("flux", payload), canonical_hash("flux", {**payload, "seed": 2}))
+        self.assertNotEqual(canonical_hash("flux", payload), canonical_hash("recraft", payload))
+
+    def test_put_and_get(self):
+        # Arrange
+        self.cache.put("a" * 64, {"return_type": "IMAGE"}, [b"first", b"second"])
+
+        # Act
+        meta, files = self.cache.get("a" * 64)
+
+        # Assert
+        self.assertEqual(meta["return_type"], "IMAGE")
+        self.assertEqual([open(path, "rb").read() for path in files], [b"first", b"second"])
+        self.assertIsNone(self.cache.get("b" * 64))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        # Arrange
+        self.cache.put("a" * 64, {}, [b"x" * 100])
+        time.sleep(0.01)
+        self.cache.put("b" * 64, {}, [b"x" * 100])
+        time.sleep(0.01)
+        self.cache.get("a" * 64)
+
+        # Act
+        self.cache.put("c" * 64, {}, [b"x" * 100])
+
+        # Assert
+        self.assertIsNotNone(self.cache.get("a" * 64))
+        self.assertIsNone(self.cache.get("b" * 64))
+        self.assertIsNotNone(self.cache.get("c" * 64))
+        self.assertLessEqual(self.cache.total_bytes(), 300)
+
+    def test_index_is_rebuilt_from_disk(self):
+        # Arrange
+        self.cache.put("a" * 64, {"return_type": "VIDEO"}, [b"video"])
+
+        # Act
+        reopened = DiskCache(self.cache.directory, max_bytes=300)
+
+        # Assert
+        meta, _ = reopened.get("a" * 64)
+        self.assertEqual(meta["return_type"], "VIDEO")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+from unittest import mock
+import requests
+from flowy import retry_policy
+from flowy.retry_policy import RetryPolicy
+from standin_server import StandinServer
+
+API_PATH = "/api/open/v0/flowy"
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.api_url = f"{self.server.url}{API_PATH}"
+        self.policy = RetryPolicy(max_attempts=4, backoff_base=0.5, backoff_max=1, jitter=False)
+        self.sleeps = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def post(self, idempotency_key=None):
+        return retry_policy.send(
+            "POST",
+            self.api_url,
+            policy=self.policy,
+            idempotency_key=idempotency_key,
+            json={"model_type": "flux", "prompt": "a cat"},
+            sleep=self.sleeps.append,
+        )
+
+    def test_backoff_grows_and_is_capped(self):
+        # Arrange
+        self.policy.idempotency_keys = True
+        self.server.state.post_script = [("status", 502, ""), ("status", 500, ""), ("status", 504, "")]
+
+        # Act
+        response = self.post(idempotency_key="key")
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sleeps, [0.5, 1, 1])
+
+    def test_generation_requests_have_a_finite_read_timeout(self):
+        # Arrange
+        overrides = {"retry_policies": {"kling": {"read_timeout": 3600}}}
+
+        # Act
+        with mock.patch.object(retry_policy, "get_setting", side_effect=lambda key, default=None: overrides.get(key, default)):
+            default = retry_policy.get_policy("api", "flux")
+            kling = retry_policy.get_policy("api", "kling")
+
+        # Assert
+        self.assertEqual(default.read_timeout, 30 * 60)
+        self.assertEqual(kling.read_timeout, 3600)
+
+    def test_retry_after_is_honoured(self):
+        # Arrange
+        self.server.state.post_script = [("status", 429, 3), ("status", 503, 0)]
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sleeps, [3, 0])
+
+    def test_lost_answer_is_not_processed_twice(self):
+        # Arrange
+        self.policy.idempotency_keys = True
+        self.server.state.post_script = ["lost", "drop"]
+
+        # Act
+        response = self.post(idempotency_key=retry_policy.new_idempotency_key())
+
+        # Assert
+        self.assertEqual(response.json()["data"]["output"][0][-len("/files/image.png"):], "/files/image.png")
+        self.assertEqual(len(self.server.state.submits), 3)
+        self.assertEqual(len({submit["idempotency_key"] for submit in self.server.state.submits}), 1)
+        self.assertEqual(self.server.state.processed, 1)
+
+    def test_post_without_key_is_not_resent_after_a_lost_answer(self):
+        # Arrange
+        self.server.state.post_script = ["lost"]
+
+        # Act / Assert
+        with self.assertRaises(requests.ConnectionError):
+            self.post()
+        self.assertEqual(len(self.server.state.submits), 1)
+
+    def test_keyed_post_is_not_resent_without_confirmed_idempotency(self):
+        # Arrange
+        self.server.state.post_script = [("status", 500, "")]
+
+        # Act
+        response = self.post(idempotency_key="key")
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.state.submits), 1)
+
+    def test_keyed_post_is_not_resent_after_a_lost_answer_without_confirmed_idempotency(self):
+        # Arrange
+        self.server.state.post_script = ["lost"]
+
+        # Act / Assert
+        with self.assertRaises(requests.ConnectionError):
+            self.post(idempotency_key="key")
+        self.assertEqual(self.server.state.processed, 1)
+
+    def test_refused_connection_is_retried(self):
+        # Arrange
+        self.server.stop()
+
+        # Act / Assert
+        with self.assertRaises(requests.ConnectionError):
+            self.post()
+        self.assertEqual(len(self.sleeps), 3)
+
+    def test_before_retry_is_called_before_each_retry(self):
+        # Arrange
+        self.server.state.post_script = [("status", 429, 0), ("status", 503, 0)]
+        retries = []
+
+        # Act
+        retry_policy.send(
+            "POST",
+            self.api_url,
+            policy=self.policy,
+            json={"model_type": "flux", "prompt": "a cat"},
+            sleep=self.sleeps.append,
+            before_retry=lambda error: retries.append(len(self.server.state.submits)),
+        )
+
+        # Assert
+        self.assertEqual(retries, [1, 2])
+        self.assertEqual(len(self.server.state.submits), 3)
+
+    def test_retried_responses_are_closed(self):
+        # Arrange
+        self.server.state.post_script = [("status", 503, "")] * 10
+        closed = []
+
+        # Act
+        with mock.patch.object(requests.Response, "close", autospec=True, side_effect=closed.append):
+            response = retry_policy.send(
+                "POST",
+                self.api_url,
+                policy=self.policy,
+                idempotency_key="key",
+                json={"model_type": "flux", "prompt": "a cat"},
+                sleep=self.sleeps.append,
+                stream=True,
+            )
+
+        # Assert
+        self.assertEqual(len(closed), 3)
+        self.assertNotIn(response, closed)
+        self.assertEqual(response.status_code, 503)
+        response.close()
+
+    def test_attempts_are_bounded(self):
+        # Arrange
+        self.server.state.post_script = [("status", 503, "")] * 10
+
+        # Act
+        response = self.post(idempotency_key="key")
+
+        # Assert
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.state.submits), 4)
+
+    def test_long_retry_after_fails_fast(self):
+        # Arrange
+        self.policy.retry_after_max = 10
+        self.server.state.post_script = [("status", 429, 3600)]
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.sleeps, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+from flowy.single_flight import SharedCallError, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.group = SingleFlight("test")
+        self.calls = 0
+
+    def call_concurrently(self, key, func, count=5):
+        results = [None] * count
+        errors = [None] * count
+
+        def caller(index):
+            try:
+                results[index] = self.group.do(key, func)
+            except Exception as e:
+                errors[index] = e
+
+        threads = [threading.Thread(target=caller, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def slow_call(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return {"success": True, "data": {"output": ["image.png"]}}
+
+    def test_identical_calls_in_flight_are_merged(self):
+        # Act
+        results, errors = self.call_concurrently("same", self.slow_call)
+
+        # Assert
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(errors, [None] * 5)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertTrue(all(result is results[0][0] for result, _ in results))
+        self.assertEqual(self.group.in_flight(), 0)
+
+    def test_errors_are_shared(self):
+        # Arrange
+        def failing_call():
+            self.calls += 1
+            time.sleep(0.1)
+            raise ValueError("API request failed")
+
+        # Act
+        results, errors = self.call_concurrently("same", failing_call, count=3)
+
+        # Assert
+        self.assertEqual(self.calls, 1)
+        leader_errors = [error for error in errors if isinstance(error, ValueError)]
+        follower_errors = [error for error in errors if isinstance(error, SharedCallError)]
+        self.assertEqual(len(leader_errors), 1)
+        self.assertEqual(len(follower_errors), 2)
+        self.assertIsNot(follower_errors[0], follower_errors[1])
+        self.assertTrue(all(error.__cause__ is leader_errors[0] for error in follower_errors))
+
+    def test_finished_calls_are_not_reused(self):
+        # Act
+        self.group.do("same", self.slow_call)
+        _, shared = self.group.do("same", self.slow_call)
+
+        # Assert
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(shared)
+
+
+if __name__ == "__main__":
+    unittest.main()
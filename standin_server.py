@@ -0,0 +1,406 @@
+"""
+A local stand-in for the Comflowy API, used by the tests to run nodes offline.
+
+It answers generation requests (/api/open/v0/flowy, /api/open/v0/clarityupscaler, ...)
+with URLs of fixture images, videos and audios it serves itself, answers LLM requests
+on /api/open/v0/prompt with a fixture Omost canvas, and supports the job mode (submit + poll) with a scriptable sequence of poll answers.
+POSTs carrying an Idempotency-Key are processed once, repeats get the first answer.
+Request bodies are accepted as JSON, gzip-compressed JSON or multipart with binary media parts.
+"""
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import soundfile as sf
+from PIL import Image
+
+API_PREFIX = "/api/open/v0/"
+
+VIDEO_MODELS = ("kling", "luma", "hailuo")
+
+LLM_PATH = API_PREFIX + "prompt"
+
+# A canvas in the format the Omost LLM node expects, also a valid answer for the plain LLM node
+OMOST_CANVAS = {
+    "global_description": {
+        "description": "A cat sitting on a windowsill at sunset.",
+        "detailed_descriptions": ["Warm light fills the room.", "The window frame is wooden."],
+        "tags": "cat, window, sunset",
+        "HTML_web_color_name": "orange",
+    },
+    "local_descriptions": [
+        {
+            "location": "in the center",
+            "offset": "no offset",
+            "area": "a medium-sized square area",
+            "distance_to_viewer": 2.0,
+            "description": "A ginger cat.",
+            "detailed_descriptions": ["The cat looks outside."],
+            "tags": "cat, ginger",
+            "atmosphere": "calm",
+            "style": "photograph",
+            "quality_meta": "high quality",
+            "HTML_web_color_name": "darkorange",
+        }
+    ],
+}
+
+
+def make_png(width=64, height=64, color=(200, 80, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_wav(seconds=1.0, sample_rate=44100):
+    buffer = io.BytesIO()
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    sf.write(buffer, 0.1 * np.sin(2 * np.pi * 440 * t), sample_rate, format="WAV")
+    return buffer.getvalue()
+
+
+def make_mp4(frames=48, width=320, height=240, rate=24):
+    """A decodable MP4 when PyAV is installed, otherwise a placeholder that only looks like one."""
+    try:
+        import av
+    except ImportError:
+        return b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 4096
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="mp4") as container:
+        stream = container.add_stream("mpeg4", rate=rate)
+        stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+        for index in range(frames):
+            pixels = np.full((height, width, 3), index * 255 // frames, dtype=np.uint8)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def _resolve_attachments(value, attachments):
+    if isinstance(value, str):
+        return attachments.get(value, value)
+    if isinstance(value, dict):
+        return {key: _resolve_attachments(item, attachments) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_attachments(item, attachments) for item in value]
+    return value
+
+
+class StandinState:
+    """Shared state of the stand-in server, inspected and configured by the tests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {
+            "image.png": ("image/png", make_png()),
+            "video.mp4": ("video/mp4", make_mp4()),
+            "audio.wav": ("audio/wav", make_wav()),
+        }
+        # Answers of the next file downloads, one entry per download: "truncate" (announce the
+        # full Content-Length, send half the body, then close) or "no_length" (no Content-Length,
+        # the body ends when the connection closes)
+        self.file_script = []
+        # Outputs by model type, or by replicate_model for the Replicate nodes. Paths starting
+        # with "/" are served by the stand-in, other values are returned as is (text outputs).
+        self.outputs = {}
+        # Text answered on the LLM endpoint
+        self.llm_text = json.dumps(OMOST_CANVAS)
+        # Answers by prompt or by model, overriding llm_text. ("error", message) answers with a failure.
+        self.llm_answers = {}
+        # Seconds the LLM endpoint waits before answering, by prompt or by model
+        self.llm_delays = {}
+        # Delays of the next LLM requests, one entry per request, used before llm_delays
+        self.llm_delay_script = []
+        # Whether LLM requests with "stream": true are answered with server-sent events,
+        # the text is sent in pieces of llm_stream_chunk characters, llm_stream_delay seconds apart
+        self.llm_stream = True
+        self.llm_stream_chunk = 16
+        self.llm_stream_delay = 0.0
+        # Whether submits with "async": true are answered with a job id
+        self.async_jobs = True
+        # Answers of the next polls, one entry per poll:
+        # "pending", "drop" (close the connection), ("status", code, retry_after) or "fail".
+        # Once empty, polls answer with the job output.
+        self.poll_script = []
+        # Answers of the next POSTs, one entry per request, applied before the normal answer:
+        # "drop" (close the connection unprocessed), ("status", code, retry_after) or
+        # "lost" (process the request, then close the connection without answering).
+        self.post_script = []
+        # Answers by Idempotency-Key, a repeated key gets the first answer again
+        self.idempotent_answers = {}
+        # Upload modes accepted on POST, other bodies are rejected with 415
+        self.accept_uploads = {"multipart", "gzip", "json"}
+        self.rejected_uploads = []
+        # Number of requests actually processed (what the API would charge for)
+        self.processed = 0
+        self.submits = []
+        self.polls = 0
+        self.jobs = {}
+
+    def output_for(self, model_type, payload=None):
+        key = (payload or {}).get("replicate_model") or model_type
+        if key in self.outputs:
+            return list(self.outputs[key])
+        if model_type in VIDEO_MODELS:
+            return ["/files/video.mp4"]
+        return ["/files/image.png"]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without this every answer waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> StandinState:
+        return self.server.state
+
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_bytes(self, content_type, data):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_broken_bytes(self, action, content_type, data):
+        """Answer a download as file_script describes, then close the connection."""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if action == "truncate":
+            self.send_header("Content-Length", str(len(data)))
+            data = data[: len(data) // 2]
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def read_payload(self):
+        """Return (payload, upload mode, body size), media parts of multipart bodies become data URIs."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=policy.HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            parts = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            attachments = {
+                "attachment://" + name: f"data:{part.get_content_type()};base64,"
+                + base64.b64encode(part.get_payload(decode=True)).decode()
+                for name, part in parts.items()
+                if name != "payload"
+            }
+            payload = json.loads(parts["payload"].get_payload(decode=True))
+            return _resolve_attachments(payload, attachments), "multipart", length
+        if self.headers.get("Content-Encoding") == "gzip":
+            return json.loads(gzip.decompress(body)), "gzip", length
+        return json.loads(body or b"{}"), "json", length
+
+    def output_urls(self, model_type, payload=None):
+        return [
+            self.base_url() + output if output.startswith("/") else output
+            for output in self.state.output_for(model_type, payload)
+        ]
+
+    def do_GET(self):
+        if self.path.startswith("/files/"):
+            name = self.path[len("/files/"):]
+            if name not in self.state.files:
+                return self.send_json(404, {"success": False, "error": "not found"})
+            with self.state.lock:
+                action = self.state.file_script.pop(0) if self.state.file_script else None
+            if action is None:
+                return self.send_bytes(*self.state.files[name])
+            return self.send_broken_bytes(action, *self.state.files[name])
+
+        if self.path.startswith(API_PREFIX) and "/jobs/" in self.path:
+            return self.poll_job(self.path.rsplit("/", 1)[-1])
+
+        self.send_json(404, {"success": False, "error": "not found"})
+
+    def do_POST(self):
+        if not self.path.startswith(API_PREFIX):
+            return self.send_json(404, {"success": False, "error": "not found"})
+
+        payload, mode, size = self.read_payload()
+        if mode not in self.state.accept_uploads:
+            with self.state.lock:
+                self.state.rejected_uploads.append(mode)
+            return self.send_json(415, {"success": False, "error": f"{mode} bodies are not supported"})
+        key = self.headers.get("Idempotency-Key")
+        with self.state.lock:
+            self.state.submits.append(
+                {
+                    "path": self.path,
+                    "payload": payload,
+                    "idempotency_key": key,
+                    "authorization": self.headers.get("Authorization"),
+                    "upload": mode,
+                    "bytes": size,
+                }
+            )
+            action = self.state.post_script.pop(0) if self.state.post_script else None
+            answer = self.state.idempotent_answers.get(key) if key else None
+
+        if action == "drop":
+            return self.drop_connection()
+        if isinstance(action, tuple):
+            _, code, retry_after = action
+            return self.send_json(code, {"success": False}, {"Retry-After": str(retry_after)})
+
+        if answer is None:
+            answer = self.process(payload)
+            if key:
+                with self.state.lock:
+                    answer = self.state.idempotent_answers.setdefault(key, answer)
+
+        if action == "lost":
+            return self.drop_connection()
+        if self.path == LLM_PATH and payload.get("stream") and self.state.llm_stream and answer.get("success"):
+            return self.send_events(answer["text"])
+        self.send_json(200, answer)
+
+    def send_events(self, text):
+        """Answer with the text as server-sent events, one HTTP chunk per event"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = max(1, self.state.llm_stream_chunk)
+        events = [{"text": text[i:i + size]} for i in range(0, len(text), size)]
+        for data in [json.dumps(event) for event in events] + ["[DONE]"]:
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+            if self.state.llm_stream_delay:
+                time.sleep(self.state.llm_stream_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def drop_connection(self):
+        self.close_connection = True
+        self.connection.close()
+
+    def process(self, payload):
+        with self.state.lock:
+            self.state.processed += 1
+        if self.path == LLM_PATH:
+            return self.llm_answer(payload)
+        model_type = payload.get("model_type", self.path[len(API_PREFIX):])
+        if payload.get("async") and self.state.async_jobs:
+            job_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.jobs[job_id] = (model_type, payload)
+            return {"success": True, "data": {"job_id": job_id}}
+        return {"success": True, "data": {"output": self.output_urls(model_type, payload)}}
+
+    def llm_answer(self, payload):
+        prompt, model = payload.get("prompt"), payload.get("model")
+        with self.state.lock:
+            scripted = self.state.llm_delay_script.pop(0) if self.state.llm_delay_script else None
+        delay = scripted if scripted is not None else self.state.llm_delays.get(prompt, self.state.llm_delays.get(model))
+        if delay:
+            time.sleep(delay)
+        answer = self.state.llm_answers.get(prompt, self.state.llm_answers.get(model, self.state.llm_text))
+        if isinstance(answer, tuple):
+            return {"success": False, "error": answer[1]}
+        return {"success": True, "text": answer}
+
+    def poll_job(self, job_id):
+        with self.state.lock:
+            self.state.polls += 1
+            job = self.state.jobs.get(job_id)
+            action = self.state.poll_script.pop(0) if self.state.poll_script else None
+
+        if job is None:
+            return self.send_json(404, {"success": False, "error": "unknown job"})
+        if action == "drop":
+            return self.drop_connection()
+        if action == "pending":
+            return self.send_json(200, {"success": True, "data": {"status": "running"}})
+        if action == "fail":
+            return self.send_json(200, {"success": True, "data": {"status": "failed", "error": "boom"}})
+        if isinstance(action, tuple):
+            _, code, retry_after = action
+            return self.send_json(code, {"success": False}, {"Retry-After": str(retry_after)})
+
+        self.send_json(
+            200,
+            {"success": True, "data": {"status": "succeeded", "output": self.output_urls(*job)}},
+        )
+
+
+class StandinServer:
+    """
+    Run the stand-in API on a free local port in a background thread.
+
+    Usage:
+        with StandinServer() as server:
+            requests.post(f"{server.url}/api/open/v0/flowy", json={...})
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.state = StandinState()
+        self.httpd = ThreadingHTTPServer((host, port), StandinHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the local stand-in Comflowy API")
+    parser.add_argument("--port", type=int, default=3000)
+    args = parser.parse_args()
+
+    server = StandinServer(port=args.port)
+    print(f"Stand-in Comflowy API listening on {server.url}")
+    server.httpd.serve_forever()
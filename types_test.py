@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from flowy import types
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, "custom_node_api_config.json")
+        self.write({"domain": "http://first"})
+        self.patches = [
+            mock.patch.object(types, "CONFIG_PATH", self.path),
+            mock.patch.object(types, "CONFIG_STAT_INTERVAL", 0),
+        ]
+        for patch in self.patches:
+            patch.start()
+        types.clear_config_cache()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        types.clear_config_cache()
+
+    def write(self, config, mtime=None):
+        with open(self.path, "w") as f:
+            json.dump(config, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_file_is_parsed_once_until_it_changes(self):
+        # Arrange
+        with mock.patch.object(types.json, "load", wraps=json.load) as load:
+            # Act
+            hosts = [types.get_api_host() for _ in range(100)]
+            self.write({"domain": "http://second"}, mtime=os.stat(self.path).st_mtime + 10)
+            changed = types.get_api_host()
+
+        # Assert
+        self.assertEqual(hosts, ["http://first"] * 100)
+        self.assertEqual(changed, "http://second")
+        self.assertEqual(load.call_count, 2)
+
+    def test_stat_is_throttled(self):
+        # Arrange
+        types.get_api_host()
+        self.write({"domain": "http://second"}, mtime=os.stat(self.path).st_mtime + 10)
+
+        # Act
+        with mock.patch.object(types, "CONFIG_STAT_INTERVAL", 60):
+            host = types.get_api_host()
+
+        # Assert
+        self.assertEqual(host, "http://first")
+
+    def test_missing_file_falls_back_to_defaults(self):
+        # Arrange
+        os.remove(self.path)
+
+        # Act / Assert
+        self.assertEqual(types.get_api_host(), types.API_HOST)
+        self.assertEqual(types.get_setting("upload_mode", "auto"), "auto")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+from flowy import uploads
+from flowy.media import EncodedMedia
+from flowy.retry_policy import RetryPolicy
+from standin_server import StandinServer
+
+API_PATH = "/api/open/v0/flowy"
+
+
+class TestUploads(unittest.TestCase):
+    def setUp(self):
+        uploads.reset_negotiation()
+        self.server = StandinServer().start()
+        self.api_url = f"{self.server.url}{API_PATH}"
+        self.policy = RetryPolicy(max_attempts=1)
+        # Stands in for a small encoded JPEG
+        self.image = EncodedMedia(bytes(range(256)) * 256, "image/jpeg")
+        self.payload = {"model_type": "flux", "prompt": "a cat", "images": [self.image, self.image]}
+
+    def tearDown(self):
+        self.server.stop()
+        uploads.reset_negotiation()
+
+    def post(self, upload_mode="auto"):
+        settings = {"upload_mode": upload_mode}
+        with mock.patch.object(uploads, "get_setting", lambda key, default=None: settings.get(key, default)):
+            return uploads.post_payload(
+                self.api_url, self.payload, {"Authorization": "Bearer key"}, policy=self.policy
+            )
+
+    def test_json_is_the_default(self):
+        # Act
+        response = uploads.post_payload(self.api_url, self.payload, policy=self.policy)
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(uploads.upload_modes(self.api_url, "flux"), ("json",))
+        self.assertEqual([submit["upload"] for submit in self.server.state.submits], ["json"])
+
+    def test_multipart_round_trip_matches_json_payload(self):
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        submit = self.server.state.submits[-1]
+        self.assertEqual(submit["upload"], "multipart")
+        self.assertEqual(submit["payload"]["images"], [self.image.data_uri()] * 2)
+        self.assertEqual(submit["payload"]["prompt"], "a cat")
+        json_body, _ = uploads.encode_body(self.payload, "json")
+        self.assertLess(submit["bytes"], len(json_body))
+
+    def test_falls_back_on_unsupported_media_type_and_remembers(self):
+        # Arrange
+        self.server.state.accept_uploads = {"json"}
+
+        # Act
+        first = self.post()
+        second = self.post()
+
+        # Assert
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.server.state.rejected_uploads, ["multipart", "gzip"])
+        self.assertEqual([submit["upload"] for submit in self.server.state.submits], ["json", "json"])
+        self.assertEqual(self.server.state.processed, 2)
+
+    def test_bad_request_falls_back_without_retrying(self):
+        # Arrange
+        self.server.state.post_script = [("status", 400, "")]
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([submit["upload"] for submit in self.server.state.submits], ["multipart", "gzip"])
+        self.assertEqual(self.server.state.processed, 1)
+
+    def test_gzip_body_decodes_to_json_payload(self):
+        # Arrange
+        self.server.state.accept_uploads = {"gzip", "json"}
+
+        # Act
+        self.post()
+
+        # Assert
+        submit = self.server.state.submits[-1]
+        self.assertEqual(submit["upload"], "gzip")
+        self.assertEqual(submit["payload"]["images"][0], self.image.data_uri())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from flowy import utils
+from flowy.result_cache import DiskCache
+from standin_server import StandinServer
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp.name, "llm"), max_bytes=1024 * 1024, ttl=60)
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=self.cache),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def request(self, seed=1, **kwargs):
+        return utils.llm_request("a cat", "You are helpful", "gpt-4o-mini", "key", seed=seed, **kwargs)
+
+    def test_repeated_request_is_served_from_cache(self):
+        # Arrange
+        self.server.state.llm_text = "first"
+
+        # Act
+        first = self.request()
+        self.server.state.llm_text = "second"
+        cached = self.request()
+        other_seed = self.request(seed=2)
+
+        # Assert
+        self.assertEqual((first, cached, other_seed), ("first", "first", "second"))
+        self.assertEqual(self.server.state.processed, 2)
+        self.assertEqual(self.server.state.submits[0]["payload"]["seed"], 1)
+
+    def test_bypass_and_rejected_answers_skip_the_cache(self):
+        # Arrange
+        self.server.state.llm_text = "not a canvas"
+
+        # Act
+        self.request(validate=lambda text: False)
+        self.request()
+        self.request(use_cache=False)
+
+        # Assert
+        self.assertEqual(self.server.state.processed, 3)
+
+    def test_expired_answers_are_requested_again(self):
+        # Arrange
+        self.request()
+
+        # Act
+        with mock.patch.object(time, "time", return_value=time.time() + 120):
+            self.request()
+
+        # Assert
+        self.assertEqual(self.server.state.processed, 2)
+
+
+class TestLLMSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.server.state.llm_delays = {"a cat": 0.2}
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=None),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+
+    def request_concurrently(self, api_keys):
+        threads = [
+            threading.Thread(target=utils.llm_request, args=("a cat", "You are helpful", "gpt-4o-mini", api_key))
+            for api_key in api_keys
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_identical_requests_are_sent_once_per_api_key(self):
+        # Act
+        self.request_concurrently(["key-a", "key-a", "key-b"])
+
+        # Assert
+        self.assertEqual(len(self.server.state.submits), 2)
+
+
+class TestLLMStreaming(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.server.state.llm_text = "The quick brown fox jumps over the lazy dog, 狐狸跳过了懒狗。"
+        self.server.state.llm_stream_chunk = 5
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=None),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+
+    def request(self, **kwargs):
+        return utils.llm_request("a fox", "You are helpful", "gpt-4o-mini", "key", seed=1, **kwargs)
+
+    def test_streamed_answer_matches_the_full_answer(self):
+        # Arrange
+        partials = []
+
+        # Act
+        full = self.request()
+        streamed = self.request(on_text=partials.append)
+
+        # Assert
+        self.assertEqual(streamed, full)
+        self.assertEqual(len(partials), -(-len(full) // 5))
+        self.assertEqual(partials[0], "The q")
+        self.assertEqual(partials[-1], full)
+        self.assertTrue(self.server.state.submits[1]["payload"]["stream"])
+
+    def test_pieces_arrive_before_the_answer_is_complete(self):
+        # Arrange
+        self.server.state.llm_stream_delay = 0.05
+        stream = utils.stream_llm_request("a fox", "You are helpful", "gpt-4o-mini", "key")
+
+        # Act
+        start = time.monotonic()
+        first = next(stream)
+        first_after = time.monotonic() - start
+        rest = "".join(stream)
+
+        # Assert
+        self.assertEqual(first + rest, self.server.state.llm_text)
+        self.assertLess(first_after, 0.3)
+
+    def test_json_answer_is_yielded_at_once(self):
+        # Arrange
+        self.server.state.llm_stream = False
+
+        # Act
+        pieces = list(utils.stream_llm_request("a fox", "You are helpful", "gpt-4o-mini", "key"))
+
+        # Assert
+        self.assertEqual(pieces, [self.server.state.llm_text])
+
+    def test_openai_style_events(self):
+        # Arrange
+        lines = [
+            b'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            b"",
+            b'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+            b"",
+            b": keep-alive",
+            b'data: {"choices": [{"delta": {"content": "lo"}}]}',
+            b"",
+            b"data: [DONE]",
+        ]
+
+        # Act
+        events = list(utils._iter_sse_data(lines))
+        text = "".join(utils._event_text(json.loads(data)) for data in events[:-1])
+
+        # Assert
+        self.assertEqual(text, "Hello")
+        self.assertEqual(events[-1], "[DONE]")
+        with self.assertRaises(Exception):
+            utils._event_text({"success": False, "error": "quota"})
+
+
+class TestLLMBatch(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=None),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+
+    def test_prompt_lists(self):
+        # Act / Assert
+        self.assertEqual(utils.parse_prompt_list(" a cat \n\n a dog\n"), ["a cat", "a dog"])
+        self.assertEqual(utils.parse_prompt_list('["a cat", "", {"subject": "dog"}]'), ["a cat", '{"subject": "dog"}'])
+        self.assertEqual(utils.parse_prompt_list("[not json\na dog"), ["[not json", "a dog"])
+
+    def test_prompts_run_concurrently_in_order_and_fail_alone(self):
+        # Arrange
+        prompts = [f"prompt {index}" for index in range(16)]
+        self.server.state.llm_answers = {prompt: prompt.upper() for prompt in prompts}
+        self.server.state.llm_answers["prompt 3"] = ("error", "content filtered")
+        self.server.state.llm_delays = {prompt: 0.2 for prompt in prompts}
+        self.server.state.llm_delays["prompt 0"] = 0.4
+
+        # Act
+        start = time.monotonic()
+        results = utils.llm_batch_request(prompts, "You are helpful", "gpt-4o-mini", "key", seed=10, concurrency=8)
+        elapsed = time.monotonic() - start
+
+        # Assert
+        self.assertEqual([text for text, _ in results[:3]], ["PROMPT 0", "PROMPT 1", "PROMPT 2"])
+        self.assertIsNone(results[3][0])
+        self.assertIn("content filtered", results[3][1])
+        self.assertEqual(sum(error is None for _, error in results), 15)
+        self.assertLess(elapsed, 1.2)
+        seeds = sorted(submit["payload"]["seed"] for submit in self.server.state.submits)
+        self.assertEqual(seeds, list(range(10, 26)))
+
+
+class TestOmostModelRace(unittest.TestCase):
+    def setUp(self):
+        self.server = StandinServer().start()
+        self.canvas = self.server.state.llm_text
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp.name, "llm"), max_bytes=1024 * 1024)
+        self.patches = [
+            mock.patch.object(utils, "get_api_host", return_value=self.server.url),
+            mock.patch.object(utils, "get_llm_cache", return_value=self.cache),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def race(self, models):
+        return utils.race_llm_requests(
+            "a cat", "Compose a canvas", models, "key", validate=utils.is_canvas_json, seed=1
+        )
+
+    def test_canvas_schema(self):
+        # Arrange
+        canvas = json.loads(self.canvas)
+        canvas["local_descriptions"][0]["distance_to_viewer"] = -1
+        missing = json.loads(self.canvas)
+        del missing["global_description"]["tags"]
+
+        # Act / Assert
+        self.assertTrue(utils.is_canvas_json(self.canvas))
+        self.assertTrue(utils.is_canvas_json(f"```json\n{self.canvas}\n```"))
+        self.assertFalse(utils.is_canvas_json(json.dumps(canvas)))
+        self.assertFalse(utils.is_canvas_json(json.dumps(missing)))
+        self.assertFalse(utils.is_canvas_json('{"global_description": {}, "local_descriptions": []}'))
+        self.assertFalse(utils.is_canvas_json("Sure! Here is your canvas"))
+
+    def test_first_valid_canvas_wins(self):
+        # Arrange
+        self.server.state.llm_answers = {"fast-invalid": "Sure! Here is a canvas", "fast-failing": ("error", "busy")}
+        self.server.state.llm_delays = {"slow": 1.5, "medium": 0.2}
+
+        # Act
+        start = time.monotonic()
+        model, text = self.race(["slow", "fast-invalid", "fast-failing", "medium"])
+        elapsed = time.monotonic() - start
+
+        # Assert
+        self.assertEqual((model, text), ("medium", self.canvas))
+        self.assertLess(elapsed, 1)
+
+    def test_cached_canvas_wins_at_once(self):
+        # Arrange
+        self.race(["cached"])
+        self.server.state.llm_delays = {"other": 1.5}
+
+        # Act
+        start = time.monotonic()
+        model, _ = self.race(["other", "cached"])
+
+        # Assert
+        self.assertEqual(model, "cached")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_no_valid_canvas_raises_every_error(self):
+        # Arrange
+        self.server.state.llm_answers = {"a": "not a canvas", "b": ("error", "busy")}
+
+        # Act / Assert
+        with self.assertRaisesRegex(Exception, "a: Invalid answer.*b: .*busy|b: .*busy.*a: Invalid answer"):
+            self.race(["a", "b"])
+        self.assertEqual(self.cache.total_bytes(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()